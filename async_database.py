@@ -0,0 +1,161 @@
+"""
+Асинхронный доступ к базе данных для обработчиков бота (SQLAlchemy asyncio: aiosqlite / asyncpg).
+
+Модели, миграции и синхронный движок остаются в database.py: ими пользуются init_db, планировщик и outbox,
+которые выполняются в отдельных потоках. Обработчики апдейтов работают только через этот модуль,
+поэтому медленный запрос одного пользователя не останавливает цикл событий для остальных чатов.
+"""
+import logging
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from database import (
+    User,
+    CycleRecord,
+    build_cycle_record,
+    reset_user_fields,
+    as_date,
+    CYCLE_STATS_COLUMNS,
+    add_cycle_length,
+    completed_cycle_length,
+    cycle_stats_from_row,
+    cycle_stats_values,
+    previous_cycle_query,
+)
+import config
+
+logger = logging.getLogger(__name__)
+
+# Синхронный драйвер в DATABASE_URL → асинхронный драйвер того же диалекта
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def to_async_database_url(url: str) -> str:
+    """URL базы для асинхронного движка (sqlite:///… → sqlite+aiosqlite:///…, postgresql://… → postgresql+asyncpg://…)."""
+    scheme, sep, rest = url.partition("://")
+    return f"{ASYNC_DRIVERS.get(scheme, scheme)}{sep}{rest}"
+
+
+async_engine = create_async_engine(to_async_database_url(config.DATABASE_URL), echo=False)
+# Объекты остаются доступны после commit: обработчики читают поля пользователя уже после сохранения
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
+
+
+async def get_user(session: AsyncSession, user_id: int):
+    """Пользователь по Telegram ID или None."""
+    return await session.get(User, user_id)
+
+
+async def get_or_create_user(session: AsyncSession, tg_user) -> User:
+    """Пользователь по данным Telegram (effective_user); новый создаётся и сохраняется."""
+    user = await session.get(User, tg_user.id)
+    if user is None:
+        user = User(
+            id=tg_user.id,
+            username=tg_user.username,
+            first_name=tg_user.first_name,
+            last_name=tg_user.last_name,
+        )
+        session.add(user)
+        await session.commit()
+    return user
+
+
+async def save_cycle_record(user_id: int, cycle_start_date, cycle_data: dict):
+    """
+    Сохранить рассчитанный цикл в историю (новая запись, без перезаписи).
+    cycle_data — результат calculate_menstrual_cycle (cycle_info + phases).
+    """
+    async with AsyncSessionLocal() as session:
+        try:
+            record = build_cycle_record(user_id, cycle_start_date, cycle_data)
+            session.add(record)
+            await session.flush()
+            previous = (await session.execute(previous_cycle_query(user_id, record.cycle_start_date))).first()
+            if previous is not None:
+                # Начало нового цикла завершает предыдущий
+                await record_completed_cycle(session, user_id, previous.cycle_start_date, completed_cycle_length(
+                    previous.cycle_start_date, previous.cycle_actual_end_date, record.cycle_start_date
+                ))
+            await session.commit()
+            logger.info(f"Сохранён цикл для user_id={user_id}, start={record.cycle_start_date}")
+        except Exception as e:
+            logger.error(f"Ошибка сохранения цикла: {e}")
+            await session.rollback()
+
+
+async def get_last_cycle_record(user_id: int):
+    """Получить последнюю запись цикла пользователя (по дате начала)."""
+    records = await get_last_n_cycle_records(user_id, n=1)
+    return records[0] if records else None
+
+
+async def get_last_n_cycle_records(user_id: int, n: int = 4):
+    """Последние n записей циклов пользователя (по убыванию даты начала)."""
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(CycleRecord).where(CycleRecord.user_id == user_id)
+            .order_by(CycleRecord.cycle_start_date.desc()).limit(n)
+        )
+        return list(result.scalars())
+
+
+async def record_completed_cycle(session: AsyncSession, user_id: int, cycle_start, length):
+    """Учесть завершённый цикл в статистике пользователя в транзакции вызывающего кода (см. database.record_completed_cycle)."""
+    row = (await session.execute(select(*CYCLE_STATS_COLUMNS).where(User.id == user_id))).first()
+    if row is None:
+        return None
+    stats = add_cycle_length(cycle_stats_from_row(row), cycle_start, length)
+    await session.execute(update(User).where(User.id == user_id).values(**cycle_stats_values(stats)))
+    return stats
+
+
+async def update_cycle_record_actual_end(user_id: int, cycle_actual_end_date) -> bool:
+    """
+    Обновить фактическую дату окончания у последнего цикла пользователя.
+    Используется при «Цикл закончился раньше».
+    """
+    async with AsyncSessionLocal() as session:
+        try:
+            record = (await session.execute(
+                select(CycleRecord).where(CycleRecord.user_id == user_id)
+                .order_by(CycleRecord.cycle_start_date.desc()).limit(1)
+            )).scalar_one_or_none()
+            if not record:
+                return False
+            record.cycle_actual_end_date = as_date(cycle_actual_end_date)
+            await session.flush()
+            await record_completed_cycle(session, user_id, record.cycle_start_date, completed_cycle_length(
+                record.cycle_start_date, record.cycle_actual_end_date
+            ))
+            await session.commit()
+            logger.info(f"Обновлена дата окончания цикла user_id={user_id}, record_id={record.id}, end={record.cycle_actual_end_date}")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка обновления даты окончания цикла: {e}")
+            await session.rollback()
+            return False
+
+
+async def reset_user_and_cycle_data(session: AsyncSession, user_id: int) -> bool:
+    """
+    Удалить все записи циклов пользователя и сбросить данные профиля (для «Заполнить данные заново»).
+    Использует переданную сессию и выполняет commit.
+    """
+    try:
+        await session.execute(delete(CycleRecord).where(CycleRecord.user_id == user_id))
+        user = await session.get(User, user_id)
+        if not user:
+            return False
+        reset_user_fields(user)
+        await session.commit()
+        logger.info(f"Данные пользователя и циклов сброшены для user_id={user_id}")
+        return True
+    except Exception as e:
+        logger.error(f"Ошибка сброса данных пользователя: {e}")
+        await session.rollback()
+        return False
@@ -0,0 +1,125 @@
+"""
+Замер: пропускная способность обработчика кнопок (button_handler) на статических экранах.
+
+Создаёт временную SQLite-базу с N пользователями и прогоняет через bot.button_handler поддельные нажатия
+(главное меню, справочник фаз и терминов, выбор обновления даты, профиль): нажатий в секунду и задержка
+одного нажатия по видам. Отдельно сравнивает сборку клавиатуры справочника на каждый вызов (как раньше
+в обработчиках) с готовым экраном из screens.py.
+
+Запуск:
+    python benchmarks/callback_throughput.py --users 2000 --callbacks 20000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_db_dir = tempfile.mkdtemp(prefix="bench_callbacks_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+
+import logging  # noqa: E402
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup  # noqa: E402
+import bot  # noqa: E402
+import database  # noqa: E402
+import screens  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+
+CALLBACKS = (
+    "back_to_main", "cycle_info", "phase_info_menstrual", "phase_subphase_luteal_mid", "phase_info_ovulation",
+    "terms_list", "term_info_pms", "update_cycle_choice", "profile",
+)
+
+
+def seed(users: int):
+    database.init_db()
+    session = database.SessionLocal()
+    try:
+        for i in range(1, users + 1):
+            session.add(database.User(
+                id=i, name="Тест", girlfriend_name="Тест", cycle_length=28, period_length=5,
+                last_period_start=date.today() - timedelta(days=i % 40), cycle_extended_days=0,
+                notification_time="09:00", timezone=0, notifications_enabled=True, days_with_notifications=0,
+            ))
+        session.commit()
+    finally:
+        session.close()
+
+
+async def _noop(*args, **kwargs):
+    return SimpleNamespace(message_id=1)
+
+
+def fake_callback_update(user_id: int, data: str):
+    query = SimpleNamespace(
+        data=data, from_user=SimpleNamespace(id=user_id), answer=_noop,
+        edit_message_text=_noop, message=SimpleNamespace(reply_text=_noop),
+    )
+    return SimpleNamespace(callback_query=query, effective_user=query.from_user)
+
+
+async def measure(users: int, callbacks: int) -> tuple:
+    """Нажатия подряд (по кругу по пользователям и видам); вернуть общее время и задержки (мс) по видам."""
+    latencies = defaultdict(list)
+    started = time.perf_counter()
+    for i in range(callbacks):
+        data = CALLBACKS[i % len(CALLBACKS)]
+        one_started = time.perf_counter()
+        await bot.button_handler(fake_callback_update(i % users + 1, data), None)
+        latencies[data].append((time.perf_counter() - one_started) * 1000)
+    return time.perf_counter() - started, latencies
+
+
+def cycle_info_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура справочника фаз, собираемая на каждый вызов (прежний способ)."""
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("🩸 Менструальная фаза", callback_data="phase_info_menstrual")],
+        [InlineKeyboardButton("🌱 Фолликулярная фаза", callback_data="phase_info_follicular")],
+        [InlineKeyboardButton("💫 Овуляция", callback_data="phase_info_ovulation")],
+        [InlineKeyboardButton("🌙 Лютеиновая фаза (ПМС)", callback_data="phase_info_luteal")],
+        [InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")],
+    ])
+
+
+def keyboard_build_time(repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        cycle_info_keyboard()
+    build_us = (time.perf_counter() - started) * 1e6 / repeat
+    started = time.perf_counter()
+    for _ in range(repeat):
+        screens.CYCLE_INFO.reply_markup
+    ready_us = (time.perf_counter() - started) * 1e6 / repeat
+    same = cycle_info_keyboard().to_dict() == screens.CYCLE_INFO.reply_markup.to_dict()
+    print(f"Клавиатура справочника: сборка {build_us:.2f} мкс, готовая {ready_us:.3f} мкс "
+          f"(совпадает: {'да' if same else 'нет'})")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--callbacks", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(f"Подготовка базы: {args.users} пользователей ({os.environ['DATABASE_URL']})")
+    seed(args.users)
+    await measure(args.users, len(CALLBACKS))  # прогрев: соединения, кэши справочника
+
+    elapsed, latencies = await measure(args.users, args.callbacks)
+    print(f"Нажатий: {args.callbacks} за {elapsed:.2f} с — {args.callbacks / elapsed:.0f} в секунду")
+    for data in CALLBACKS:
+        values = latencies[data]
+        print(f"  {data:<28} p50 {statistics.median(values):6.3f} мс  max {max(values):7.3f} мс")
+    keyboard_build_time(args.callbacks)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
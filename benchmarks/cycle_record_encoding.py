@@ -0,0 +1,112 @@
+"""
+Замер: размер записей истории циклов и время их чтения — JSON в cycle_data против упакованных смещений.
+
+Создаёт временную SQLite-базу с историей циклов в старом формате (JSON), измеряет размер и чтение
+последних циклов пользователей, затем переписывает записи миграцией (пачками) и повторяет замеры.
+
+Запуск:
+    python benchmarks/cycle_record_encoding.py --users 5000 --cycles 12 --reads 5000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_db_dir = tempfile.mkdtemp(prefix="bench_cycles_")
+_db_path = os.path.join(_db_dir, "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_db_path}"
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+
+import logging  # noqa: E402
+from sqlalchemy import text  # noqa: E402
+import database  # noqa: E402
+import migrations  # noqa: E402
+from cycle_calculator import calculate_menstrual_cycle  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def seed(users: int, cycles: int):
+    """История в старом формате: полный результат calculate_menstrual_cycle в JSON."""
+    database.init_db()
+    session = database.SessionLocal()
+    try:
+        for user_id in range(1, users + 1):
+            session.add(database.User(id=user_id))
+            start = date(2024, 1, 1) + timedelta(days=user_id % 30)
+            for _ in range(cycles):
+                cycle_length = random.randint(24, 32)
+                cycle_data = calculate_menstrual_cycle(cycle_length, random.randint(3, 7), start)
+                cycle_data.pop("boundaries")  # в старом формате индекса границ не было
+                session.add(database.CycleRecord(
+                    user_id=user_id, cycle_start_date=start,
+                    cycle_data=json.dumps(cycle_data, ensure_ascii=False),
+                ))
+                start += timedelta(days=cycle_length)
+            if user_id % 1000 == 0:
+                session.commit()
+        session.commit()
+    finally:
+        session.close()
+
+
+def storage_stats() -> tuple:
+    """(байт данных цикла на запись, размер файла базы после VACUUM)."""
+    with database.engine.connect() as conn:
+        per_row = conn.execute(text(
+            "SELECT AVG(LENGTH(cycle_data) + COALESCE(LENGTH(cycle_offsets), 0)) FROM cycle_records"
+        )).scalar()
+    with database.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM"))
+    return per_row, os.path.getsize(_db_path)
+
+
+def read_time(users: int, reads: int, parse: bool) -> float:
+    """Среднее время (мс) чтения последних 4 циклов пользователя (parse — с разбором cycle_data)."""
+    session = database.SessionLocal()
+    try:
+        started = time.perf_counter()
+        for _ in range(reads):
+            records = session.query(database.CycleRecord).filter(
+                database.CycleRecord.user_id == random.randint(1, users)
+            ).order_by(database.CycleRecord.cycle_start_date.desc()).limit(4).all()
+            if parse:
+                for record in records:
+                    record.get_cycle_data()
+            session.expunge_all()
+        return (time.perf_counter() - started) * 1000 / reads
+    finally:
+        session.close()
+
+
+def report(title: str, users: int, reads: int):
+    per_row, file_size = storage_stats()
+    print(f"{title:<10} данные цикла {per_row:6.0f} Б/запись  файл {file_size / 1024 / 1024:6.1f} МБ  "
+          f"чтение 4 циклов {read_time(users, reads, False):6.3f} мс, с разбором {read_time(users, reads, True):6.3f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--cycles", type=int, default=12, help="циклов в истории каждого пользователя")
+    parser.add_argument("--reads", type=int, default=5000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    print(f"Подготовка базы: {args.users} пользователей × {args.cycles} циклов ({_db_path})")
+    seed(args.users, args.cycles)
+    report("JSON", args.users, args.reads)
+
+    started = time.perf_counter()
+    migrations.m010_cycle_offsets(database.engine)
+    print(f"Миграция записей: {time.perf_counter() - started:.1f} с")
+    report("Смещения", args.users, args.reads)
+
+
+if __name__ == "__main__":
+    main()
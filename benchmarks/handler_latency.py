@@ -0,0 +1,153 @@
+"""
+Нагрузочный тест: задержка обработки апдейтов (p50/p95/p99) при работающем тике планировщика.
+
+Создаёт временную SQLite-базу с N пользователями, у которых отчёт приходится на текущую минуту,
+и с постоянной частотой вызывает обработчики /start и «Мой профиль» с поддельными апдейтами.
+Сначала замер без фоновой нагрузки, затем — пока планировщик раз за разом обрабатывает окно за сутки.
+
+Запуск:
+    python benchmarks/handler_latency.py --users 20000 --rate 200 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_db_dir = tempfile.mkdtemp(prefix="bench_handlers_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+
+import logging  # noqa: E402
+import pytz  # noqa: E402
+import bot  # noqa: E402
+import database  # noqa: E402
+from notification_schedule import refresh_user_schedule  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def seed(users: int):
+    """Пользователи с заполненным циклом; у всех время отчёта — текущая минута."""
+    database.init_db()
+    session = database.SessionLocal()
+    now = datetime.now(pytz.utc)
+    minute = now.hour * 60 + now.minute
+    local_time = now.astimezone(pytz.timezone("Europe/Moscow")).strftime("%H:%M")
+    try:
+        for i in range(1, users + 1):
+            user = database.User(
+                id=i, name="Тест", girlfriend_name="Тест", cycle_length=28, period_length=5,
+                last_period_start=date.today() - timedelta(days=i % 40), cycle_extended_days=0,
+                notification_time=local_time, timezone=0, notification_minute_utc=minute,
+                notifications_enabled=True, notify_phase_start=True, days_with_notifications=0,
+            )
+            refresh_user_schedule(user, date.today(), 28)
+            session.add(user)
+            if i % 5000 == 0:
+                session.commit()
+        session.commit()
+    finally:
+        session.close()
+
+
+async def _noop(*args, **kwargs):
+    return SimpleNamespace(message_id=1)
+
+
+def fake_start_update(user_id: int):
+    tg_user = SimpleNamespace(id=user_id, username=None, first_name="Тест", last_name=None)
+    return SimpleNamespace(effective_user=tg_user, message=SimpleNamespace(reply_text=_noop))
+
+
+def fake_profile_update(user_id: int):
+    query = SimpleNamespace(
+        data="profile", from_user=SimpleNamespace(id=user_id), answer=_noop,
+        edit_message_text=_noop, message=SimpleNamespace(reply_text=_noop),
+    )
+    return SimpleNamespace(callback_query=query, effective_user=query.from_user)
+
+
+async def measure(users: int, rate: float, seconds: float) -> list:
+    """Подать апдейты с частотой rate в течение seconds; вернуть задержки обработки (мс)."""
+    latencies = []
+
+    async def one(i: int):
+        user_id = i % users + 1
+        started = time.perf_counter()
+        if i % 2:
+            await bot.button_handler(fake_profile_update(user_id), None)
+        else:
+            await bot.start(fake_start_update(user_id), None)
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    tasks = []
+    interval = 1.0 / rate
+    deadline = time.perf_counter() + seconds
+    i = 0
+    while time.perf_counter() < deadline:
+        tasks.append(asyncio.create_task(one(i)))
+        i += 1
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+async def scheduler_load(stop: asyncio.Event) -> int:
+    """Тики планировщика подряд: каждый раз позиция сдвигается на сутки назад (обработка окна за сутки)."""
+    context = SimpleNamespace(bot=None, job_queue=SimpleNamespace(run_once=lambda *a, **k: None))
+    ticks = 0
+    while not stop.is_set():
+        session = database.SessionLocal()
+        try:
+            database.set_scheduler_cursor(
+                session, bot.SCHEDULER_CURSOR_KEY, datetime.utcnow().replace(second=0, microsecond=0) - timedelta(days=1)
+            )
+            # Повторные прогоны должны снова находить пользователей, а не только уже отмеченных
+            session.query(database.User).update({database.User.last_notification_date: None})
+            session.query(database.NotificationOutbox).delete()
+            session.commit()
+        finally:
+            session.close()
+        await bot.send_daily_notifications(context)
+        ticks += 1
+    return ticks
+
+
+def report(title: str, latencies: list):
+    latencies = sorted(latencies)
+    q = statistics.quantiles(latencies, n=100)
+    print(
+        f"{title:<28} апдейтов {len(latencies):>6}  p50 {q[49]:7.1f} мс  p95 {q[94]:7.1f} мс  "
+        f"p99 {q[98]:7.1f} мс  max {latencies[-1]:7.1f} мс"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--rate", type=float, default=200, help="апдейтов в секунду")
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"Подготовка базы: {args.users} пользователей ({os.environ['DATABASE_URL']})")
+    seed(args.users)
+
+    report("Без фоновой нагрузки", await measure(args.users, args.rate, args.seconds))
+
+    stop = asyncio.Event()
+    load = asyncio.create_task(scheduler_load(stop))
+    await asyncio.sleep(0.5)
+    latencies = await measure(args.users, args.rate, args.seconds)
+    stop.set()
+    ticks = await load
+    report(f"Во время тиков ({ticks})", latencies)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+"""
+Замер: пакетная классификация дня цикла (classify_cycle_days) — NumPy против поэлементного расчёта.
+
+Генерирует случайных пользователей (начало цикла, длина цикла, менструации, продление, местная дата),
+классифицирует всех векторно и часть выборки — поэлементно (classify_cycle_day), сверяет результаты.
+
+Запуск:
+    python benchmarks/phase_batch.py --users 1000000 --scalar-users 50000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_db_dir = tempfile.mkdtemp(prefix="bench_phases_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+
+import logging  # noqa: E402
+import cycle_calculator  # noqa: E402
+import database  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def generate(users: int) -> tuple:
+    today = date.today().toordinal()
+    starts = [today - random.randint(0, 45) for _ in range(users)]
+    cycle_lengths = [random.randint(21, 35) for _ in range(users)]
+    period_lengths = [random.randint(2, 7) for _ in range(users)]
+    extensions = [random.choice((0, 0, 0, 1, 3)) for _ in range(users)]
+    local_dates = [today + random.choice((-1, 0, 0, 1)) for _ in range(users)]
+    return starts, cycle_lengths, period_lengths, extensions, local_dates
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--scalar-users", type=int, default=50000, help="выборка для поэлементного расчёта")
+    args = parser.parse_args()
+
+    if cycle_calculator.np is None:
+        print("NumPy не установлен: сравнивать не с чем (pip install numpy)")
+        return
+
+    database.init_db()
+    random.seed(1)
+    data = generate(args.users)
+    cycle_calculator.classify_cycle_days(*(column[:10] for column in data))  # построение массивов раскладок
+
+    started = time.perf_counter()
+    batch = cycle_calculator.classify_cycle_days(*data)
+    vector_ms = (time.perf_counter() - started) * 1000
+    print(f"NumPy:        {args.users:>8} пользователей за {vector_ms:8.1f} мс "
+          f"({vector_ms * 1000 / args.users:.3f} мкс/пользователь, из списков Python)")
+    arrays = [cycle_calculator.np.asarray(column) for column in data]
+    started = time.perf_counter()
+    cycle_calculator.classify_cycle_days(*arrays)
+    arrays_ms = (time.perf_counter() - started) * 1000
+    print(f"NumPy:        {args.users:>8} пользователей за {arrays_ms:8.1f} мс (из готовых массивов)")
+
+    sample = min(args.scalar_users, args.users)
+    numpy_module, cycle_calculator.np = cycle_calculator.np, None
+    try:
+        started = time.perf_counter()
+        scalar = cycle_calculator.classify_cycle_days(*(column[:sample] for column in data))
+        scalar_ms = (time.perf_counter() - started) * 1000
+    finally:
+        cycle_calculator.np = numpy_module
+    per_user_us = scalar_ms * 1000 / sample
+    print(f"Поэлементно:  {sample:>8} пользователей за {scalar_ms:8.1f} мс "
+          f"({per_user_us:.3f} мкс/пользователь, на {args.users}: ~{per_user_us * args.users / 1e6:.1f} с)")
+    print(f"Ускорение: ~{per_user_us * args.users / 1000 / vector_ms:.0f}×")
+
+    mismatches = sum(
+        1 for field in scalar
+        for fast, slow in zip(batch[field][:sample].tolist(), scalar[field])
+        if fast != slow
+    )
+    print(f"Расхождений с поэлементным расчётом: {mismatches}")
+
+
+if __name__ == "__main__":
+    main()
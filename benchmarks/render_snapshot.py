@@ -0,0 +1,121 @@
+"""
+Замер: расчёт состояния цикла для профиля и отчётов — отдельные методы CycleCalculator против CycleSnapshot.
+
+Для случайных пользователей считает всё, что выводит профиль/ежедневный отчёт (фаза и подфаза, день цикла,
+даты менструации и овуляций), сначала прежним способом — get_phase_day и четыре метода CycleCalculator,
+каждый из которых заново считает день цикла, — затем одним CycleSnapshot.at; сверяет значения.
+Отдельно замеряет полное построение текстов (generate_daily_notification, show_profile).
+
+Запуск:
+    python benchmarks/render_snapshot.py --users 20000 --repeat 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_db_dir = tempfile.mkdtemp(prefix="bench_snapshot_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+
+import logging  # noqa: E402
+import bot  # noqa: E402
+import database  # noqa: E402
+from cycle_calculator import CycleCalculator, CycleSnapshot, get_phase_day  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+
+
+def generate(users: int) -> list:
+    today = date.today()
+    return [
+        SimpleNamespace(
+            name="Тест", girlfriend_name="Тест", cycle_length=cycle_length, avg_cycle_length=None,
+            period_length=random.randint(2, 7), last_period_start=today - timedelta(days=random.randint(0, 45)),
+            notifications_enabled=True, notification_time="09:00", timezone=0, days_with_notifications=0,
+            cycle_stats_count=None,
+        )
+        for cycle_length in (random.randint(21, 35) for _ in range(users))
+    ]
+
+
+def separate_calls(user, today: date) -> tuple:
+    """Как раньше в show_profile/generate_daily_notification: каждый метод отдельно."""
+    calculator = CycleCalculator(user.last_period_start, user.cycle_length, user.period_length)
+    phase_day = get_phase_day(user.cycle_length, user.period_length, user.last_period_start, today)
+    phase_info = calculator.get_current_phase(today)
+    return (
+        phase_day, phase_info["current_day"], phase_info["phase"], phase_info["days_in_phase"],
+        phase_info["days_left_in_phase"], phase_info["is_pms"], calculator.get_next_period_date(today),
+        calculator.get_last_ovulation_date(today), calculator.get_next_ovulation_date(today),
+    )
+
+
+def snapshot(user, today: date) -> tuple:
+    s = CycleSnapshot.at(user.last_period_start, user.cycle_length, user.period_length, today)
+    return (
+        s.phase_day, s.current_day, s.phase, s.days_in_phase, s.days_left_in_phase, s.is_pms,
+        s.next_period, s.last_ovulation, s.next_ovulation,
+    )
+
+
+def timed(title: str, fn, users: list, repeat: int) -> list:
+    today = date.today()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        results = [fn(user, today) for user in users]
+    per_user_us = (time.perf_counter() - started) * 1e6 / (repeat * len(users))
+    print(f"{title:<28} {per_user_us:8.2f} мкс/пользователь")
+    return results
+
+
+class _Query:
+    async def edit_message_text(self, text, **kwargs):
+        pass
+
+
+def render_time(users: list, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for user in users:
+            bot.generate_daily_notification(user, user.cycle_length)
+    daily_us = (time.perf_counter() - started) * 1e6 / (repeat * len(users))
+
+    async def profiles():
+        query = _Query()
+        for _ in range(repeat):
+            for user in users:
+                await bot.show_profile(query, user)
+
+    started = time.perf_counter()
+    asyncio.run(profiles())
+    profile_us = (time.perf_counter() - started) * 1e6 / (repeat * len(users))
+    print(f"Текст ежедневного отчёта     {daily_us:8.2f} мкс/пользователь")
+    print(f"Текст профиля                {profile_us:8.2f} мкс/пользователь")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    database.init_db()
+    random.seed(1)
+    users = generate(args.users)
+
+    before = timed("Отдельные методы", separate_calls, users, args.repeat)
+    after = timed("CycleSnapshot.at", snapshot, users, args.repeat)
+    mismatches = sum(1 for old, new in zip(before, after) if old != new)
+    print(f"Расхождений: {mismatches}")
+    render_time(users, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
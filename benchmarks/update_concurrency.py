@@ -0,0 +1,157 @@
+"""
+Замер: пропускная способность обработки апдейтов — последовательно, параллельно без порядка
+(SimpleUpdateProcessor) и параллельно с порядком по пользователю (PerUserUpdateProcessor).
+
+Создаёт временную SQLite-базу с N пользователями и кладёт в очередь приложения (bot.build_application)
+по несколько нажатий от каждого: «Объяснение фаз», «Мой профиль», «Ключевые термины», «Назад».
+Вместо Bot API — заглушка с задержкой --api-latency (как сетевой вызов к Telegram), которая записывает ответы.
+Выводит апдейтов в секунду и число пользователей, у которых ответы пришли не в порядке нажатий.
+
+Запуск:
+    python benchmarks/update_concurrency.py --users 200 --concurrency 32 --api-latency 30
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_db_dir = tempfile.mkdtemp(prefix="bench_updates_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+
+import logging  # noqa: E402
+import warnings  # noqa: E402
+from telegram import Update  # noqa: E402
+from telegram.ext import SimpleUpdateProcessor  # noqa: E402
+from telegram.request import BaseRequest  # noqa: E402
+import bot  # noqa: E402
+import config  # noqa: E402
+import database  # noqa: E402
+import screens  # noqa: E402
+from update_processor import PerUserUpdateProcessor  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+warnings.filterwarnings("ignore", module="telegram")
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+CALLBACKS = ("cycle_info", "profile", "terms_list", "back_to_main")
+SCREEN_BY_TEXT = {
+    screens.CYCLE_INFO.text: "cycle_info", screens.TERMS_LIST.text: "terms_list", screens.WELCOME_TEXT: "back_to_main",
+}
+
+
+class FakeBotApi(BaseRequest):
+    """Заглушка Bot API: отвечает с задержкой latency и записывает ответы (editMessageText) по чатам."""
+
+    def __init__(self, latency: float, expected: int):
+        self.latency = latency
+        self.expected = expected
+        self.replies = defaultdict(list)
+        self.count = 0
+        self.done = asyncio.Event()
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        if api_method == "getMe":
+            return 200, json.dumps({"ok": True, "result": BOT_USER}).encode()
+        await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data else {}
+        result = True
+        if api_method == "editMessageText":
+            chat_id = int(params["chat_id"])
+            self.replies[chat_id].append(SCREEN_BY_TEXT.get(params["text"], "profile"))
+            self.count += 1
+            if self.count >= self.expected:
+                self.done.set()
+            result = {"message_id": 1, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}}
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def seed(users: int):
+    database.init_db()
+    session = database.SessionLocal()
+    try:
+        for i in range(1, users + 1):
+            session.add(database.User(
+                id=i, name="Тест", girlfriend_name="Тест", cycle_length=28, period_length=5,
+                last_period_start=date.today() - timedelta(days=i % 40), cycle_extended_days=0,
+                notification_time="09:00", timezone=0, notifications_enabled=True, days_with_notifications=0,
+            ))
+        session.commit()
+    finally:
+        session.close()
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> dict:
+    tg_user = {"id": user_id, "is_bot": False, "first_name": "Тест"}
+    chat = {"id": user_id, "type": "private"}
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": tg_user, "chat_instance": str(user_id), "data": data,
+        "message": {"message_id": 1, "date": int(time.time()), "chat": chat, "from": BOT_USER, "text": "меню"},
+    }}
+
+
+async def run(title: str, concurrency: int, processor_class, users: int, api_latency: float):
+    api = FakeBotApi(api_latency, users * len(CALLBACKS))
+    config.UPDATE_CONCURRENCY = concurrency
+    bot.PerUserUpdateProcessor, original = processor_class, bot.PerUserUpdateProcessor
+    try:
+        application = bot.build_application(request=api)
+    finally:
+        bot.PerUserUpdateProcessor = original
+    application.job_queue.scheduler.remove_all_jobs()  # без тиков планировщика во время замера
+    await application.initialize()
+    await application.start()
+    # Нажатия одного пользователя идут подряд (быстрые нажатия кнопок), затем — следующего пользователя
+    updates = [
+        Update.de_json(callback_update(user_id * len(CALLBACKS) + n, user_id, data), application.bot)
+        for user_id in range(1, users + 1)
+        for n, data in enumerate(CALLBACKS)
+    ]
+    started = time.perf_counter()
+    for update in updates:
+        application.update_queue.put_nowait(update)
+    await api.done.wait()
+    elapsed = time.perf_counter() - started
+    await application.stop()
+    await application.shutdown()
+
+    out_of_order = sum(1 for replies in api.replies.values() if tuple(replies) != CALLBACKS)
+    print(
+        f"{title:<36} {len(updates) / elapsed:8.0f} апдейтов/с  ({elapsed:6.2f} с)  "
+        f"пользователей с нарушенным порядком: {out_of_order}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--api-latency", type=float, default=30, help="задержка вызова Bot API, мс")
+    args = parser.parse_args()
+
+    print(f"Подготовка базы: {args.users} пользователей ({os.environ['DATABASE_URL']})")
+    seed(args.users)
+    latency = args.api_latency / 1000
+    await run("Последовательно", 1, PerUserUpdateProcessor, args.users, latency)
+    await run(f"Параллельно ({args.concurrency}), без порядка", args.concurrency, SimpleUpdateProcessor,
+              args.users, latency)
+    await run(f"Параллельно ({args.concurrency}), порядок по польз.", args.concurrency, PerUserUpdateProcessor,
+              args.users, latency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,195 @@
+"""
+Нагрузочный тест режима webhook: задержка от отправки апдейта до ответа бота (на одной машине).
+
+Поднимает приложение бота (bot.build_application) со встроенным вебхук-сервером на localhost; вместо Bot API —
+заглушка (FakeBotApi), которая отмечает время ответов бота (sendMessage / editMessageText) по чатам.
+Генератор с постоянной частотой отправляет POST с синтетическими апдейтами (/start, «Мой профиль»,
+«Объяснение фаз») от N пользователей с заголовком X-Telegram-Bot-Api-Secret-Token и считает задержку
+до первого ответа в тот же чат. Отдельно проверяет, что запросы с неверным секретом отклоняются.
+
+Нужен python-telegram-bot[webhooks] (tornado).
+
+Запуск:
+    python benchmarks/webhook_load.py --users 2000 --rate 200 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_db_dir = tempfile.mkdtemp(prefix="bench_webhook_")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'bench.db')}"
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+
+import logging  # noqa: E402
+import httpx  # noqa: E402
+from telegram.request import BaseRequest  # noqa: E402
+import bot  # noqa: E402
+import database  # noqa: E402
+
+logging.getLogger().setLevel(logging.WARNING)
+
+SECRET_TOKEN = "bench-secret"
+URL_PATH = "telegram"
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeBotApi(BaseRequest):
+    """Заглушка Bot API: отвечает успехом на любой метод и отмечает время ответов бота в чаты."""
+
+    def __init__(self):
+        self.pending = {}  # chat_id -> Future со временем первого ответа
+        self.calls = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        self.calls += 1
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        if api_method == "getMe":
+            result = BOT_USER
+        elif api_method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            waiter = self.pending.pop(chat_id, None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(time.perf_counter())
+            result = {
+                "message_id": 1, "date": int(time.time()), "text": params.get("text", ""),
+                "chat": {"id": chat_id, "type": "private"},
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def seed(users: int):
+    database.init_db()
+    session = database.SessionLocal()
+    try:
+        for i in range(1, users + 1):
+            session.add(database.User(
+                id=i, name="Тест", girlfriend_name="Тест", cycle_length=28, period_length=5,
+                last_period_start=date.today() - timedelta(days=i % 40), cycle_extended_days=0,
+                notification_time="09:00", timezone=0, notifications_enabled=True, days_with_notifications=0,
+            ))
+        session.commit()
+    finally:
+        session.close()
+
+
+def synthetic_update(update_id: int, user_id: int) -> dict:
+    tg_user = {"id": user_id, "is_bot": False, "first_name": "Тест"}
+    chat = {"id": user_id, "type": "private"}
+    kind = update_id % 3
+    if kind == 0:
+        return {"update_id": update_id, "message": {
+            "message_id": update_id, "date": int(time.time()), "chat": chat, "from": tg_user,
+            "text": "/start", "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        }}
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": tg_user, "chat_instance": str(user_id),
+        "data": "profile" if kind == 1 else "cycle_info",
+        "message": {"message_id": 1, "date": int(time.time()), "chat": chat, "from": BOT_USER, "text": "меню"},
+    }}
+
+
+async def generate_load(client, api: FakeBotApi, url: str, users: int, rate: float, seconds: float) -> tuple:
+    """Апдейты с частотой rate; у пользователя не больше одного апдейта без ответа. Возвращает (задержки мс, без ответа)."""
+    latencies = []
+    lost = 0
+
+    async def one(update_id: int, user_id: int):
+        nonlocal lost
+        waiter = asyncio.get_running_loop().create_future()
+        api.pending[user_id] = waiter
+        started = time.perf_counter()
+        response = await client.post(
+            url, json=synthetic_update(update_id, user_id), headers={"X-Telegram-Bot-Api-Secret-Token": SECRET_TOKEN}
+        )
+        response.raise_for_status()
+        try:
+            replied = await asyncio.wait_for(waiter, timeout=10)
+        except asyncio.TimeoutError:
+            api.pending.pop(user_id, None)
+            lost += 1
+            return
+        latencies.append((replied - started) * 1000)
+
+    tasks = []
+    interval = 1.0 / rate
+    deadline = time.perf_counter() + seconds
+    update_id = 0
+    while time.perf_counter() < deadline:
+        update_id += 1
+        user_id = update_id % users + 1
+        if user_id not in api.pending:
+            tasks.append(asyncio.create_task(one(update_id, user_id)))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+    return latencies, lost
+
+
+async def check_secret(client, url: str) -> int:
+    """Запросы без секрета и с неверным секретом: сколько из них отклонено (HTTP 403)."""
+    update = synthetic_update(0, 1)
+    rejected = 0
+    for headers in ({}, {"X-Telegram-Bot-Api-Secret-Token": "wrong"}):
+        response = await client.post(url, json=update, headers=headers)
+        rejected += response.status_code == 403
+    return rejected
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--rate", type=float, default=200, help="апдейтов в секунду")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"Подготовка базы: {args.users} пользователей ({os.environ['DATABASE_URL']})")
+    seed(args.users)
+
+    api = FakeBotApi()
+    application = bot.build_application(request=api)
+    await application.initialize()
+    await application.updater.start_webhook(
+        listen="127.0.0.1", port=args.port, url_path=URL_PATH, secret_token=SECRET_TOKEN,
+    )
+    await application.start()
+    url = f"http://127.0.0.1:{args.port}/{URL_PATH}"
+    try:
+        async with httpx.AsyncClient(limits=httpx.Limits(max_connections=100)) as client:
+            print(f"Отклонено запросов с неверным секретом: {await check_secret(client, url)} из 2")
+            latencies, lost = await generate_load(client, api, url, args.users, args.rate, args.seconds)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+
+    if not latencies:
+        print(f"Ответов нет (без ответа: {lost})")
+        return
+    latencies.sort()
+    q = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    print(
+        f"Апдейт → ответ: {len(latencies)} апдейтов (без ответа {lost}), {len(latencies) / args.seconds:.0f}/с  "
+        f"p50 {q[49]:.1f} мс  p95 {q[94]:.1f} мс  p99 {q[98]:.1f} мс  max {latencies[-1]:.1f} мс"
+    )
+    print(f"Вызовов Bot API: {api.calls}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,11 +1,11 @@
 """
 Telegram бот для отслеживания менструального цикла
 """
-import json
+import asyncio
 import logging
 import os
 from datetime import date, datetime, timedelta
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup, KeyboardButton
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -17,24 +17,53 @@ from telegram.ext import (
 )
 from database import (
     User,
-    CyclePhase,
     init_db,
     SessionLocal,
+    compute_notification_minute_utc,
+    enqueue_notifications,
+    effective_cycle_length,
+    cycle_regularity,
+    QueryCounter,
+    get_scheduler_cursor,
+    set_scheduler_cursor,
+)
+from async_database import (
+    AsyncSessionLocal,
+    get_user,
+    get_or_create_user,
     save_cycle_record,
     get_last_cycle_record,
     update_cycle_record_actual_end,
-    get_effective_cycle_length,
     reset_user_and_cycle_data,
 )
+from outbox import drain_outbox
+from scheduler_leases import acquire_shards, renew_lease, release_all
+from notification_schedule import (
+    refresh_user_schedule,
+    local_datetime,
+    TickWindow,
+    PHASE_ADVANCE_DAYS,
+)
+from phase_reference import PhaseReference
+from callback_router import CallbackRouter
+from update_processor import PerUserUpdateProcessor
+import screens
+from screens import KEYBOARD_MAIN_MENU, KEYBOARD_RESTART
 from cycle_calculator import (
     CycleCalculator,
+    CycleSnapshot,
     calculate_menstrual_cycle,
-    get_phase_and_stage_for_date,
-    get_phase_subphase_starts_on_date,
+    get_phase_day,
+    get_next_stage_start,
+    get_phase_catalogue,
+    classify_cycle_days,
+    cycle_days_from_batch,
 )
 import config
 import pytz
 import re
+from functools import lru_cache
+from sqlalchemy import and_, or_, select, update
 import locale
 
 # Устанавливаем русскую локаль для дат
@@ -88,15 +117,8 @@ def format_timezone_display(timezone_offset: int) -> str:
     return f"+{timezone_offset}" if timezone_offset >= 0 else str(timezone_offset)
 
 
-# Справочник фаз и подфаз (phase_name на русском, stage для подфаз)
-PHASE_REFERENCE = None
-# Маппинг рассчитанных фаз (англ.) на phase_name в справочнике (рус.)
-PHASE_NAME_TO_REF = {
-    "Menstrual Phase": "Менструальная фаза (общая)",
-    "Follicular Phase": "Фолликулярная фаза (общая информация)",
-    "Ovulation": "Овуляция",
-    "Luteal Phase": "Лютеиновая фаза (общая информация)",
-}
+# Справочник фаз и подфаз (индекс по фазе/подфазе, перечитывается при изменении файла)
+PHASE_REFERENCE = PhaseReference(os.path.join(os.path.dirname(__file__), "data", "phase_reference.json"))
 PHASE_CALLBACK_TO_EN = {
     "menstrual": "Menstrual Phase",
     "follicular": "Follicular Phase",
@@ -105,49 +127,14 @@ PHASE_CALLBACK_TO_EN = {
 }
 
 
-def _load_phase_reference():
-    global PHASE_REFERENCE
-    if PHASE_REFERENCE is not None:
-        return PHASE_REFERENCE
-    path = os.path.join(os.path.dirname(__file__), "data", "phase_reference.json")
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            PHASE_REFERENCE = json.load(f)
-    except Exception as e:
-        logger.warning(f"Не удалось загрузить справочник фаз: {e}")
-        PHASE_REFERENCE = {"phases": []}
-    return PHASE_REFERENCE
-
-
 def get_reference_phase(phase_name_en: str, stage: str = None) -> dict:
     """
     phase_name_en: Menstrual Phase | Follicular Phase | Ovulation | Luteal Phase
     stage: early | mid | late (для подфазы) или None (фаза целиком / Овуляция)
-    Возвращает dict с keys: symptoms, behavior, male_recommendations, (subphase_name для подфазы).
+    Возвращает dict с keys: symptoms, behavior, male_recommendations, их готовые блоки Markdown
+    (symptoms_md, behavior_md, male_recommendations_md), subphase_name для подфазы / phase_name_ru для фазы.
     """
-    ref = _load_phase_reference()
-    ref_name = PHASE_NAME_TO_REF.get(phase_name_en)
-    if not ref_name:
-        return {}
-    for p in ref.get("phases", []):
-        if p.get("phase_name") != ref_name:
-            continue
-        if stage and p.get("subphases"):
-            for sub in p["subphases"]:
-                if sub.get("stage") == stage:
-                    return {
-                        "symptoms": sub.get("symptoms", []),
-                        "behavior": sub.get("behavior", []),
-                        "male_recommendations": sub.get("male_recommendations", []),
-                        "subphase_name": sub.get("subphase_name", ""),
-                    }
-        return {
-            "symptoms": p.get("symptoms", []),
-            "behavior": p.get("behavior", []),
-            "male_recommendations": p.get("male_recommendations", []),
-            "phase_name_ru": p.get("phase_name", ""),
-        }
-    return {}
+    return PHASE_REFERENCE.get(phase_name_en, stage)
 
 
 # Русские названия месяцев
@@ -165,16 +152,6 @@ def format_date_russian(d: date) -> str:
 
 ADMIN_USER_ID = 774988626
 
-# Текст кнопок постоянной клавиатуры (горячие клавиши в интерфейсе)
-KEYBOARD_MAIN_MENU = "🏠 Главное меню"
-KEYBOARD_RESTART = "🔄 Перезапуск"
-
-
-def effective_cycle_length_for_user(user: User) -> int:
-    """Длительность цикла: по среднему из последних 1–3 циклов в БД или user.cycle_length."""
-    return get_effective_cycle_length(user.id, user.cycle_length or 28)
-
-
 def get_user_today(user: User) -> date:
     """Текущая дата в часовом поясе пользователя (для проверки «сегодня» / «в будущем»)."""
     msk_tz = pytz.timezone("Europe/Moscow")
@@ -184,337 +161,183 @@ def get_user_today(user: User) -> date:
     return user_now.date()
 
 
-def get_persistent_reply_keyboard() -> ReplyKeyboardMarkup:
-    """Постоянная клавиатура: Главное меню и Перезапуск (не в сообщении, а в интерфейсе)."""
-    return ReplyKeyboardMarkup(
-        [[KeyboardButton(KEYBOARD_MAIN_MENU), KeyboardButton(KEYBOARD_RESTART)]],
-        resize_keyboard=True,
-        is_persistent=True,
-    )
-
-
 def get_main_menu(user: User) -> InlineKeyboardMarkup:
     """Получить главное меню в зависимости от того, заполнены ли данные"""
     if user.last_period_start is None:
         # Первое использование - только кнопка "Приступить к работе"
-        keyboard = [
-            [InlineKeyboardButton("🚀 Приступить к работе", callback_data="start_data_collection")]
-        ]
-    else:
-        # Порядок: 1. Мой профиль, 2. Настройка уведомлений, 3. Обновить дату цикла, 4. Объяснение фаз, 5. Заполнить заново
-        keyboard = [
-            [InlineKeyboardButton("👤 Мой профиль", callback_data="profile")],
-            [InlineKeyboardButton("🔔 Настройка уведомлений", callback_data="notification_settings")],
-            [InlineKeyboardButton("📆 Обновить дату цикла / цикл закончился раньше", callback_data="update_cycle_choice")],
-            [InlineKeyboardButton("📚 Объяснение фаз цикла", callback_data="cycle_info")],
-            [InlineKeyboardButton("🔄 Заполнить данные заново", callback_data="start_data_collection")],
-        ]
-        if user.id == ADMIN_USER_ID:
-            keyboard.append([
-                InlineKeyboardButton("🧪 Тест: отчёт по текущей фазе", callback_data="admin_test_daily"),
-                InlineKeyboardButton("🧪 Тест: приближение фазы", callback_data="admin_test_phase"),
-            ])
-            keyboard.append([InlineKeyboardButton("🧪 Тест: завершение цикла", callback_data="admin_test_cycle")])
-    return InlineKeyboardMarkup(keyboard)
+        return screens.MAIN_MENU_NEW
+    return screens.MAIN_MENU_ADMIN if user.id == ADMIN_USER_ID else screens.MAIN_MENU_FILLED
+
+
+def get_main_screen(user: User) -> screens.Screen:
+    """Приветствие с главным меню пользователя"""
+    if user.last_period_start is None:
+        return screens.WELCOME_NEW
+    return screens.WELCOME_ADMIN if user.id == ADMIN_USER_ID else screens.WELCOME_FILLED
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик команды /start"""
     user_id = update.effective_user.id
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     
     try:
-        # Проверяем, есть ли пользователь в базе
-        user = session.query(User).filter(User.id == user_id).first()
-        
-        if user is None:
-            # Создаем нового пользователя
-            user = User(
-                id=user_id,
-                username=update.effective_user.username,
-                first_name=update.effective_user.first_name,
-                last_name=update.effective_user.last_name
-            )
-            session.add(user)
-            session.commit()
+        # Проверяем, есть ли пользователь в базе; нового — создаём
+        user = await get_or_create_user(session, update.effective_user)
         
-        # Формируем приветственное сообщение
-        welcome_text = (
-            "👋 Привет! Добро пожаловать в бот для отслеживания менструального цикла.\n\n"
-            "Этот бот создан специально для мужчин, которые хотят лучше понимать и поддерживать "
-            "свою девушку в разные периоды её цикла. 💕\n\n"
-            "Бот поможет вам:\n"
-            "📊 Отслеживать текущую фазу цикла\n"
-            "🔔 Получать отчёты при смене фазы и подфазы\n"
-            "💡 Получать рекомендации, как лучше поддержать партнершу\n"
-            "📚 Изучать информацию о фазах цикла\n\n"
-            "Помните: ваша забота и внимание - это проявление любви и уважения! ❤️"
-        )
-        
-        await update.message.reply_text(
-            welcome_text,
-            reply_markup=get_main_menu(user)
-        )
+        await get_main_screen(user).reply(update.message)
         # Постоянные кнопки в интерфейсе (горячие клавиши), не в теле сообщения
-        await update.message.reply_text(
-            "💡 Кнопки ниже доступны всегда для быстрого доступа.",
-            reply_markup=get_persistent_reply_keyboard()
-        )
+        await screens.PERSISTENT_KEYBOARD_HINT.reply(update.message)
     except Exception as e:
         logger.error(f"Ошибка в start: {e}")
         await update.message.reply_text("Произошла ошибка. Попробуйте позже.")
     finally:
-        session.close()
+        await session.close()
 
 
 async def button_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Обработчик нажатий на кнопки"""
+    """Обработчик нажатий на кнопки: обработчик выбирается по таблице CALLBACK_ROUTER"""
     query = update.callback_query
     await query.answer()
-    
-    user_id = query.from_user.id
-    session = SessionLocal()
-    
     try:
-        user = session.query(User).filter(User.id == user_id).first()
-        
-        if query.data == "start_data_collection":
-            # Если уже есть данные — предупреждение и подтверждение перед удалением
-            if user.last_period_start is not None or user.name:
-                await query.answer()
-                await query.edit_message_text(
-                    "⚠️ **Вы уверены?**\n\n"
-                    "При перезаполнении все данные по предыдущим циклам и вашему профилю будут удалены из базы. "
-                    "Это действие нельзя отменить.\n\n"
-                    "Продолжить?",
-                    reply_markup=InlineKeyboardMarkup([
-                        [InlineKeyboardButton("✅ Да, перезаполнить", callback_data="confirm_refill_data")],
-                        [InlineKeyboardButton("❌ Отмена", callback_data="cancel_refill_data")],
-                    ]),
-                    parse_mode="Markdown"
-                )
-            else:
-                await start_data_collection(query, user, session)
-        elif query.data == "confirm_refill_data":
-            await query.answer()
-            user_id = query.from_user.id
-            reset_user_and_cycle_data(session, user_id)
-            user = session.query(User).filter(User.id == user_id).first()
-            await start_data_collection(query, user, session)
-        elif query.data == "cancel_refill_data":
-            await query.answer()
-            await query.edit_message_text(
-                "👋 Главное меню",
-                reply_markup=get_main_menu(user)
-            )
-        elif query.data == "update_cycle_choice":
-            await query.answer()
-            await query.edit_message_text(
-                "📆 **Обновить дату цикла**\n\n"
-                "Выберите вариант:\n\n"
-                "• **Цикл закончился раньше** — сначала укажете дату окончания текущего цикла, затем дату начала нового.\n\n"
-                "• **Цикл завершился вовремя** — укажете только дату начала нового цикла.",
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton("⏪ Цикл закончился раньше", callback_data="cycle_ended_earlier")],
-                    [InlineKeyboardButton("📆 Обновить дату начала цикла", callback_data="update_cycle_date")],
-                    [InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")],
-                ]),
-                parse_mode="Markdown"
-            )
-        elif query.data == "fill_later":
-            # Обработка кнопки "Заполнить позже" - не через ConversationHandler
-            await query.answer()
-            await query.edit_message_text(
-                "✅ Отлично, возвращайтесь скорее! 💕\n\n"
-                "Когда будете готовы, просто нажмите кнопку '🔄 Заполнить данные заново' в главном меню.",
-                reply_markup=get_main_menu(user)
-            )
-        elif query.data == "cycle_info":
-            await show_cycle_info(query)
-        elif query.data == "notification_settings":
-            await notification_settings(query, user, session)
-        elif query.data == "profile":
-            await show_profile(query, user)
-        elif query.data == "toggle_daily":
-            await toggle_daily_notifications(query, user, session)
-        elif query.data == "toggle_phase_start":
-            await toggle_phase_start_notifications(query, user, session)
-        elif query.data == "back_to_main":
-            await query.edit_message_text(
-                "👋 Привет! Добро пожаловать в бот для отслеживания менструального цикла.\n\n"
-            "Этот бот создан специально для мужчин, которые хотят лучше понимать и поддерживать "
-            "свою девушку в разные периоды её цикла. 💕\n\n"
-            "Бот поможет вам:\n"
-            "📊 Отслеживать текущую фазу цикла\n"
-            "🔔 Получать отчёты при смене фазы и подфазы\n"
-            "💡 Получать рекомендации, как лучше поддержать партнершу\n"
-            "📚 Изучать информацию о фазах цикла\n\n"
-            "Помните: ваша забота и внимание - это проявление любви и уважения! ❤️",
-                reply_markup=get_main_menu(user)
-            )
-        elif query.data.startswith("phase_info_"):
-            phase_name = query.data.replace("phase_info_", "")
-            await show_phase_details(query, phase_name, stage=None)
-        elif query.data.startswith("phase_subphase_"):
-            # phase_subphase_menstrual_early
-            rest = query.data.replace("phase_subphase_", "")
-            if "_" in rest:
-                phase_name, stage = rest.rsplit("_", 1)
-                if stage in ("early", "mid", "late"):
-                    await show_phase_details(query, phase_name, stage=stage)
-                    return
-        elif query.data.startswith("term_info_"):
-            term = query.data.replace("term_info_", "")
-            await show_term_info(query, term)
-        elif query.data == "update_cycle_date":
-            # Обрабатывается ConversationHandler (start_update_cycle_date_handler)
-            pass
-        elif query.data == "cycle_ended_earlier":
-            # Обрабатывается ConversationHandler (start_cycle_ended_earlier_handler)
-            pass
-        elif query.data == "cycle_not_ended_on_time":
-            await query.answer()
-            user = session.query(User).filter(User.id == user_id).first()
-            if not user:
-                await query.answer("Ошибка: пользователь не найден.")
-                return
-            extended = getattr(user, 'cycle_extended_days', 0) or 0
-            user.cycle_extended_days = extended + 1
-            session.commit()
-            await query.message.reply_text(
-                "⏳ Цикл продлён на 1 день. Завтра снова придёт напоминание об обновлении даты начала нового цикла."
-            )
-            return
-        elif query.data == "admin_test_daily":
-            if query.from_user.id != ADMIN_USER_ID:
-                await query.answer("Нет доступа")
-                return
-            await query.answer()
-            user = session.query(User).filter(User.id == query.from_user.id).first()
-            if not user or not user.last_period_start:
-                await query.message.reply_text("Заполните данные профиля для теста.")
-                return
-            text = generate_daily_notification(user)
-            await query.message.reply_text(text, parse_mode='Markdown')
-        elif query.data == "admin_test_phase":
-            if query.from_user.id != ADMIN_USER_ID:
-                await query.answer("Нет доступа")
-                return
-            await query.answer()
-            user = session.query(User).filter(User.id == query.from_user.id).first()
-            if not user or not user.last_period_start:
-                await query.message.reply_text("Заполните данные профиля для теста.")
-                return
-            calculator = CycleCalculator(
-                user.last_period_start, effective_cycle_length_for_user(user), user.period_length
-            )
-            next_phase_info = calculator.get_next_phase()
-            if next_phase_info:
-                phase = next_phase_info['phase']
-                phase_start_date = next_phase_info['start_date']
-                recommendations = get_detailed_recommendations(phase.name, False)
-                phase_advance_text = (
-                    f"🔔 **Приближается новая фаза**\n\n"
-                    f"👩 Для: {user.girlfriend_name}\n\n"
-                    f"🌙 Через 2 дня начнется фаза: **{phase.name_ru}**\n"
-                    f"📅 Дата начала: {format_date_russian(phase_start_date)}\n\n"
-                    f"📝 **Что это значит:**\n{phase.description}\n\n"
-                    f"{recommendations}"
-                )
-                await query.message.reply_text(phase_advance_text, parse_mode='Markdown')
-            else:
-                await query.message.reply_text("Не удалось определить следующую фазу.")
-        elif query.data == "admin_test_cycle":
-            if query.from_user.id != ADMIN_USER_ID:
-                await query.answer("Нет доступа")
-                return
-            await query.answer()
-            user = session.query(User).filter(User.id == query.from_user.id).first()
-            if not user or not user.girlfriend_name:
-                await query.message.reply_text("Заполните данные профиля для теста.")
-                return
-            cycle_end_text = (
-                f"🔄 **Цикл завершен!**\n\n"
-                f"👩 Для: {user.girlfriend_name}\n\n"
-                f"📅 Текущий цикл завершился. Необходимо обновить дату начала нового цикла.\n\n"
-                f"💡 **Важно:** Обязательно уточните у своей девушки, началась ли у неё новый цикл.\n\n"
-                f"Нажмите кнопку ниже, чтобы обновить дату начала нового цикла:"
-            )
-            keyboard = [
-                [InlineKeyboardButton("📆 Обновить дату цикла / цикл закончился раньше", callback_data="update_cycle_choice")],
-                [InlineKeyboardButton("⏳ Цикл не завершился вовремя", callback_data="cycle_not_ended_on_time")],
-                [InlineKeyboardButton("🔙 Главное меню", callback_data="back_to_main")]
-            ]
-            await query.message.reply_text(
-                cycle_end_text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode='Markdown'
-            )
-
+        if not await CALLBACK_ROUTER.dispatch(query):
+            logger.warning(f"Нет обработчика для кнопки {query.data!r}")
     except Exception as e:
         logger.error(f"Ошибка в button_handler: {e}")
         await query.edit_message_text("Произошла ошибка. Попробуйте позже.")
-    finally:
-        session.close()
 
 
-async def start_data_collection(query, user: User, session):
-    """Начать процесс сбора данных"""
-    text = (
-        "📝 Для работы бота необходимо собрать некоторые данные.\n\n"
-        "💡 **Важно:** Не бойтесь спрашивать у своей девушки! "
-        "Её это только порадует, что вы настолько вовлечены в отношения и заботитесь о ней. "
-        "Это показывает вашу зрелость и внимание к её состоянию. ❤️\n\n"
-        "📋 **Необходимые данные:**\n\n"
-        "1️⃣ Ваше имя\n"
-        "2️⃣ Имя вашей девушки\n"
-        "3️⃣ Длительность цикла (обычно 21-35 дней, среднее 28)\n"
-        "4️⃣ Длительность менструации (обычно 3-7 дней)\n"
-        "5️⃣ Дата начала последней менструации (формат: ДД.ММ.ГГГГ)\n"
-        "6️⃣ Ваш часовой пояс (например: +3, -1, 0 относительно МСК)\n"
-        "7️⃣ Время для уведомлений (формат: ЧЧ:ММ, например 09:00)\n\n"
-        "Вы можете заполнить все данные сейчас или взять паузу, чтобы собрать информацию.\n\n"
-        "Начнем?"
+async def confirm_or_start_data_collection(query, user: User, session):
+    """Кнопка «Приступить к работе» / «Заполнить данные заново»"""
+    # Если уже есть данные — предупреждение и подтверждение перед удалением
+    if user.last_period_start is not None or user.name:
+        await screens.REFILL_CONFIRM.edit(query)
+    else:
+        await start_data_collection(query, user, session)
+
+
+async def confirm_refill_data(query, user: User, session):
+    """Подтверждение перезаполнения: удалить данные и начать сбор заново"""
+    await reset_user_and_cycle_data(session, user.id)
+    user = await get_user(session, user.id)
+    await start_data_collection(query, user, session)
+
+
+async def show_main_menu(query, user: User, session):
+    """Главное меню (отмена перезаполнения)"""
+    await query.edit_message_text(screens.MAIN_MENU_TITLE, reply_markup=get_main_menu(user))
+
+
+async def show_main_screen(query, user: User, session):
+    """Приветствие с главным меню (кнопка «Назад»)"""
+    await get_main_screen(user).edit(query)
+
+
+async def fill_later(query, user: User, session):
+    """Обработка кнопки "Заполнить позже" - не через ConversationHandler"""
+    await query.edit_message_text(screens.FILL_LATER_TEXT, reply_markup=get_main_menu(user))
+
+
+async def show_update_cycle_choice(query):
+    """Выбор: цикл закончился раньше или обновить дату начала"""
+    await screens.UPDATE_CYCLE_CHOICE.edit(query)
+
+
+async def handled_by_conversation(query):
+    """Кнопка начинает диалог — её обрабатывает ConversationHandler, здесь ничего не делаем."""
+
+
+async def extend_cycle(query, user: User, session):
+    """Кнопка «Цикл не завершился вовремя»: продлить цикл на день"""
+    if not user:
+        await query.answer("Ошибка: пользователь не найден.")
+        return
+    extended = getattr(user, 'cycle_extended_days', 0) or 0
+    user.cycle_extended_days = extended + 1
+    refresh_user_schedule(user, get_user_today(user), effective_cycle_length(user))
+    await session.commit()
+    await query.message.reply_text(
+        "⏳ Цикл продлён на 1 день. Завтра снова придёт напоминание об обновлении даты начала нового цикла."
     )
-    
-    keyboard = [
-        [InlineKeyboardButton("✅ Начать заполнение", callback_data="start_filling")],
-        [InlineKeyboardButton("⏸️ Заполнить позже", callback_data="fill_later")]
-    ]
-    
-    await query.edit_message_text(
-        text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
+
+
+async def admin_test_daily(query, user: User, session):
+    """Тест (админ): отчёт по текущей фазе"""
+    if query.from_user.id != ADMIN_USER_ID:
+        await query.answer("Нет доступа")
+        return
+    if not user or not user.last_period_start:
+        await query.message.reply_text("Заполните данные профиля для теста.")
+        return
+    text = generate_daily_notification(user, effective_cycle_length(user))
+    await query.message.reply_text(text, parse_mode='Markdown')
+
+
+async def admin_test_phase(query, user: User, session):
+    """Тест (админ): приближение фазы"""
+    if query.from_user.id != ADMIN_USER_ID:
+        await query.answer("Нет доступа")
+        return
+    if not user or not user.last_period_start:
+        await query.message.reply_text("Заполните данные профиля для теста.")
+        return
+    calculator = CycleCalculator(
+        user.last_period_start, effective_cycle_length(user), user.period_length
+    )
+    next_phase_info = calculator.get_next_phase()
+    if next_phase_info:
+        phase = next_phase_info['phase']
+        phase_start_date = next_phase_info['start_date']
+        recommendations = get_detailed_recommendations(phase.name, False)
+        phase_advance_text = (
+            f"🔔 **Приближается новая фаза**\n\n"
+            f"👩 Для: {user.girlfriend_name}\n\n"
+            f"🌙 Через 2 дня начнется фаза: **{phase.name_ru}**\n"
+            f"📅 Дата начала: {format_date_russian(phase_start_date)}\n\n"
+            f"📝 **Что это значит:**\n{phase.description}\n\n"
+            f"{recommendations}"
+        )
+        await query.message.reply_text(phase_advance_text, parse_mode='Markdown')
+    else:
+        await query.message.reply_text("Не удалось определить следующую фазу.")
+
+
+async def admin_test_cycle(query, user: User, session):
+    """Тест (админ): завершение цикла"""
+    if query.from_user.id != ADMIN_USER_ID:
+        await query.answer("Нет доступа")
+        return
+    if not user or not user.girlfriend_name:
+        await query.message.reply_text("Заполните данные профиля для теста.")
+        return
+    cycle_end_text = (
+        f"🔄 **Цикл завершен!**\n\n"
+        f"👩 Для: {user.girlfriend_name}\n\n"
+        f"📅 Текущий цикл завершился. Необходимо обновить дату начала нового цикла.\n\n"
+        f"💡 **Важно:** Обязательно уточните у своей девушки, началась ли у неё новый цикл.\n\n"
+        f"Нажмите кнопку ниже, чтобы обновить дату начала нового цикла:"
+    )
+    await query.message.reply_text(
+        cycle_end_text,
+        reply_markup=screens.CYCLE_END_KEYBOARD,
         parse_mode='Markdown'
     )
 
 
+async def start_data_collection(query, user: User, session):
+    """Начать процесс сбора данных"""
+    await screens.DATA_COLLECTION_INTRO.edit(query)
+
+
 async def start_update_cycle_date(query, user: User, session):
     """Начать процесс обновления даты начала нового цикла"""
     await query.answer()
-    text = (
-        "📆 **Обновление даты начала нового цикла**\n\n"
-        "💡 **ВАЖНО:** Обязательно уточните у своей девушки, началась ли у неё менструация. "
-        "Не обновляйте дату, если менструация еще не началась!\n\n"
-        "Введите дату начала нового цикла (формат: ДД.ММ.ГГГГ, например: 25.01.2026):"
-    )
-    keyboard = [
-        [InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")]
-    ]
     try:
-        await query.edit_message_text(
-            text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
-            parse_mode='Markdown'
-        )
+        await screens.UPDATE_CYCLE_DATE.edit(query)
     except Exception as e:
         logger.warning(f"Не удалось отредактировать сообщение при обновлении даты цикла: {e}")
         try:
-            await query.message.reply_text(
-                text,
-                reply_markup=InlineKeyboardMarkup(keyboard),
-                parse_mode='Markdown'
-            )
+            await screens.UPDATE_CYCLE_DATE.reply(query.message)
         except Exception:
             pass
     return UPDATING_NEW_CYCLE_DATE
@@ -527,18 +350,15 @@ async def update_cycle_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Горячие клавиши: выход в главное меню
     if text in (KEYBOARD_MAIN_MENU, KEYBOARD_RESTART):
-        session = SessionLocal()
+        session = AsyncSessionLocal()
         try:
-            user = session.query(User).filter(User.id == user_id).first()
-            await update.message.reply_text(
-                "👋 Главное меню",
-                reply_markup=get_main_menu(user)
-            )
+            user = await get_user(session, user_id)
+            await update.message.reply_text(screens.MAIN_MENU_TITLE, reply_markup=get_main_menu(user))
         finally:
-            session.close()
+            await session.close()
         return ConversationHandler.END
 
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     try:
         # Парсим дату в формате ДД.ММ.ГГГГ
         try:
@@ -550,7 +370,7 @@ async def update_cycle_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return UPDATING_NEW_CYCLE_DATE
 
-        user = session.query(User).filter(User.id == user_id).first()
+        user = await get_user(session, user_id)
         if not user:
             await update.message.reply_text("❌ Пользователь не найден. Отправьте /start")
             return ConversationHandler.END
@@ -574,13 +394,16 @@ async def update_cycle_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         user.last_period_start = new_period_date
         user.cycle_extended_days = 0  # сброс продления при обновлении даты нового цикла
-        session.commit()
+        await session.commit()
 
-        effective_len = effective_cycle_length_for_user(user)
+        effective_len = effective_cycle_length(user)
         cycle_data = calculate_menstrual_cycle(
             effective_len, user.period_length, new_period_date
         )
-        save_cycle_record(user_id, new_period_date, cycle_data)
+        await save_cycle_record(user_id, new_period_date, cycle_data)
+        await session.refresh(user, ["avg_cycle_length"])
+        refresh_user_schedule(user, user_today, effective_cycle_length(user))
+        await session.commit()
 
         logger.info(f"Пользователь {user_id} обновил дату начала цикла на {new_period_date}")
 
@@ -588,7 +411,7 @@ async def update_cycle_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
             f"✅ **Дата начала нового цикла успешно установлена.**\n\n"
             f"📅 Новая дата: {format_date_russian(new_period_date)}\n\n"
             f"Запись в историю циклов добавлена. Бот продолжит отслеживание с новой даты.",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_main")]]),
+            reply_markup=screens.MAIN_MENU_BUTTON,
             parse_mode="Markdown"
         )
         return ConversationHandler.END
@@ -599,23 +422,13 @@ async def update_cycle_date(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return UPDATING_NEW_CYCLE_DATE
     finally:
-        session.close()
+        await session.close()
 
 
 async def start_cycle_ended_earlier(query, user: User, session):
     """Начать процесс «Цикл закончился раньше»: запрос даты окончания текущего цикла."""
     await query.answer()
-    text = (
-        "⏪ **Цикл закончился раньше**\n\n"
-        "Введите дату окончания текущего цикла (формат ДД.ММ.ГГГГ, например: 10.02.2026).\n\n"
-        "Эта дата будет записана в текущий цикл в истории."
-    )
-    keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")]]
-    await query.edit_message_text(
-        text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode="Markdown"
-    )
+    await screens.CYCLE_ENDED_EARLIER.edit(query)
     return COLLECTING_CYCLE_END_DATE
 
 
@@ -625,18 +438,15 @@ async def handle_cycle_end_date(update: Update, context: ContextTypes.DEFAULT_TY
     text = update.message.text.strip()
 
     if text in (KEYBOARD_MAIN_MENU, KEYBOARD_RESTART):
-        session = SessionLocal()
+        session = AsyncSessionLocal()
         try:
-            user = session.query(User).filter(User.id == user_id).first()
-            await update.message.reply_text(
-                "👋 Главное меню",
-                reply_markup=get_main_menu(user)
-            )
+            user = await get_user(session, user_id)
+            await update.message.reply_text(screens.MAIN_MENU_TITLE, reply_markup=get_main_menu(user))
         finally:
-            session.close()
+            await session.close()
         return ConversationHandler.END
 
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     try:
         try:
             end_date = datetime.strptime(text, "%d.%m.%Y").date()
@@ -646,7 +456,7 @@ async def handle_cycle_end_date(update: Update, context: ContextTypes.DEFAULT_TY
             )
             return COLLECTING_CYCLE_END_DATE
 
-        user = session.query(User).filter(User.id == user_id).first()
+        user = await get_user(session, user_id)
         if not user or not user.last_period_start:
             await update.message.reply_text("❌ Сначала заполните данные профиля.")
             return ConversationHandler.END
@@ -664,9 +474,9 @@ async def handle_cycle_end_date(update: Update, context: ContextTypes.DEFAULT_TY
             )
             return COLLECTING_CYCLE_END_DATE
 
-        ok = update_cycle_record_actual_end(user_id, end_date)
+        ok = await update_cycle_record_actual_end(user_id, end_date)
         if not ok:
-            last_record = get_last_cycle_record(user_id)
+            last_record = await get_last_cycle_record(user_id)
             if not last_record:
                 await update.message.reply_text(
                     "❌ В истории нет записи текущего цикла. Сначала обновите дату цикла через «Обновить дату цикла»."
@@ -674,6 +484,9 @@ async def handle_cycle_end_date(update: Update, context: ContextTypes.DEFAULT_TY
                 return ConversationHandler.END
             await update.message.reply_text("❌ Не удалось сохранить дату окончания. Попробуйте позже.")
             return COLLECTING_CYCLE_END_DATE
+        await session.refresh(user, ["avg_cycle_length"])
+        refresh_user_schedule(user, user_today, effective_cycle_length(user))
+        await session.commit()
 
         await update.message.reply_text(
             f"✅ Дата окончания текущего цикла сохранена: {format_date_russian(end_date)}.\n\n"
@@ -681,41 +494,18 @@ async def handle_cycle_end_date(update: Update, context: ContextTypes.DEFAULT_TY
         )
         return UPDATING_NEW_CYCLE_DATE
     finally:
-        session.close()
+        await session.close()
 
 
 async def show_main_menu_from_keyboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показать главное меню по нажатию постоянной кнопки (Главное меню / Перезапуск)."""
     user_id = update.effective_user.id
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     try:
-        user = session.query(User).filter(User.id == user_id).first()
-        if user is None:
-            user = User(
-                id=user_id,
-                username=update.effective_user.username,
-                first_name=update.effective_user.first_name,
-                last_name=update.effective_user.last_name,
-            )
-            session.add(user)
-            session.commit()
-        welcome = (
-            "👋 Привет! Добро пожаловать в бот для отслеживания менструального цикла.\n\n"
-            "Этот бот создан специально для мужчин, которые хотят лучше понимать и поддерживать "
-            "свою девушку в разные периоды её цикла. 💕\n\n"
-            "Бот поможет вам:\n"
-            "📊 Отслеживать текущую фазу цикла\n"
-            "🔔 Получать отчёты при смене фазы и подфазы\n"
-            "💡 Получать рекомендации, как лучше поддержать партнершу\n"
-            "📚 Изучать информацию о фазах цикла\n\n"
-            "Помните: ваша забота и внимание - это проявление любви и уважения! ❤️"
-        )
-        await update.message.reply_text(
-            welcome,
-            reply_markup=get_main_menu(user)
-        )
+        user = await get_or_create_user(session, update.effective_user)
+        await get_main_screen(user).reply(update.message)
     finally:
-        session.close()
+        await session.close()
 
 
 async def begin_filling(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -724,16 +514,16 @@ async def begin_filling(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     
     user_id = query.from_user.id
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     
     try:
-        user = session.query(User).filter(User.id == user_id).first()
+        user = await get_user(session, user_id)
         if not user:
             await query.message.reply_text("❌ Ошибка: пользователь не найден. Отправьте /start")
             return ConversationHandler.END
         
         user.data_collection_state = "name"
-        session.commit()
+        await session.commit()
         
         logger.info(f"Начало сбора данных для пользователя {user_id}")
         
@@ -748,7 +538,7 @@ async def begin_filling(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await query.message.reply_text("❌ Произошла ошибка. Попробуйте позже.")
         return ConversationHandler.END
     finally:
-        session.close()
+        await session.close()
 
 
 async def fill_later_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -757,29 +547,25 @@ async def fill_later_handler(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
     
     user_id = query.from_user.id
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     
     try:
-        user = session.query(User).filter(User.id == user_id).first()
-        await query.edit_message_text(
-            "✅ Отлично, возвращайтесь скорее! 💕\n\n"
-            "Когда будете готовы, просто нажмите кнопку '🔄 Заполнить данные заново' в главном меню.",
-            reply_markup=get_main_menu(user)
-        )
+        user = await get_user(session, user_id)
+        await query.edit_message_text(screens.FILL_LATER_TEXT, reply_markup=get_main_menu(user))
         return ConversationHandler.END
     finally:
-        session.close()
+        await session.close()
 
 
 async def collect_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Сбор имени пользователя"""
     user_id = update.effective_user.id
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     
     try:
         logger.info(f"collect_name вызван для пользователя {user_id}, текст: {update.message.text}")
         
-        user = session.query(User).filter(User.id == user_id).first()
+        user = await get_user(session, user_id)
         if not user:
             logger.error(f"Пользователь {user_id} не найден в базе")
             await update.message.reply_text("❌ Ошибка: пользователь не найден. Отправьте /start")
@@ -802,7 +588,7 @@ async def collect_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         user.name = name
         user.data_collection_state = "girlfriend_name"
-        session.commit()
+        await session.commit()
         
         logger.info(f"Пользователь {user_id} ввел имя: {name}")
         
@@ -815,13 +601,13 @@ async def collect_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ Произошла ошибка. Попробуйте еще раз или отправьте /cancel")
         return COLLECTING_NAME
     finally:
-        session.close()
+        await session.close()
 
 
 async def collect_girlfriend_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Сбор имени девушки"""
     user_id = update.effective_user.id
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     
     try:
         girlfriend_name = update.message.text.strip()
@@ -840,10 +626,10 @@ async def collect_girlfriend_name(update: Update, context: ContextTypes.DEFAULT_
             await update.message.reply_text("⚠️ Имя может содержать только буквы, пробелы и дефисы. Пожалуйста, введите корректное имя:")
             return COLLECTING_GIRLFRIEND_NAME
         
-        user = session.query(User).filter(User.id == user_id).first()
+        user = await get_user(session, user_id)
         user.girlfriend_name = girlfriend_name
         user.data_collection_state = "cycle_length"
-        session.commit()
+        await session.commit()
         
         await update.message.reply_text(
             f"💕 Прекрасно! Теперь укажите длительность цикла в днях "
@@ -851,13 +637,13 @@ async def collect_girlfriend_name(update: Update, context: ContextTypes.DEFAULT_
         )
         return COLLECTING_CYCLE_LENGTH
     finally:
-        session.close()
+        await session.close()
 
 
 async def collect_cycle_length(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Сбор длительности цикла"""
     user_id = update.effective_user.id
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     
     try:
         cycle_length_str = update.message.text.strip()
@@ -878,10 +664,11 @@ async def collect_cycle_length(update: Update, context: ContextTypes.DEFAULT_TYP
             )
             return COLLECTING_CYCLE_LENGTH
         
-        user = session.query(User).filter(User.id == user_id).first()
+        user = await get_user(session, user_id)
         user.cycle_length = cycle_length
         user.data_collection_state = "period_length"
-        session.commit()
+        refresh_user_schedule(user, get_user_today(user), effective_cycle_length(user))
+        await session.commit()
         
         await update.message.reply_text(
             "✅ Принято! Теперь укажите длительность менструации в днях "
@@ -894,13 +681,13 @@ async def collect_cycle_length(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return COLLECTING_CYCLE_LENGTH
     finally:
-        session.close()
+        await session.close()
 
 
 async def collect_period_length(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Сбор длительности менструации"""
     user_id = update.effective_user.id
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     
     try:
         period_length_str = update.message.text.strip()
@@ -921,10 +708,11 @@ async def collect_period_length(update: Update, context: ContextTypes.DEFAULT_TY
             )
             return COLLECTING_PERIOD_LENGTH
         
-        user = session.query(User).filter(User.id == user_id).first()
+        user = await get_user(session, user_id)
         user.period_length = period_length
         user.data_collection_state = "last_period"
-        session.commit()
+        refresh_user_schedule(user, get_user_today(user), effective_cycle_length(user))
+        await session.commit()
         
         await update.message.reply_text(
             "✅ Отлично! Теперь укажите дату начала последней менструации "
@@ -937,13 +725,13 @@ async def collect_period_length(update: Update, context: ContextTypes.DEFAULT_TY
         )
         return COLLECTING_PERIOD_LENGTH
     finally:
-        session.close()
+        await session.close()
 
 
 async def collect_last_period(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Сбор даты последней менструации"""
     user_id = update.effective_user.id
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     
     try:
         date_str = update.message.text.strip()
@@ -964,10 +752,11 @@ async def collect_last_period(update: Update, context: ContextTypes.DEFAULT_TYPE
             )
             return COLLECTING_LAST_PERIOD
         
-        user = session.query(User).filter(User.id == user_id).first()
+        user = await get_user(session, user_id)
         user.last_period_start = period_date
         user.data_collection_state = "timezone"
-        session.commit()
+        refresh_user_schedule(user, get_user_today(user), effective_cycle_length(user))
+        await session.commit()
         
         await update.message.reply_text(
             "✅ Отлично! Теперь укажите ваш часовой пояс относительно МСК "
@@ -982,13 +771,13 @@ async def collect_last_period(update: Update, context: ContextTypes.DEFAULT_TYPE
         )
         return COLLECTING_LAST_PERIOD
     finally:
-        session.close()
+        await session.close()
 
 
 async def collect_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Сбор часового пояса"""
     user_id = update.effective_user.id
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     
     try:
         timezone_str = update.message.text.strip()
@@ -1014,11 +803,14 @@ async def collect_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             return COLLECTING_TIMEZONE
         
-        user = session.query(User).filter(User.id == user_id).first()
+        user = await get_user(session, user_id)
         # Сохраняем как число (для совместимости с новым форматом)
         user.timezone = timezone_offset
+        user.notification_minute_utc = compute_notification_minute_utc(user.notification_time, timezone_offset)
         user.data_collection_state = "notification_time"
-        session.commit()
+        # Местная дата зависит от часового пояса — график событий пересчитывается от неё
+        refresh_user_schedule(user, get_user_today(user), effective_cycle_length(user))
+        await session.commit()
         
         # Логируем для отладки
         logger.info(f"Пользователь {user_id} установил часовой пояс: {timezone_offset}")
@@ -1032,13 +824,13 @@ async def collect_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return COLLECTING_NOTIFICATION_TIME
     finally:
-        session.close()
+        await session.close()
 
 
 async def collect_notification_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Сбор времени уведомлений"""
     user_id = update.effective_user.id
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     
     try:
         time_str = update.message.text.strip()
@@ -1051,17 +843,21 @@ async def collect_notification_time(update: Update, context: ContextTypes.DEFAUL
             )
             return COLLECTING_NOTIFICATION_TIME
         
-        user = session.query(User).filter(User.id == user_id).first()
+        user = await get_user(session, user_id)
         user.notification_time = time_str
+        user.notification_minute_utc = compute_notification_minute_utc(time_str, get_timezone_offset(user))
         user.data_collection_state = None
         user.notifications_enabled = True
-        session.commit()
+        await session.commit()
         
-        effective_len = effective_cycle_length_for_user(user)
+        effective_len = effective_cycle_length(user)
         cycle_data = calculate_menstrual_cycle(
             effective_len, user.period_length, user.last_period_start
         )
-        save_cycle_record(user_id, user.last_period_start, cycle_data)
+        await save_cycle_record(user_id, user.last_period_start, cycle_data)
+        await session.refresh(user, ["avg_cycle_length"])
+        refresh_user_schedule(user, get_user_today(user), effective_cycle_length(user))
+        await session.commit()
         
         # Формируем финальное сообщение
         calculator = CycleCalculator(
@@ -1089,27 +885,26 @@ async def collect_notification_time(update: Update, context: ContextTypes.DEFAUL
             f"💡 **Совет:** Обновляйте дату начала менструации, когда начинается новый цикл!"
         )
         
-        keyboard = [[InlineKeyboardButton("🏠 Главное меню", callback_data="back_to_main")]]
         await update.message.reply_text(
             text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=screens.MAIN_MENU_BUTTON,
             parse_mode='Markdown'
         )
         return ConversationHandler.END
     finally:
-        session.close()
+        await session.close()
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Отмена сбора данных"""
     user_id = update.effective_user.id
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     
     try:
-        user = session.query(User).filter(User.id == user_id).first()
+        user = await get_user(session, user_id)
         if user:
             user.data_collection_state = None
-            session.commit()
+            await session.commit()
         
         await update.message.reply_text(
             "❌ Сбор данных отменен. Вы можете начать заново из главного меню.",
@@ -1117,33 +912,12 @@ async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return ConversationHandler.END
     finally:
-        session.close()
+        await session.close()
 
 
 async def show_cycle_info(query):
     """Показать информацию о фазах цикла"""
-    text = (
-        "📚 **Справочник фаз менструального цикла**\n\n"
-        "Здесь вы можете узнать подробную информацию о каждой фазе цикла, "
-        "симптомах, поведении и рекомендациях по поддержке вашей девушки.\n\n"
-        "Выберите, что вас интересует:"
-    )
-    
-    keyboard = [
-        [InlineKeyboardButton("🩸 Менструальная фаза", callback_data="phase_info_menstrual")],
-        [InlineKeyboardButton("🌱 Фолликулярная фаза", callback_data="phase_info_follicular")],
-        [InlineKeyboardButton("💫 Овуляция", callback_data="phase_info_ovulation")],
-        [InlineKeyboardButton("🌙 Лютеиновая фаза (ПМС)", callback_data="phase_info_luteal")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")]
-    ]
-    
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
-
-
-def _format_ref_block(items: list) -> str:
-    if not items:
-        return ""
-    return "\n".join(f"• {s}" for s in items) if isinstance(items[0], str) else "\n".join(items)
+    await screens.CYCLE_INFO.edit(query)
 
 
 async def show_phase_details(query, phase_name: str, stage: str = None):
@@ -1156,164 +930,50 @@ async def show_phase_details(query, phase_name: str, stage: str = None):
     if not ref:
         await query.answer("Данные не найдены")
         return
-    symptoms = ref.get("symptoms", [])
-    behavior = ref.get("behavior", [])
-    recs = ref.get("male_recommendations", [])
     title = ref.get("subphase_name") or ref.get("phase_name_ru") or phase_en
     text = (
         f"📊 **{title}**\n\n"
-        f"😷 **Симптомы:**\n{_format_ref_block(symptoms)}\n\n"
-        f"👤 **Поведение:**\n{_format_ref_block(behavior)}\n\n"
-        f"💡 **Рекомендации для вас:**\n\n{_format_ref_block(recs)}"
+        f"😷 **Симптомы:**\n{ref['symptoms_md']}\n\n"
+        f"👤 **Поведение:**\n{ref['behavior_md']}\n\n"
+        f"💡 **Рекомендации для вас:**\n\n{ref['male_recommendations_md']}"
     )
-    keyboard = []
-    if stage:
-        keyboard.append([InlineKeyboardButton("🔙 Назад к фазе", callback_data=f"phase_info_{phase_name}")])
-    else:
-        # Кнопки подфаз только для фаз с подфазами (не Овуляция)
-        if phase_name in ("menstrual", "follicular", "luteal"):
-            keyboard.append([
-                InlineKeyboardButton("Начало", callback_data=f"phase_subphase_{phase_name}_early"),
-                InlineKeyboardButton("Середина", callback_data=f"phase_subphase_{phase_name}_mid"),
-                InlineKeyboardButton("Конец", callback_data=f"phase_subphase_{phase_name}_late"),
-            ])
-    keyboard.append([InlineKeyboardButton("🔙 Назад к фазам", callback_data="cycle_info")])
     await query.edit_message_text(
         text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
+        reply_markup=screens.PHASE_DETAILS_KEYBOARDS[(phase_name, stage or None)],
         parse_mode='Markdown'
     )
 
 
 async def show_terms_list(query):
     """Показать список терминов"""
-    text = (
-        "📖 **Ключевые термины**\n\n"
-        "Выберите термин для получения подробной информации:"
-    )
-    
-    keyboard = [
-        [InlineKeyboardButton("🩸 Менструация", callback_data="term_info_menstruation")],
-        [InlineKeyboardButton("💫 Овуляция", callback_data="term_info_ovulation")],
-        [InlineKeyboardButton("🌙 ПМС", callback_data="term_info_pms")],
-        [InlineKeyboardButton("📅 Цикл", callback_data="term_info_cycle")],
-        [InlineKeyboardButton("🔙 Назад", callback_data="cycle_info")]
-    ]
-    
-    await query.edit_message_text(text, reply_markup=InlineKeyboardMarkup(keyboard), parse_mode='Markdown')
+    await screens.TERMS_LIST.edit(query)
 
 
 async def show_term_info(query, term: str):
     """Показать информацию о термине"""
-    terms = {
-        "menstruation": (
-            "🩸 **Менструация**\n\n"
-            "Менструация - это ежемесячное кровотечение, которое происходит, "
-            "когда организм избавляется от неоплодотворенной яйцеклетки и эндометрия "
-            "(слизистой оболочки матки). Обычно длится 3-7 дней.\n\n"
-            "В этот период женщина может испытывать слабость, боли, усталость."
-        ),
-        "ovulation": (
-            "💫 **Овуляция**\n\n"
-            "Овуляция - это процесс выхода зрелой яйцеклетки из фолликула яичника. "
-            "Обычно происходит на 14 день цикла (при 28-дневном цикле). "
-            "Это период максимальной фертильности.\n\n"
-            "Во время овуляции женщина чувствует прилив сил, повышение либидо, "
-            "уверенность в себе."
-        ),
-        "pms": (
-            "🌙 **ПМС (Предменструальный синдром)**\n\n"
-            "ПМС - это комплекс симптомов, которые возникают за несколько дней "
-            "до начала менструации (обычно за 1-2 недели).\n\n"
-            "Симптомы включают:\n"
-            "• Перепады настроения\n"
-            "• Раздражительность\n"
-            "• Усталость\n"
-            "• Отеки\n"
-            "• Изменения аппетита\n"
-            "• Вздутие живота\n\n"
-            "Это нормальная часть цикла, требующая понимания и поддержки."
-        ),
-        "cycle": (
-            "📅 **Менструальный цикл**\n\n"
-            "Менструальный цикл - это регулярные изменения в организме женщины, "
-            "подготовка к возможной беременности. Обычно длится 21-35 дней "
-            "(в среднем 28 дней).\n\n"
-            "Цикл состоит из четырех фаз:\n"
-            "1. Менструальная (дни 1-7)\n"
-            "2. Фолликулярная (дни 7-14)\n"
-            "3. Овуляция (день 14)\n"
-            "4. Лютеиновая (дни 15-28)\n\n"
-            "Каждая фаза имеет свои особенности и требует разного подхода."
-        )
-    }
-    
-    text = terms.get(term, "Термин не найден")
-    keyboard = [[InlineKeyboardButton("🔙 Назад к терминам", callback_data="terms_list")]]
-    
-    await query.edit_message_text(
-        text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode='Markdown'
-    )
+    await screens.TERMS.get(term, screens.TERM_NOT_FOUND).edit(query)
 
 
-def _days_in_phase_from_cycle_data(cycle_data: dict, target_date) -> tuple:
-    """По cycle_data и дате вернуть (days_in_phase, days_left_in_phase) для текущей фазы/подфазы."""
-    if hasattr(target_date, 'strftime'):
-        d_str = target_date.strftime("%Y-%m-%d")
-    else:
-        d_str = str(target_date)
-    for ph in cycle_data.get("phases", []):
-        if "subphases" in ph:
-            for sub in ph["subphases"]:
-                start_s, end_s = sub["start_date"], sub["end_date"]
-                if start_s <= d_str <= end_s:
-                    start_d = datetime.strptime(start_s, "%Y-%m-%d").date()
-                    end_d = datetime.strptime(end_s, "%Y-%m-%d").date()
-                    today = target_date if isinstance(target_date, date) else datetime.strptime(d_str, "%Y-%m-%d").date()
-                    days_in = (today - start_d).days + 1
-                    days_left = (end_d - today).days
-                    return (days_in, days_left)
-        else:
-            start_s, end_s = ph["start_date"], ph["end_date"]
-            if start_s <= d_str <= end_s:
-                start_d = datetime.strptime(start_s, "%Y-%m-%d").date()
-                end_d = datetime.strptime(end_s, "%Y-%m-%d").date()
-                today = target_date if isinstance(target_date, date) else datetime.strptime(d_str, "%Y-%m-%d").date()
-                days_in = (today - start_d).days + 1
-                days_left = (end_d - today).days
-                return (days_in, days_left)
-    return (None, None)
-
-
-async def show_profile(query, user: User):
+async def show_profile(query, user: User, session=None):
     """Показать профиль пользователя (фаза и овуляции — по тем же расчётам, что и в ежедневном отчёте)."""
-    effective_len = effective_cycle_length_for_user(user)
-    calculator = CycleCalculator(
-        user.last_period_start,
-        effective_len,
-        user.period_length
-    )
-    cycle_data = calculate_menstrual_cycle(
-        effective_len, user.period_length, user.last_period_start
-    )
-    phase_name_en, stage = get_phase_and_stage_for_date(cycle_data, date.today())
+    effective_len = effective_cycle_length(user)
+    snapshot = CycleSnapshot.at(user.last_period_start, effective_len, user.period_length, date.today())
+    phase_day = snapshot.phase_day
+    phase_name_en, stage = phase_day.phase_name, phase_day.stage
     ref = get_reference_phase(phase_name_en, stage) if phase_name_en else {}
     phase_title = ref.get("subphase_name") or ref.get("phase_name_ru") if ref else None
     
-    phase_info = calculator.get_current_phase()
-    current_day = phase_info["current_day"]
-    if not phase_title and phase_info.get("phase"):
-        phase_title = phase_info["phase"].name_ru
+    current_day = snapshot.current_day
+    if not phase_title and snapshot.phase:
+        phase_title = snapshot.phase.name_ru
     
-    days_in_phase, days_left_in_phase = _days_in_phase_from_cycle_data(cycle_data, date.today())
+    days_in_phase, days_left_in_phase = phase_day.days_in, phase_day.days_left
     
-    next_period = calculator.get_next_period_date()
-    last_ovulation = calculator.get_last_ovulation_date()
-    next_ovulation = calculator.get_next_ovulation_date()
-    days_until_period = (next_period - date.today()).days
-    days_until_ovulation = (next_ovulation - date.today()).days
+    next_period = snapshot.next_period
+    last_ovulation = snapshot.last_ovulation
+    next_ovulation = snapshot.next_ovulation
+    days_until_period = snapshot.days_until_period
+    days_until_ovulation = snapshot.days_until_ovulation
     
     timezone_offset = get_timezone_offset(user)
     timezone_display = format_timezone_display(timezone_offset)
@@ -1323,12 +983,19 @@ async def show_profile(query, user: User):
         phase_line += f" — день {days_in_phase}, осталось {days_left_in_phase} дней"
     phase_line += "\n"
     
+    regularity = cycle_regularity(user)
+    regularity_line = ""
+    if regularity is not None:
+        score, std, cycles = regularity
+        regularity_line = f"📐 Регулярность: {score}% (±{std:.1f} дн., циклов: {cycles})\n"
+    
     text = (
         f"👤 **Мой профиль**\n\n"
         f"👨 Имя: {user.name or 'Не указано'}\n"
         f"👩 Имя девушки: {user.girlfriend_name or 'Не указано'}\n\n"
         f"📊 **Данные цикла:**\n\n"
         f"📅 Длительность цикла: {effective_len} дней\n"
+        f"{regularity_line}"
         f"🩸 Длительность менструации: {user.period_length} дней\n"
         f"📆 Последняя менструация: {format_date_russian(user.last_period_start) if user.last_period_start else 'Не указано'}\n\n"
         f"📈 **Текущее состояние:**\n\n"
@@ -1344,12 +1011,7 @@ async def show_profile(query, user: User):
         f"📊 Дней с нами в режиме отслеживания: {user.days_with_notifications}"
     )
     
-    keyboard = [[InlineKeyboardButton("🔙 Назад", callback_data="back_to_main")]]
-    await query.edit_message_text(
-        text,
-        reply_markup=InlineKeyboardMarkup(keyboard),
-        parse_mode='Markdown'
-    )
+    await query.edit_message_text(text, reply_markup=screens.BACK_TO_MAIN, parse_mode='Markdown')
 
 
 
@@ -1357,7 +1019,7 @@ async def show_profile(query, user: User):
 async def toggle_daily_notifications(query, user: User, session):
     """Переключить отчёты при начале фазы/подфазы"""
     user.notify_daily = not user.notify_daily
-    session.commit()
+    await session.commit()
     
     status = "✅ включены" if user.notify_daily else "❌ выключены"
     await query.answer(f"Отчёты при начале фазы/подфазы {status}")
@@ -1369,7 +1031,7 @@ async def toggle_daily_notifications(query, user: User, session):
 async def toggle_phase_start_notifications(query, user: User, session):
     """Переключить напоминание за 2 дня до новой фазы"""
     user.notify_phase_start = not user.notify_phase_start
-    session.commit()
+    await session.commit()
     
     status = "✅ включено" if user.notify_phase_start else "❌ выключено"
     await query.answer(f"Напоминание за 2 дня до фазы {status}")
@@ -1392,7 +1054,7 @@ async def start_change_notification_time(update: Update, context: ContextTypes.D
 async def change_notification_time(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Изменение времени уведомлений"""
     user_id = update.effective_user.id
-    session = SessionLocal()
+    session = AsyncSessionLocal()
     
     try:
         time_str = update.message.text.strip()
@@ -1405,23 +1067,24 @@ async def change_notification_time(update: Update, context: ContextTypes.DEFAULT
             )
             return CHANGING_NOTIFICATION_TIME
         
-        user = session.query(User).filter(User.id == user_id).first()
+        user = await get_user(session, user_id)
         user.notification_time = time_str
-        session.commit()
+        user.notification_minute_utc = compute_notification_minute_utc(time_str, get_timezone_offset(user))
+        await session.commit()
         
         logger.info(f"Пользователь {user_id} изменил время уведомлений на {time_str}")
         
         user_id = update.effective_user.id
-        session = SessionLocal()
+        session = AsyncSessionLocal()
         try:
-            user = session.query(User).filter(User.id == user_id).first()
+            user = await get_user(session, user_id)
             await update.message.reply_text(
                 f"✅ Время отправки изменено на {time_str}!\n\n"
                 f"Отчёты при начале фазы или подфазы будут приходить в это время.",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Назад в настройки", callback_data="notification_settings")]])
+                reply_markup=screens.BACK_TO_SETTINGS
             )
         finally:
-            session.close()
+            await session.close()
         return ConversationHandler.END
     except Exception as e:
         logger.error(f"Ошибка при изменении времени уведомлений: {e}")
@@ -1430,7 +1093,7 @@ async def change_notification_time(update: Update, context: ContextTypes.DEFAULT
         )
         return CHANGING_NOTIFICATION_TIME
     finally:
-        session.close()
+        await session.close()
 
 
 async def notification_settings(query, user: User, session):
@@ -1522,31 +1185,22 @@ def get_detailed_recommendations(phase_name: str, is_pms: bool) -> str:
         return recommendations.get(phase_name, recommendations['menstrual'])
 
 
-def generate_daily_notification(user: User) -> str:
+def generate_daily_notification(user: User, effective_len: int) -> str:
     """Генерация текста ежедневного уведомления по справочнику (phase_name + stage)."""
-    effective_len = effective_cycle_length_for_user(user)
-    calculator = CycleCalculator(
-        user.last_period_start,
-        effective_len,
-        user.period_length
-    )
-    cycle_data = calculate_menstrual_cycle(
-        effective_len, user.period_length, user.last_period_start
-    )
-    phase_name_en, stage = get_phase_and_stage_for_date(cycle_data, date.today())
+    snapshot = CycleSnapshot.at(user.last_period_start, effective_len, user.period_length, date.today())
+    phase_name_en, stage = snapshot.phase_day.phase_name, snapshot.phase_day.stage
     ref = get_reference_phase(phase_name_en, stage) if phase_name_en else {}
     
-    phase_info = calculator.get_current_phase()
-    current_day = phase_info['current_day']
-    phase = phase_info['phase']
-    days_left = phase_info['days_left_in_phase']
-    is_pms = phase_info['is_pms']
+    current_day = snapshot.current_day
+    phase = snapshot.phase
+    days_left = snapshot.days_left_in_phase
+    is_pms = snapshot.is_pms
     
-    next_period = calculator.get_next_period_date()
-    last_ovulation = calculator.get_last_ovulation_date()
-    next_ovulation = calculator.get_next_ovulation_date()
-    days_until_period = (next_period - date.today()).days
-    days_until_ovulation = (next_ovulation - date.today()).days
+    next_period = snapshot.next_period
+    last_ovulation = snapshot.last_ovulation
+    next_ovulation = snapshot.next_ovulation
+    days_until_period = snapshot.days_until_period
+    days_until_ovulation = snapshot.days_until_ovulation
     
     phase_title = (
         ref.get("subphase_name") or ref.get("phase_name_ru")
@@ -1563,7 +1217,7 @@ def generate_daily_notification(user: User) -> str:
     )
     
     if days_left > 0:
-        text += f" — день {phase_info['days_in_phase']}, осталось {days_left} дней\n"
+        text += f" — день {snapshot.days_in_phase}, осталось {days_left} дней\n"
     else:
         text += f" — последний день фазы\n"
     
@@ -1574,16 +1228,13 @@ def generate_daily_notification(user: User) -> str:
     )
     
     if ref:
-        symptoms = ref.get("symptoms", [])
-        behavior = ref.get("behavior", [])
-        recs = ref.get("male_recommendations", [])
-        if is_pms and not symptoms:
+        if is_pms and not ref["symptoms"]:
             text += f"\n⚠️ **ПМС: АКТИВЕН!**\n"
-        if symptoms:
-            text += f"\n📝 **Симптомы:**\n{_format_ref_block(symptoms)}\n\n"
-        if behavior:
-            text += f"👤 **Поведение:**\n{_format_ref_block(behavior)}\n\n"
-        text += f"💡 **Рекомендации для вас:**\n\n{_format_ref_block(recs)}"
+        if ref["symptoms"]:
+            text += f"\n📝 **Симптомы:**\n{ref['symptoms_md']}\n\n"
+        if ref["behavior"]:
+            text += f"👤 **Поведение:**\n{ref['behavior_md']}\n\n"
+        text += f"💡 **Рекомендации для вас:**\n\n{ref['male_recommendations_md']}"
     else:
         if is_pms:
             text += f"\n⚠️ **ПМС: АКТИВЕН!**\n📝 Симптомы: {phase.symptoms}\n\n"
@@ -1594,196 +1245,436 @@ def generate_daily_notification(user: User) -> str:
     return text
 
 
-def generate_notification_for_phase_stage(user: User, phase_name_en: str, stage: str = None) -> str:
-    """Текст отчёта для начала конкретной фазы/подфазы (для уведомлений при старте фазы/подфазы)."""
-    effective_len = effective_cycle_length_for_user(user)
-    calculator = CycleCalculator(
-        user.last_period_start,
-        effective_len,
-        user.period_length
-    )
+def _plural_days(n: int) -> str:
+    return 'день' if n == 1 else 'дня' if n < 5 else 'дней'
+
+
+@lru_cache(maxsize=config.RENDER_CACHE_SIZE)
+def _render_phase_stage_report(phase_name_en: str, stage, current_day: int, effective_len: int,
+                               period_len: int, user_date: date) -> tuple:
+    """
+    Общая для когорты часть отчёта о начале фазы/подфазы: (заголовок, тело).
+    Зависит только от фазы, дня цикла, длин цикла/менструации и местной даты события — у всех пользователей когорты одинакова,
+    поэтому кэшируется (LRU); персональная строка «Для: …» подставляется при каждой отправке.
+    Кэш сбрасывается при перезагрузке справочника фаз.
+    """
+    snapshot = CycleSnapshot.at(user_date - timedelta(days=current_day - 1), effective_len, period_len, user_date)
     ref = get_reference_phase(phase_name_en, stage)
-    phase_info = calculator.get_current_phase()
-    current_day = phase_info["current_day"]
-    next_period = calculator.get_next_period_date()
-    last_ovulation = calculator.get_last_ovulation_date()
-    next_ovulation = calculator.get_next_ovulation_date()
-    days_until_period = (next_period - date.today()).days
-    days_until_ovulation = (next_ovulation - date.today()).days
+    next_period, last_ovulation, next_ovulation = snapshot.next_period, snapshot.last_ovulation, snapshot.next_ovulation
+    days_until_period = snapshot.days_until_period
+    days_until_ovulation = snapshot.days_until_ovulation
     phase_title = ref.get("subphase_name") or ref.get("phase_name_ru") or phase_name_en
-    symptoms = ref.get("symptoms", [])
-    behavior = ref.get("behavior", [])
-    recs = ref.get("male_recommendations", [])
-    text = (
-        f"📊 **Отчёт: начало фазы/подфазы**\n\n"
-        f"👩 Для: {user.girlfriend_name}\n"
+    head = f"📊 **Отчёт: начало фазы/подфазы**\n\n"
+    body = (
         f"📅 Текущий день: {current_day} из {effective_len}\n\n"
         f"🌙 **Началась:** {phase_title}\n\n"
         f"💫 Овуляция была: {format_date_russian(last_ovulation)}\n"
-        f"💫 Следующая овуляция: {format_date_russian(next_ovulation)} (через {days_until_ovulation} {'день' if days_until_ovulation == 1 else 'дня' if days_until_ovulation < 5 else 'дней'})\n"
-        f"🩸 Менструация: {format_date_russian(next_period)} (через {days_until_period} {'день' if days_until_period == 1 else 'дня' if days_until_period < 5 else 'дней'})\n\n"
+        f"💫 Следующая овуляция: {format_date_russian(next_ovulation)} (через {days_until_ovulation} {_plural_days(days_until_ovulation)})\n"
+        f"🩸 Менструация: {format_date_russian(next_period)} (через {days_until_period} {_plural_days(days_until_period)})\n\n"
     )
-    if symptoms:
-        text += f"📝 **Симптомы:**\n{_format_ref_block(symptoms)}\n\n"
-    if behavior:
-        text += f"👤 **Поведение:**\n{_format_ref_block(behavior)}\n\n"
-    text += f"💡 **Рекомендации для вас:**\n\n{_format_ref_block(recs)}"
-    return text
+    if ref.get("symptoms"):
+        body += f"📝 **Симптомы:**\n{ref['symptoms_md']}\n\n"
+    if ref.get("behavior"):
+        body += f"👤 **Поведение:**\n{ref['behavior_md']}\n\n"
+    body += f"💡 **Рекомендации для вас:**\n\n{ref.get('male_recommendations_md', '')}"
+    return head, body
+
+
+PHASE_REFERENCE.on_reload(_render_phase_stage_report.cache_clear)
+
+
+def render_cache_stats() -> dict:
+    """Статистика кэша отчётов о начале фазы: попадания, промахи, доля попаданий, размер."""
+    info = _render_phase_stage_report.cache_info()
+    total = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": info.hits / total if total else 0.0,
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+    }
 
 
-async def send_daily_notifications(context: ContextTypes.DEFAULT_TYPE):
-    """Отправка уведомлений только при начале фазы или подфазы. В один день может быть несколько отчётов — закрепляется последнее."""
-    session = SessionLocal()
-    try:
-        users = session.query(User).filter(
-            User.notifications_enabled == True,
-            User.last_period_start.isnot(None)
-        ).all()
+def generate_notification_for_phase_stage(user: User, phase_name_en: str, stage: str,
+                                          effective_len: int, user_date: date) -> str:
+    """
+    Текст отчёта для начала конкретной фазы/подфазы (для уведомлений при старте фазы/подфазы).
+    user_date — местная дата пользователя, на которую наступило событие (а не дата сервера):
+    при догоняющем окне и у пользователей в других часовых поясах они различаются.
+    """
+    current_day = (user_date - user.last_period_start).days % effective_len + 1  # как CycleSnapshot.current_day
+    PHASE_REFERENCE.refresh()  # изменённый справочник сбрасывает кэш готовых отчётов
+    head, body = _render_phase_stage_report(
+        phase_name_en, stage, current_day, effective_len, user.period_length, user_date
+    )
+    return f"{head}👩 Для: {user.girlfriend_name}\n{body}"
+
+
+# Ключ позиции планировщика уведомлений в таблице scheduler_state
+SCHEDULER_CURSOR_KEY = "notifications"
+
+# Поля пользователя, нужные планировщику: тик читает лёгкие снимки строк вместо ORM-объектов
+SCHEDULER_USER_COLUMNS = (
+    User.id,
+    User.girlfriend_name,
+    User.cycle_length,
+    User.avg_cycle_length,
+    User.period_length,
+    User.last_period_start,
+    User.cycle_extended_days,
+    User.timezone,
+    User.notification_minute_utc,
+    User.notify_phase_start,
+    User.last_notification_date,
+    User.last_phase_advance_date,
+    User.days_with_notifications,
+)
+
+
+def _cycle_end_notification(user, user_date: date) -> dict:
+    """Напоминание о завершении цикла с кнопками обновления даты (запись для outbox)."""
+    cycle_end_text = (
+        f"🔄 **Цикл завершен!**\n\n"
+        f"👩 Для: {user.girlfriend_name}\n\n"
+        f"📅 Текущий цикл завершился. Необходимо обновить дату начала нового цикла.\n\n"
+        f"💡 **Важно:** Обязательно уточните у своей девушки, начался ли у неё новый цикл "
+        f"(началась ли менструация). Не обновляйте дату, если менструация еще не началась!\n\n"
+        f"Нажмите кнопку ниже, чтобы обновить дату начала нового цикла:"
+    )
+    return {
+        "user_id": user.id,
+        "kind": "cycle_end",
+        "idempotency_key": f"cycle_end:{user.id}:{user_date}",
+        "text": cycle_end_text,
+        "reply_markup": screens.CYCLE_END_KEYBOARD_JSON,
+        "parse_mode": "Markdown",
+    }
+
+
+def _user_event_dates(user, window: TickWindow) -> tuple:
+    """
+    Местные даты событий пользователя, наступивших внутри окна тика:
+    (дата минуты отчёта, дата напоминания о приближении фазы в 15:00); None — событие в окно не попало.
+    """
+    timezone_offset = get_timezone_offset(user)
+    due_at = window.occurrence_of_minute(user.notification_minute_utc)
+    advance_at = window.occurrence_of_local_time(timezone_offset, "15:00")
+    return (
+        local_datetime(due_at, timezone_offset).date() if due_at is not None else None,
+        local_datetime(advance_at, timezone_offset).date() if advance_at is not None else None,
+    )
+
+
+def _classify_chunk(chunk: list, effective_lengths: list, dates: list) -> list:
+    """Классификация дня цикла (CycleDay) для части пользователей одним пакетом; None там, где даты нет."""
+    batch = classify_cycle_days(
+        [user.last_period_start.toordinal() for user in chunk],
+        effective_lengths,
+        [user.period_length or 5 for user in chunk],
+        [user.cycle_extended_days or 0 for user in chunk],
+        [(day or user.last_period_start).toordinal() for user, day in zip(chunk, dates)],
+    )
+    return [cycle_day if day is not None else None for cycle_day, day in zip(cycle_days_from_batch(batch), dates)]
+
+
+def _plan_user_notifications(user, effective_len: int, due_date, due_day, advance_date, advance_day) -> tuple:
+    """
+    Решить, что отправить пользователю за окно тика (user — снимок строки users).
+    Каждое событие оценивается на местную дату, когда оно наступило внутри окна (см. _user_event_dates);
+    due_day / advance_day — классификация этих дат (CycleDay из classify_cycle_days).
+    Возвращает (changes, outbox_items): изменения полей пользователя и уведомления для outbox.
+    """
+    changes = {}
+    outbox_items = []
+    
+    if due_date is not None:
+        user_date = due_date
+        # Минута отчёта на сегодня пройдена — сдвигаем график на следующее начало фазы/подфазы
+        changes["next_stage_start_date"] = get_next_stage_start(
+            effective_len, user.period_length, user.last_period_start, user_date + timedelta(days=1)
+        )
         
-        for user in users:
-            try:
-                timezone_offset = get_timezone_offset(user)
-                msk_tz = pytz.timezone('Europe/Moscow')
-                msk_time = datetime.now(msk_tz)
-                user_time = msk_time + timedelta(hours=timezone_offset)
-                current_time = user_time.strftime('%H:%M')
-                user_date = user_time.date()
-                
-                if current_time == user.notification_time:
-                    effective_len = effective_cycle_length_for_user(user)
-                    cycle_data = calculate_menstrual_cycle(
-                        effective_len, user.period_length, user.last_period_start
-                    )
-                    starts_today = get_phase_subphase_starts_on_date(cycle_data, user_date)
-                    
-                    if not starts_today:
-                        continue
-                    if user.last_notification_date == user_date:
-                        continue
-                    
-                    # Открепляем предыдущее закреплённое сообщение
-                    if user.pinned_message_id:
-                        try:
-                            await context.bot.unpin_chat_message(
-                                chat_id=user.id,
-                                message_id=user.pinned_message_id
-                            )
-                        except Exception as e:
-                            logger.warning(f"Не удалось открепить сообщение для пользователя {user.id}: {e}")
-                        user.pinned_message_id = None
-                    
-                    sent_messages = []
-                    for phase_name_en, stage in starts_today:
-                        notification_text = generate_notification_for_phase_stage(user, phase_name_en, stage)
-                        msg = await context.bot.send_message(
-                            chat_id=user.id,
-                            text=notification_text,
-                            parse_mode='Markdown'
-                        )
-                        sent_messages.append(msg)
-                    
-                    if sent_messages:
-                        last_msg = sent_messages[-1]
-                        try:
-                            await context.bot.pin_chat_message(
-                                chat_id=user.id,
-                                message_id=last_msg.message_id,
-                                disable_notification=True
-                            )
-                            user.pinned_message_id = last_msg.message_id
-                        except Exception as e:
-                            logger.warning(f"Не удалось закрепить сообщение для пользователя {user.id}: {e}")
-                    
-                    user.last_notification_date = user_date
-                    user.days_with_notifications += 1
-                    session.commit()
-                
-                # Проверяем уведомления о приближении фазы (в 15:00)
-                # Отправляем отдельно от ежедневных уведомлений, только один раз в день
-                if current_time == "15:00" and user.notify_phase_start:
-                    # Проверяем, не отправляли ли уже уведомление о приближении фазы сегодня
-                    if not user.last_phase_advance_date or user.last_phase_advance_date != date.today():
-                        calculator = CycleCalculator(
-                            user.last_period_start,
-                            effective_cycle_length_for_user(user),
-                            user.period_length
-                        )
-                        next_phase_info = calculator.get_next_phase()
-                        
-                        if next_phase_info and next_phase_info['days_until'] == 2:
-                            phase = next_phase_info['phase']
-                            phase_start_date = next_phase_info['start_date']
-                            recommendations = get_detailed_recommendations(phase.name, False)
-                            
-                            phase_advance_text = (
-                                f"🔔 **Приближается новая фаза**\n\n"
-                                f"👩 Для: {user.girlfriend_name}\n\n"
-                                f"🌙 Через 2 дня начнется фаза: **{phase.name_ru}**\n"
-                                f"📅 Дата начала: {format_date_russian(phase_start_date)}\n\n"
-                                f"📝 **Что это значит:**\n{phase.description}\n\n"
-                                f"{recommendations}"
-                            )
-                            
-                            try:
-                                await context.bot.send_message(
-                                    chat_id=user.id,
-                                    text=phase_advance_text,
-                                    parse_mode='Markdown'
-                                )
-                                # Помечаем, что уведомление отправлено
-                                user.last_phase_advance_date = date.today()
-                                session.commit()
-                            except Exception as e:
-                                logger.error(f"Ошибка отправки уведомления о приближении фазы пользователю {user.id}: {e}")
+        if user.last_notification_date != user_date:
+            # Цикл считается завершённым, когда прошло >= (длина + продление) дней;
+            # напоминание об обновлении даты заменяет отчёт о начале фазы в этот день
+            if due_day.cycle_ended:
+                outbox_items.append(_cycle_end_notification(user, user_date))
+                changes["last_notification_date"] = user_date
+            elif due_day.starts_today:
+                starts_today = get_phase_day(
+                    effective_len, user.period_length, user.last_period_start, user_date
+                ).starts
+                for i, (phase_name_en, stage) in enumerate(starts_today):
+                    outbox_items.append({
+                        "user_id": user.id,
+                        "kind": "phase_start",
+                        "idempotency_key": f"phase_start:{user.id}:{user_date}:{phase_name_en}:{stage}",
+                        "text": generate_notification_for_phase_stage(
+                            user, phase_name_en, stage, effective_len, user_date
+                        ),
+                        "parse_mode": "Markdown",
+                        # Закрепляется последний отчёт дня
+                        "pin": i == len(starts_today) - 1,
+                    })
+                changes["last_notification_date"] = user_date
+                changes["days_with_notifications"] = (user.days_with_notifications or 0) + 1
+    
+    # Проверяем уведомления о приближении фазы (в 15:00)
+    # Отправляем отдельно от ежедневных уведомлений, только один раз в день
+    if advance_date is not None and user.notify_phase_start:
+        user_date = advance_date
+        # Проверяем, не отправляли ли уже уведомление о приближении фазы сегодня
+        if not user.last_phase_advance_date or user.last_phase_advance_date != user_date:
+            calculator = CycleCalculator(
+                user.last_period_start,
+                effective_len,
+                user.period_length
+            )
+            changes["next_phase_advance_date"] = calculator.get_phase_advance_date(
+                user_date + timedelta(days=1), PHASE_ADVANCE_DAYS
+            )
+            
+            if advance_day.next_phase >= 0 and advance_day.days_until_next_phase == PHASE_ADVANCE_DAYS:
+                phase = get_phase_catalogue()[advance_day.next_phase]
+                phase_start_date = user_date + timedelta(days=advance_day.days_until_next_phase)
+                recommendations = get_detailed_recommendations(phase.name, False)
                 
-                # Проверяем, завершился ли цикл (нужно обновить дату)
-                # Делаем это только если не отправляли ежедневное уведомление (чтобы не дублировать)
-                if current_time != user.notification_time:
-                    effective_len = effective_cycle_length_for_user(user)
-                    extended = getattr(user, 'cycle_extended_days', 0) or 0
-                    days_since_start = (user_date - user.last_period_start).days + 1
-                    # Цикл считается завершённым, когда прошло >= (длина + продление) дней
-                    if days_since_start >= effective_len + extended:
-                        if user.last_notification_date != user_date:
-                            cycle_end_text = (
-                                f"🔄 **Цикл завершен!**\n\n"
-                                f"👩 Для: {user.girlfriend_name}\n\n"
-                                f"📅 Текущий цикл завершился. Необходимо обновить дату начала нового цикла.\n\n"
-                                f"💡 **Важно:** Обязательно уточните у своей девушки, начался ли у неё новый цикл "
-                                f"(началась ли менструация). Не обновляйте дату, если менструация еще не началась!\n\n"
-                                f"Нажмите кнопку ниже, чтобы обновить дату начала нового цикла:"
-                            )
-                            keyboard = [
-                                [InlineKeyboardButton("📆 Обновить дату цикла / цикл закончился раньше", callback_data="update_cycle_choice")],
-                                [InlineKeyboardButton("⏳ Цикл не завершился вовремя", callback_data="cycle_not_ended_on_time")],
-                                [InlineKeyboardButton("🔙 Главное меню", callback_data="back_to_main")]
-                            ]
-                            
-                            try:
-                                await context.bot.send_message(
-                                    chat_id=user.id,
-                                    text=cycle_end_text,
-                                    reply_markup=InlineKeyboardMarkup(keyboard),
-                                    parse_mode='Markdown'
-                                )
-                                # Помечаем, что уведомление отправлено
-                                user.last_notification_date = user_date
-                                session.commit()
-                            except Exception as e:
-                                logger.error(f"Ошибка отправки уведомления о завершении цикла пользователю {user.id}: {e}")
+                phase_advance_text = (
+                    f"🔔 **Приближается новая фаза**\n\n"
+                    f"👩 Для: {user.girlfriend_name}\n\n"
+                    f"🌙 Через 2 дня начнется фаза: **{phase.name_ru}**\n"
+                    f"📅 Дата начала: {format_date_russian(phase_start_date)}\n\n"
+                    f"📝 **Что это значит:**\n{phase.description}\n\n"
+                    f"{recommendations}"
+                )
+                outbox_items.append({
+                    "user_id": user.id,
+                    "kind": "phase_advance",
+                    "idempotency_key": f"phase_advance:{user.id}:{user_date}",
+                    "text": phase_advance_text,
+                    "parse_mode": "Markdown",
+                })
+                # Помечаем, что уведомление поставлено в очередь
+                changes["last_phase_advance_date"] = user_date
+    
+    return changes, outbox_items
+
+
+def _scheduler_cursor_key(shard: int, shards: int) -> str:
+    """Ключ позиции шарда в scheduler_state (число шардов в ключе — после изменения позиции начинаются заново)."""
+    if shards == 1:
+        return SCHEDULER_CURSOR_KEY
+    return f"{SCHEDULER_CURSOR_KEY}:{shard}/{shards}"
+
+
+def _run_scheduler_shard(session, shard: int, shards: int) -> tuple:
+    """
+    Обработать окно тика для одного шарда пользователей (id % shards == shard).
+    Возвращает (пользователей, уведомлений в очереди).
+    """
+    cursor_key = _scheduler_cursor_key(shard, shards)
+    now_minute = datetime.now(pytz.utc).replace(second=0, microsecond=0)
+    window_end = now_minute + timedelta(minutes=1)
+    cursor = get_scheduler_cursor(session, cursor_key)
+    window_start = cursor.replace(tzinfo=pytz.utc) if cursor else now_minute
+    earliest_start = window_end - timedelta(minutes=min(config.SCHEDULER_MAX_CATCHUP_MINUTES, 1440))
+    if window_start < earliest_start:
+        logger.warning(
+            f"Планировщик (шард {shard}) отстал до {window_start:%Y-%m-%d %H:%M} UTC, "
+            f"догоняем только с {earliest_start:%Y-%m-%d %H:%M} UTC"
+        )
+        window_start = earliest_start
+    if window_start >= window_end:
+        return 0, 0
+    window = TickWindow(window_start, window_end)
+    if window.minutes > 1:
+        logger.info(f"Планировщик (шард {shard}): обработка пропущенных минут ({window.minutes}) одним пакетом")
+    
+    active = [User.notifications_enabled == True, User.last_period_start.isnot(None)]
+    if shards > 1:
+        active.append(User.id % shards == shard)
+    # Самая поздняя местная дата окна среди часовых поясов: события не позже неё уже наступили
+    latest_local_date = window.latest_local_date()
+    
+    # Отчёты при начале фазы/подфазы и напоминание о завершении цикла — в местное время отчёта:
+    # только те, у кого это время попадает в окно и по материализованному графику наступило
+    # начало фазы/подфазы или дата завершения цикла (cycle_end_date уже учитывает продление)
+    due_filter = or_(
+        User.next_stage_start_date <= latest_local_date,
+        User.cycle_end_date <= latest_local_date
+    )
+    window_minutes = window.minutes_of_day()
+    if window_minutes is not None:
+        due_filter = and_(User.notification_minute_utc.in_(window_minutes), due_filter)
+    # Напоминание о приближении фазы (15:00) — только пользователи из часовых поясов,
+    # где это время попало в окно, и с наступившим событием
+    cohort_filters = [due_filter]
+    advance_timezones = window.timezones_with_local_time("15:00")
+    if advance_timezones:
+        cohort_filters.append(and_(
+            User.timezone.in_(advance_timezones),
+            User.notify_phase_start == True,
+            User.next_phase_advance_date <= latest_local_date
+        ))
+    users = session.execute(
+        select(*SCHEDULER_USER_COLUMNS).where(*active, or_(*cohort_filters))
+    ).all()
+    
+    queued = 0
+    chunk_size = config.SCHEDULER_CHUNK_SIZE
+    for chunk_start in range(0, len(users), chunk_size):
+        chunk = users[chunk_start:chunk_start + chunk_size]
+        effective_lengths = [effective_cycle_length(user) for user in chunk]
+        event_dates = [_user_event_dates(user, window) for user in chunk]
+        # Фазы, начала фаз и завершение цикла на даты событий — одним пакетом на часть (NumPy, если установлен)
+        due_days = _classify_chunk(chunk, effective_lengths, [due for due, _ in event_dates])
+        advance_days = _classify_chunk(chunk, effective_lengths, [advance for _, advance in event_dates])
+        updates = []
+        outbox_items = []
+        for i, user in enumerate(chunk):
+            try:
+                changes, items = _plan_user_notifications(
+                    user, effective_lengths[i], event_dates[i][0], due_days[i], event_dates[i][1], advance_days[i]
+                )
             except Exception as e:
-                logger.error(f"Ошибка отправки уведомления пользователю {user.id}: {e}")
+                logger.error(f"Ошибка подготовки уведомления пользователю {user.id}: {e}")
+                continue
+            if changes:
+                updates.append({"id": user.id, **changes})
+            outbox_items.extend(items)
+        
+        # Уведомления, сдвиги графика и отметки об отправке сохраняются одной транзакцией на часть:
+        # после перезапуска ничего не теряется и не ставится в очередь повторно.
+        # Аренда продлевается в той же транзакции: если шард уже забрал другой процесс, часть не сохраняется
+        if not renew_lease(session, shard):
+            session.rollback()
+            logger.warning(f"Планировщик: аренда шарда {shard} потеряна, обработка остановлена")
+            return len(users), queued
+        if updates:
+            session.execute(update(User), updates)
+        queued += enqueue_notifications(session, outbox_items)
+        session.commit()
+    
+    # Позиция сохраняется, только если шард всё ещё за этим процессом
+    if not renew_lease(session, shard):
+        session.rollback()
+        logger.warning(f"Планировщик: аренда шарда {shard} потеряна, позиция не сохранена")
+        return len(users), queued
+    set_scheduler_cursor(session, cursor_key, window_end.replace(tzinfo=None))
+    session.commit()
+    return len(users), queued
+
+
+async def send_daily_notifications(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Планирование уведомлений: отчёты только при начале фазы или подфазы (в один день может быть несколько —
+    закрепляется последний), напоминание о приближении фазы и о завершении цикла.
+    Готовые тексты записываются в outbox вместе с отметками об отправке; доставляет их drain_outbox.
+    Пользователи читаются снимками, изменения пишутся пакетным UPDATE по частям (SCHEDULER_CHUNK_SIZE).
+    
+    Тик обрабатывает окно минут [позиция планировщика, текущая минута]: если предыдущий тик опоздал,
+    затянулся или бот перезапускался, пропущенные минуты (не более SCHEDULER_MAX_CATCHUP_MINUTES)
+    обрабатываются одним пакетом. Позиция сохраняется в БД вместе с последней частью.
+    
+    Пользователи разбиты на SCHEDULER_SHARDS шардов; процесс обрабатывает только шарды, арендованные
+    им в scheduler_leases (см. scheduler_leases.py), поэтому несколько реплик бота не дублируют рассылку.
+    Работа с БД выполняется в отдельном потоке, чтобы тик не задерживал обработку апдейтов.
+    """
+    shards = config.SCHEDULER_SHARDS
+    owned = await asyncio.to_thread(acquire_shards, shards)
+    if not owned:
+        return
+    users_total, queued, query_count = await asyncio.to_thread(_run_scheduler_tick, owned, shards)
+    
+    cache = render_cache_stats()
+    logger.info(
+        f"Тик планировщика (шарды {owned} из {shards}): пользователей {users_total}, "
+        f"в очередь {queued}, SQL-запросов {query_count}, "
+        f"кэш отчётов: {cache['hit_rate']:.0%} попаданий ({cache['hits']}/{cache['hits'] + cache['misses']})"
+    )
+    if queued:
+        # Если периодическая отправка уже идёт, этот запуск пропускается (одна отправка на процесс)
+        context.job_queue.run_once(drain_outbox, 0)
+
+
+def _run_scheduler_tick(owned: list, shards: int) -> tuple:
+    """Синхронная часть тика (в отдельном потоке): обработать арендованные шарды. Возвращает (пользователей, в очередь, SQL-запросов)."""
+    session = SessionLocal()
+    try:
+        users_total = 0
+        queued = 0
+        with QueryCounter(session) as queries:
+            for shard in owned:
+                users_count, shard_queued = _run_scheduler_shard(session, shard, shards)
+                users_total += users_count
+                queued += shard_queued
+        return users_total, queued, queries.count
     finally:
         session.close()
 
 
-def main():
-    """Главная функция запуска бота"""
-    # Инициализация базы данных
-    init_db()
+def build_callback_router() -> CallbackRouter:
+    """Таблица кнопок: callback_data → обработчик. Справочные экраны не загружают пользователя из БД."""
+    router = CallbackRouter(AsyncSessionLocal, get_user)
+    # Главное меню и заполнение данных
+    router.add("start_data_collection", confirm_or_start_data_collection)
+    router.add("confirm_refill_data", confirm_refill_data)
+    router.add("cancel_refill_data", show_main_menu)
+    router.add("fill_later", fill_later)
+    router.add("back_to_main", show_main_screen)
+    router.add("profile", show_profile)
+    # Уведомления
+    router.add("notification_settings", notification_settings)
+    router.add("toggle_daily", toggle_daily_notifications)
+    router.add("toggle_phase_start", toggle_phase_start_notifications)
+    # Обновление цикла (update_cycle_date и cycle_ended_earlier начинают диалоги в ConversationHandler)
+    router.add("update_cycle_choice", show_update_cycle_choice, needs_user=False)
+    router.add("update_cycle_date", handled_by_conversation, needs_user=False)
+    router.add("cycle_ended_earlier", handled_by_conversation, needs_user=False)
+    router.add("cycle_not_ended_on_time", extend_cycle)
+    # Справочник
+    router.add("cycle_info", show_cycle_info, needs_user=False)
+    router.add("phase_info_{phase_name}", show_phase_details, needs_user=False, phase_name=PHASE_CALLBACK_TO_EN)
+    router.add(
+        "phase_subphase_{phase_name}_{stage}", show_phase_details, needs_user=False,
+        phase_name=PHASE_CALLBACK_TO_EN, stage=("early", "mid", "late"),
+    )
+    router.add("terms_list", show_terms_list, needs_user=False)
+    router.add("term_info_{term}", show_term_info, needs_user=False, term=screens.TERMS)
+    # Тестовые кнопки администратора
+    router.add("admin_test_daily", admin_test_daily)
+    router.add("admin_test_phase", admin_test_phase)
+    router.add("admin_test_cycle", admin_test_cycle)
+    return router
+
+
+CALLBACK_ROUTER = build_callback_router()
+
+
+async def log_callback_metrics(context: ContextTypes.DEFAULT_TYPE):
+    """Периодически писать в лог статистику кнопок (вызовы и задержки по маршрутам)."""
+    report = CALLBACK_ROUTER.report()
+    if report:
+        logger.info(f"Кнопки с запуска бота:\n{report}")
+
+
+def build_application(request=None) -> Application:
+    """
+    Собрать приложение: обработчики и задания планировщика. request — свой транспорт запросов к Bot API
+    (telegram.request.BaseRequest, например заглушка в нагрузочных тестах); по умолчанию HTTPX.
+    """
+    # При остановке отдаём шарды планировщика, чтобы другие реплики забрали их без ожидания TTL
+    async def release_scheduler_leases(application: Application):
+        release_all()
     
-    # Создание приложения
-    application = Application.builder().token(config.BOT_TOKEN).build()
+    builder = Application.builder().token(config.BOT_TOKEN).post_shutdown(release_scheduler_leases)
+    if config.UPDATE_CONCURRENCY > 1:
+        # Разные пользователи — параллельно, апдейты одного пользователя — по очереди (диалоги не путаются)
+        builder = builder.concurrent_updates(PerUserUpdateProcessor(config.UPDATE_CONCURRENCY))
+    if request is not None:
+        builder = builder.request(request)
+    application = builder.build()
     
     # Обработчик команды /start
     application.add_handler(CommandHandler("start", start))
@@ -1811,7 +1702,7 @@ def main():
             timezone=0
         )
         
-        notification_text = generate_daily_notification(test_user)
+        notification_text = generate_daily_notification(test_user, effective_cycle_length(test_user))
         await update.message.reply_text(notification_text, parse_mode='Markdown')
     
     async def test_phase_advance(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -1883,15 +1774,9 @@ def main():
             f"Нажмите кнопку ниже, чтобы обновить дату начала нового цикла:"
         )
         
-        keyboard = [
-            [InlineKeyboardButton("📆 Обновить дату цикла / цикл закончился раньше", callback_data="update_cycle_choice")],
-            [InlineKeyboardButton("⏳ Цикл не завершился вовремя", callback_data="cycle_not_ended_on_time")],
-            [InlineKeyboardButton("🔙 Главное меню", callback_data="back_to_main")]
-        ]
-        
         await update.message.reply_text(
             cycle_end_text,
-            reply_markup=InlineKeyboardMarkup(keyboard),
+            reply_markup=screens.CYCLE_END_KEYBOARD,
             parse_mode='Markdown'
         )
     
@@ -1930,46 +1815,35 @@ def main():
         """Обработчик для начала обновления даты цикла"""
         query = update.callback_query
         user_id = query.from_user.id
-        session = SessionLocal()
+        session = AsyncSessionLocal()
         try:
-            user = session.query(User).filter(User.id == user_id).first()
+            user = await get_user(session, user_id)
             return await start_update_cycle_date(query, user, session)
         finally:
-            session.close()
+            await session.close()
 
     async def start_cycle_ended_earlier_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик для «Цикл закончился раньше»"""
         query = update.callback_query
         user_id = query.from_user.id
-        session = SessionLocal()
+        session = AsyncSessionLocal()
         try:
-            user = session.query(User).filter(User.id == user_id).first()
+            user = await get_user(session, user_id)
             return await start_cycle_ended_earlier(query, user, session)
         finally:
-            session.close()
+            await session.close()
 
     async def back_to_main_from_update_cycle(update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Выход из диалога обновления даты и возврат в главное меню"""
         query = update.callback_query
         await query.answer()
         user_id = query.from_user.id
-        session = SessionLocal()
+        session = AsyncSessionLocal()
         try:
-            user = session.query(User).filter(User.id == user_id).first()
-            await query.edit_message_text(
-                "👋 Привет! Добро пожаловать в бот для отслеживания менструального цикла.\n\n"
-            "Этот бот создан специально для мужчин, которые хотят лучше понимать и поддерживать "
-            "свою девушку в разные периоды её цикла. 💕\n\n"
-            "Бот поможет вам:\n"
-            "📊 Отслеживать текущую фазу цикла\n"
-            "🔔 Получать отчёты при смене фазы и подфазы\n"
-            "💡 Получать рекомендации, как лучше поддержать партнершу\n"
-            "📚 Изучать информацию о фазах цикла\n\n"
-            "Помните: ваша забота и внимание - это проявление любви и уважения! ❤️",
-                reply_markup=get_main_menu(user)
-            )
+            user = await get_user(session, user_id)
+            await get_main_screen(user).edit(query)
         finally:
-            session.close()
+            await session.close()
         return ConversationHandler.END
 
     cycle_update_handler = ConversationHandler(
@@ -2027,14 +1901,55 @@ def main():
     # Планировщик для ежедневных уведомлений (проверка каждую минуту)
     job_queue = application.job_queue
     if job_queue:
-        job_queue.run_repeating(send_daily_notifications, interval=60, first=10)  # Каждую минуту
+        # Каждую минуту; опоздавшие/пропущенные запуски не копятся — следующий тик догонит окно целиком
+        job_queue.run_repeating(
+            send_daily_notifications, interval=60, first=10,
+            job_kwargs={"coalesce": True, "max_instances": 1, "misfire_grace_time": None}
+        )
+        # Отправка из outbox: после перезапуска продолжается с того места, где остановилась
+        job_queue.run_repeating(drain_outbox, interval=config.OUTBOX_POLL_INTERVAL, first=1)
+        if config.CALLBACK_METRICS_LOG_INTERVAL > 0:
+            job_queue.run_repeating(
+                log_callback_metrics, interval=config.CALLBACK_METRICS_LOG_INTERVAL, first=config.CALLBACK_METRICS_LOG_INTERVAL
+            )
         logger.info("Планировщик уведомлений запущен")
     else:
         logger.warning("JobQueue не доступен. Уведомления не будут работать. Установите: pip install 'python-telegram-bot[job-queue]'")
     
-    # Запуск бота
-    logger.info("Бот запущен")
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    return application
+
+
+def run_webhook(application: Application):
+    """
+    Приём апдейтов через вебхук: встроенный HTTP-сервер python-telegram-bot (extra webhooks) слушает
+    WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH, регистрирует WEBHOOK_URL в Telegram и принимает только запросы
+    с заголовком X-Telegram-Bot-Api-Secret-Token, равным WEBHOOK_SECRET_TOKEN. TLS — на обратном прокси.
+    """
+    if not config.WEBHOOK_URL or not config.WEBHOOK_SECRET_TOKEN:
+        raise RuntimeError("Для режима webhook задайте WEBHOOK_URL и WEBHOOK_SECRET_TOKEN")
+    application.run_webhook(
+        listen=config.WEBHOOK_LISTEN,
+        port=config.WEBHOOK_PORT,
+        url_path=config.WEBHOOK_PATH,
+        webhook_url=f"{config.WEBHOOK_URL.rstrip('/')}/{config.WEBHOOK_PATH}",
+        secret_token=config.WEBHOOK_SECRET_TOKEN,
+        allowed_updates=Update.ALL_TYPES,
+    )
+
+
+def main():
+    """Главная функция запуска бота"""
+    # Инициализация базы данных
+    init_db()
+    
+    application = build_application()
+    
+    # Запуск бота: long polling или вебхук (BOT_UPDATE_MODE)
+    logger.info(f"Бот запущен (приём апдейтов: {config.BOT_UPDATE_MODE})")
+    if config.BOT_UPDATE_MODE == "webhook":
+        run_webhook(application)
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 if __name__ == '__main__':
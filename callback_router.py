@@ -0,0 +1,130 @@
+"""
+Маршрутизация нажатий на inline-кнопки (callback_data) по таблице маршрутов.
+
+Шаблон с параметрами ("phase_info_{phase_name}") при регистрации разворачивается по перечисленным значениям
+в точные строки callback_data, поэтому выбор обработчика — один поиск в словаре. Маршрут объявляет, нужна ли
+ему строка пользователя: сессия БД открывается и User загружается только для таких маршрутов.
+По каждому маршруту (шаблону) копятся число вызовов, ошибок и гистограмма задержек.
+"""
+import bisect
+import itertools
+import string
+import time
+from typing import NamedTuple
+
+# Верхние границы корзин гистограммы задержек, мс (последняя корзина — всё, что дольше)
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class RouteStats:
+    """Вызовы, ошибки и гистограмма задержек одного маршрута."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, elapsed_ms: float, failed: bool = False):
+        self.calls += 1
+        self.errors += failed
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS_MS, elapsed_ms)] += 1
+
+    @property
+    def mean_ms(self) -> float:
+        return self.total_ms / self.calls if self.calls else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Оценка сверху q-квантили задержки (мс): граница корзины, в которую она попадает."""
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def __str__(self):
+        return (
+            f"вызовов {self.calls} (ошибок {self.errors}), среднее {self.mean_ms:.1f} мс, "
+            f"p50 ≤ {self.quantile(0.5):.1f} мс, p95 ≤ {self.quantile(0.95):.1f} мс, max {self.max_ms:.1f} мс"
+        )
+
+
+class Route(NamedTuple):
+    pattern: str  # шаблон, под которым копится статистика
+    handler: object
+    needs_user: bool
+    params: dict
+
+
+class CallbackRouter:
+    """
+    Таблица маршрутов callback_data → обработчик.
+    Обработчик маршрута с needs_user вызывается как handler(query, user, session, **params),
+    без него — handler(query, **params).
+    """
+
+    def __init__(self, session_factory, load_user):
+        self._session_factory = session_factory
+        self._load_user = load_user  # async (session, user_id) -> User
+        self._routes = {}
+        self.stats = {}
+        self.unmatched = 0
+
+    def add(self, pattern: str, handler, needs_user: bool = True, **choices):
+        """
+        Зарегистрировать маршрут. Для каждого параметра шаблона передаётся перечень допустимых значений:
+        add("term_info_{term}", show_term_info, needs_user=False, term=("pms", "cycle")).
+        """
+        fields = [field for _, field, _, _ in string.Formatter().parse(pattern) if field]
+        if set(fields) != set(choices):
+            raise ValueError(f"Параметры маршрута {pattern}: нужны значения для {fields}, переданы {sorted(choices)}")
+        for values in itertools.product(*(choices[field] for field in fields)):
+            params = dict(zip(fields, values))
+            data = pattern.format(**params)
+            if data in self._routes:
+                raise ValueError(f"callback_data {data} уже занята маршрутом {self._routes[data].pattern}")
+            self._routes[data] = Route(pattern, handler, needs_user, params)
+        self.stats.setdefault(pattern, RouteStats())
+
+    def resolve(self, data: str):
+        """Маршрут для callback_data или None."""
+        return self._routes.get(data)
+
+    async def dispatch(self, query) -> bool:
+        """Вызвать обработчик маршрута для query.data. False — маршрута нет."""
+        route = self._routes.get(query.data)
+        if route is None:
+            self.unmatched += 1
+            return False
+        started = time.perf_counter()
+        failed = True
+        try:
+            if route.needs_user:
+                session = self._session_factory()
+                try:
+                    user = await self._load_user(session, query.from_user.id)
+                    await route.handler(query, user, session, **route.params)
+                finally:
+                    await session.close()
+            else:
+                await route.handler(query, **route.params)
+            failed = False
+        finally:
+            self.stats[route.pattern].observe((time.perf_counter() - started) * 1000, failed)
+        return True
+
+    def report(self) -> str:
+        """Статистика маршрутов, у которых были вызовы (по убыванию числа вызовов)."""
+        lines = [
+            f"{pattern}: {stats}"
+            for pattern, stats in sorted(self.stats.items(), key=lambda item: -item[1].calls)
+            if stats.calls
+        ]
+        if self.unmatched:
+            lines.append(f"без маршрута: {self.unmatched}")
+        return "\n".join(lines)
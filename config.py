@@ -9,6 +9,18 @@ load_dotenv()
 # Токен бота Telegram
 BOT_TOKEN = os.getenv('BOT_TOKEN', '8234150758:AAESo5iQwGlP7QACGqIc4KJL4wOFmzdjLwE')
 
+# Приём апдейтов: polling (long polling) или webhook (встроенный HTTP-сервер, нужен extra webhooks)
+BOT_UPDATE_MODE = os.getenv('BOT_UPDATE_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')  # публичный HTTPS-адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')  # путь вебхука на сервере и в WEBHOOK_URL
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_SECRET_TOKEN = os.getenv('WEBHOOK_SECRET_TOKEN', '')  # 1–256 символов A-Z, a-z, 0-9, _ и -
+
+# Сколько апдейтов обрабатывать одновременно (разные пользователи параллельно, один пользователь — по очереди);
+# по умолчанию 1 — последовательно, как раньше; параллельная обработка включается явно
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '1'))
+
 # Настройки базы данных
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///menstrual_tracker.db')
 
@@ -17,3 +29,41 @@ DEFAULT_TIMEZONE = os.getenv('DEFAULT_TIMEZONE', 'Europe/Moscow')
 
 # Время отправки уведомлений по умолчанию (часы:минуты)
 DEFAULT_NOTIFICATION_TIME = os.getenv('DEFAULT_NOTIFICATION_TIME', '09:00')
+
+# Рассылка уведомлений: число параллельных воркеров и лимиты Telegram
+NOTIFICATION_WORKERS = int(os.getenv('NOTIFICATION_WORKERS', '16'))
+TELEGRAM_GLOBAL_RATE = float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))  # сообщений в секунду на бота
+TELEGRAM_PER_CHAT_INTERVAL = float(os.getenv('TELEGRAM_PER_CHAT_INTERVAL', '1.0'))  # секунд между сообщениями в один чат
+
+# Очередь исходящих уведомлений (outbox)
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '5'))  # секунд между проверками очереди
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', '500'))  # записей за одну выборку
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_RETRY_BASE_DELAY = float(os.getenv('OUTBOX_RETRY_BASE_DELAY', '30'))  # секунд до первого повтора
+OUTBOX_RETRY_MAX_DELAY = float(os.getenv('OUTBOX_RETRY_MAX_DELAY', '3600'))
+OUTBOX_CLAIM_TIMEOUT = float(os.getenv('OUTBOX_CLAIM_TIMEOUT', '300'))  # секунд до возврата «зависшей» отправки
+OUTBOX_TTL_HOURS = float(os.getenv('OUTBOX_TTL_HOURS', '24'))  # старше — не отправляется
+
+# Планировщик: пользователей в одной части тика (одна транзакция с пакетным UPDATE)
+SCHEDULER_CHUNK_SIZE = int(os.getenv('SCHEDULER_CHUNK_SIZE', '1000'))
+SCHEDULER_MAX_CATCHUP_MINUTES = int(os.getenv('SCHEDULER_MAX_CATCHUP_MINUTES', '1440'))  # не более суток
+
+# Шардирование планировщика между репликами бота (аренды шардов в БД)
+SCHEDULER_SHARDS = int(os.getenv('SCHEDULER_SHARDS', '1'))  # число шардов пользователей (id % shards); не меньше числа реплик
+SCHEDULER_LEASE_TTL = float(os.getenv('SCHEDULER_LEASE_TTL', '180'))  # секунд без продления до передачи шарда другой реплике
+SCHEDULER_WORKER_ID = os.getenv('SCHEDULER_WORKER_ID', '')  # по умолчанию hostname:pid
+
+# Кэш общих частей отчётов о начале фазы (LRU, записей)
+RENDER_CACHE_SIZE = int(os.getenv('RENDER_CACHE_SIZE', '4096'))
+
+# Как часто (секунд) проверять, не изменился ли data/phase_reference.json (перезагрузка без перезапуска)
+PHASE_REFERENCE_CHECK_INTERVAL = float(os.getenv('PHASE_REFERENCE_CHECK_INTERVAL', '5'))
+
+# Вес последнего цикла в экспоненциальном среднем длительности (прогноз следующего цикла)
+CYCLE_LENGTH_EWMA_ALPHA = float(os.getenv('CYCLE_LENGTH_EWMA_ALPHA', '0.4'))
+
+# Размер пачки строк при заполнении новых столбцов в миграциях (migrations.py)
+MIGRATION_BATCH_SIZE = int(os.getenv('MIGRATION_BATCH_SIZE', '1000'))
+
+# Как часто (секунд) писать в лог статистику нажатий на кнопки по маршрутам; 0 — не писать
+CALLBACK_METRICS_LOG_INTERVAL = float(os.getenv('CALLBACK_METRICS_LOG_INTERVAL', '3600'))
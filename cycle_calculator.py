@@ -2,9 +2,18 @@
 Калькулятор менструального цикла — расчёт по menstrual_cycle_guide.md.
 Возвращает полную структуру cycle_info + phases с подфазами.
 """
+import struct
+from bisect import bisect_left, bisect_right
 from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import NamedTuple
 from database import SessionLocal, CyclePhase
 
+try:
+    import numpy as np
+except ImportError:  # NumPy не обязателен: без него classify_cycle_days считает поэлементно
+    np = None
+
 
 def _to_date(d):
     """Привести к date (из datetime или str YYYY-MM-DD)."""
@@ -13,10 +22,24 @@ def _to_date(d):
     if isinstance(d, datetime):
         return d.date()
     if isinstance(d, str):
-        return datetime.strptime(d, "%Y-%m-%d").date()
+        # Даты в cycle_data — всегда date.isoformat(); fromisoformat в десятки раз быстрее strptime
+        return date.fromisoformat(d)
     return d
 
 
+def phase_lengths(cycle_length: int, menstruation_length: int) -> tuple:
+    """
+    (follicular_length, luteal_length) по menstrual_cycle_guide.md: лютеиновая — 12 дней,
+    но фолликулярная не короче 5 (тогда лютеиновая сокращается, но не меньше 10).
+    """
+    luteal_length = 12
+    follicular_length = cycle_length - menstruation_length - luteal_length
+    if follicular_length < 5:
+        luteal_length = max(10, cycle_length - menstruation_length - 5)
+        follicular_length = cycle_length - menstruation_length - luteal_length
+    return follicular_length, luteal_length
+
+
 def calculate_menstrual_cycle(cycle_length: int, menstruation_length: int, last_period_start) -> dict:
     """
     Расчёт всех фаз менструального цикла по menstrual_cycle_guide.md.
@@ -28,6 +51,7 @@ def calculate_menstrual_cycle(cycle_length: int, menstruation_length: int, last_
     
     Returns:
         dict: cycle_info + phases (Menstrual, Follicular, Ovulation, Luteal) с subphases
+              + boundaries (границы фаз в порядковых номерах дат, см. phase_boundaries)
     """
     d0 = _to_date(last_period_start)
     if isinstance(d0, date) and not isinstance(d0, datetime):
@@ -35,11 +59,7 @@ def calculate_menstrual_cycle(cycle_length: int, menstruation_length: int, last_
     else:
         base = d0 if isinstance(d0, datetime) else datetime.combine(d0, datetime.min.time())
     
-    luteal_length = 12
-    follicular_length = cycle_length - menstruation_length - luteal_length
-    if follicular_length < 5:
-        luteal_length = max(10, cycle_length - menstruation_length - 5)
-        follicular_length = cycle_length - menstruation_length - luteal_length
+    follicular_length, luteal_length = phase_lengths(cycle_length, menstruation_length)
     
     ovulation_date = base + timedelta(days=menstruation_length + follicular_length - 1)
     cycle_end_date = base + timedelta(days=cycle_length - 1)
@@ -120,31 +140,68 @@ def calculate_menstrual_cycle(cycle_length: int, menstruation_length: int, last_
         ]
     })
     
+    result["boundaries"] = phase_boundaries(result["phases"])
     return result
 
 
+def phase_boundaries(phases: list) -> dict:
+    """
+    Индекс фаз для поиска по дате: ordinals — отсортированные порядковые номера дат (date.toordinal()),
+    на которых меняется фаза/подфаза; phases[i] — [phase_name, stage] для дат [ordinals[i], ordinals[i + 1])
+    (первая подходящая подфаза в порядке phases, [None, None] — вне фаз); starts[i] — [phase_name, stage],
+    начинающиеся в ordinals[i]. Только списки и числа — индекс сериализуется в JSON вместе с cycle_data.
+    """
+    ranges = [
+        (ph["phase_name"], sub.get("stage"), _to_date(sub["start_date"]).toordinal(), _to_date(sub["end_date"]).toordinal())
+        for ph in phases
+        for sub in ph.get("subphases", [ph])
+    ]
+    base = min((start for _, _, start, _ in ranges), default=0)
+    layout = tuple((name, stage, start - base, end - base) for name, stage, start, end in ranges)
+    relative = _relative_boundaries.get(layout)
+    if relative is None:
+        relative = _relative_boundaries[layout] = _layout_boundaries(layout)
+    offsets, labels, starts = relative
+    return {"ordinals": [base + offset for offset in offsets], "phases": list(labels), "starts": list(starts)}
+
+
+# Индекс границ по смещениям от начала первой фазы: раскладок (длина цикла × длина менструации) немного,
+# поэтому индекс строится один раз на раскладку и лишь сдвигается на дату начала цикла
+_relative_boundaries = {}
+
+
+def _layout_boundaries(layout: tuple) -> tuple:
+    offsets = sorted({start for _, _, start, _ in layout} | {end + 1 for _, _, _, end in layout})
+    labels = []
+    starts = []
+    for point in offsets:
+        match = next(([name, stage] for name, stage, start, end in layout if start <= point <= end), [None, None])
+        labels.append(match)
+        starts.append([[name, stage] for name, stage, start, _ in layout if start == point])
+    return offsets, labels, starts
+
+
+def _boundaries(cycle_data: dict) -> dict:
+    # Записи истории индекса не содержат (JSON до его появления и упакованные смещения): он строится
+    # при первом поиске по дате и остаётся в cycle_data для следующих
+    boundaries = cycle_data.get("boundaries")
+    if boundaries is None:
+        boundaries = cycle_data["boundaries"] = phase_boundaries(cycle_data.get("phases", []))
+    return boundaries
+
+
 def get_phase_and_stage_for_date(cycle_data: dict, target_date) -> tuple:
     """
     Для даты target_date (date или str YYYY-MM-DD) вернуть (phase_name, stage).
     phase_name — из cycle_data (Menstrual Phase, Follicular Phase, Ovulation, Luteal Phase).
     stage — "early" | "mid" | "late" для фаз с подфазами, None для Ovulation.
     """
-    if hasattr(target_date, 'strftime'):
-        d_str = target_date.strftime("%Y-%m-%d")
-    else:
-        d_str = str(target_date)
-    
-    for ph in cycle_data.get("phases", []):
-        if "subphases" in ph:
-            for sub in ph["subphases"]:
-                start, end = sub["start_date"], sub["end_date"]
-                if start <= d_str <= end:
-                    return (ph["phase_name"], sub["stage"])
-        else:
-            start, end = ph["start_date"], ph["end_date"]
-            if start <= d_str <= end:
-                return (ph["phase_name"], None)
-    return (None, None)
+    boundaries = _boundaries(cycle_data)
+    i = bisect_right(boundaries["ordinals"], _to_date(target_date).toordinal()) - 1
+    if i < 0:
+        return (None, None)
+    phase_name, stage = boundaries["phases"][i]
+    return (phase_name, stage)
 
 
 def get_phase_subphase_starts_on_date(cycle_data: dict, target_date) -> list:
@@ -152,22 +209,514 @@ def get_phase_subphase_starts_on_date(cycle_data: dict, target_date) -> list:
     Список (phase_name, stage), у которых start_date совпадает с target_date.
     stage — "early"|"mid"|"late" для подфаз, None для фазы Овуляция.
     """
-    if hasattr(target_date, 'strftime'):
-        d_str = target_date.strftime("%Y-%m-%d")
-    else:
-        d_str = str(target_date)
-    result = []
-    for ph in cycle_data.get("phases", []):
-        if "subphases" in ph:
-            for sub in ph["subphases"]:
-                if sub.get("start_date") == d_str:
-                    result.append((ph["phase_name"], sub["stage"]))
+    boundaries = _boundaries(cycle_data)
+    ordinals = boundaries["ordinals"]
+    target = _to_date(target_date).toordinal()
+    i = bisect_left(ordinals, target)
+    if i == len(ordinals) or ordinals[i] != target:
+        return []
+    return [(phase_name, stage) for phase_name, stage in boundaries["starts"][i]]
+
+
+class PhaseDay(NamedTuple):
+    """День раскладки фаз: фаза/подфаза (первая подходящая, как в get_phase_and_stage_for_date) и начала фаз в этот день."""
+    phase_name: str  # None — день вне рассчитанного цикла
+    stage: str
+    days_in: int  # какой по счёту день фазы/подфазы (с 1)
+    days_left: int  # сколько дней фазы/подфазы осталось после этого
+    starts: tuple  # (phase_name, stage), начинающиеся в этот день (как get_phase_subphase_starts_on_date)
+
+
+NO_PHASE_DAY = PhaseDay(None, None, None, None, ())
+
+# Раскладка фаз зависит только от длины цикла и длительности менструации, а фаза даты — только от
+# смещения в днях от начала цикла. Поэтому для допустимых значений (цикл 21–35, менструация 1–10)
+# все раскладки строятся один раз при импорте; остальные — при первом обращении.
+PHASE_LAYOUT_CYCLE_LENGTHS = range(21, 36)
+PHASE_LAYOUT_PERIOD_LENGTHS = range(1, 11)
+_LAYOUT_ANCHOR = date(2000, 1, 1)
+
+
+def _build_phase_layout(cycle_length: int, period_length: int) -> tuple:
+    """Раскладка фаз: PhaseDay для каждого смещения от начала цикла (0 — первый день)."""
+    cycle_data = calculate_menstrual_cycle(cycle_length, period_length, _LAYOUT_ANCHOR)
+    anchor = _LAYOUT_ANCHOR.toordinal()
+    ranges = []
+    for ph in cycle_data["phases"]:
+        for sub in ph.get("subphases", [ph]):
+            ranges.append((
+                ph["phase_name"], sub.get("stage"),
+                _to_date(sub["start_date"]).toordinal() - anchor,
+                _to_date(sub["end_date"]).toordinal() - anchor,
+            ))
+    layout = []
+    for offset in range(max(end for _, _, _, end in ranges) + 1):
+        starts = tuple((name, stage) for name, stage, start, _ in ranges if start == offset)
+        match = next(((name, stage, start, end) for name, stage, start, end in ranges if start <= offset <= end), None)
+        if match is None:
+            layout.append(PhaseDay(None, None, None, None, starts))
+        else:
+            name, stage, start, end = match
+            layout.append(PhaseDay(name, stage, offset - start + 1, end - offset, starts))
+    return tuple(layout)
+
+
+PHASE_LAYOUTS = {
+    (cycle_length, period_length): _build_phase_layout(cycle_length, period_length)
+    for cycle_length in PHASE_LAYOUT_CYCLE_LENGTHS
+    for period_length in PHASE_LAYOUT_PERIOD_LENGTHS
+}
+
+
+def get_phase_layout(cycle_length: int, period_length: int) -> tuple:
+    """Раскладка фаз из PHASE_LAYOUTS (нестандартные значения рассчитываются и запоминаются)."""
+    key = (cycle_length, period_length)
+    layout = PHASE_LAYOUTS.get(key)
+    if layout is None:
+        layout = PHASE_LAYOUTS.setdefault(key, _build_phase_layout(cycle_length, period_length))
+    return layout
+
+
+def get_phase_day(cycle_length: int, period_length: int, cycle_start: date, target_date: date) -> PhaseDay:
+    """
+    Фаза/подфаза на дату target_date для цикла, начавшегося cycle_start: то же, что
+    get_phase_and_stage_for_date и get_phase_subphase_starts_on_date по calculate_menstrual_cycle, но без расчёта цикла.
+    """
+    layout = get_phase_layout(cycle_length, period_length)
+    offset = target_date.toordinal() - cycle_start.toordinal()
+    if 0 <= offset < len(layout):
+        return layout[offset]
+    return NO_PHASE_DAY
+
+
+def get_next_stage_start(cycle_length: int, period_length: int, cycle_start: date, from_date: date):
+    """Ближайшая дата начала фазы/подфазы (>= from_date) в цикле, начавшемся cycle_start, или None."""
+    layout = get_phase_layout(cycle_length, period_length)
+    for offset in range(max(0, from_date.toordinal() - cycle_start.toordinal()), len(layout)):
+        if layout[offset].starts:
+            return cycle_start + timedelta(days=offset)
+    return None
+
+
+# Прогноз на несколько циклов вперёд: циклы повторяются с шагом cycle_length от last_period_start,
+# фазы каждого берутся из той же раскладки. Генераторы бесконечны — вызывающий берёт сколько нужно
+# (itertools.islice / takewhile), ничего не рассчитывается заранее.
+class CycleForecast(NamedTuple):
+    """Прогноз одного цикла (даты — как в cycle_info у calculate_menstrual_cycle)."""
+    number: int  # 0 — цикл, в который попадает from_date, дальше 1, 2, ...
+    start: date
+    period_end: date  # последний день менструации
+    ovulation: date
+    end: date  # последний день цикла
+
+
+class PhaseEvent(NamedTuple):
+    """Начало фазы/подфазы в прогнозе (как элемент get_phase_subphase_starts_on_date)."""
+    date: date
+    phase_name: str
+    stage: str  # None — фаза без подфаз (Ovulation)
+
+
+def _first_forecast_cycle(last_period_start: date, cycle_length: int, from_date: date) -> int:
+    """Порядковый номер дня начала цикла, в который попадает from_date (и до last_period_start)."""
+    start = last_period_start.toordinal()
+    if from_date is None:
+        return start
+    return start + (from_date.toordinal() - start) // cycle_length * cycle_length
+
+
+def forecast_cycles(last_period_start: date, cycle_length: int, period_length: int, from_date: date = None):
+    """Лениво выдаёт CycleForecast: цикл, содержащий from_date (по умолчанию — начавшийся last_period_start), и следующие."""
+    ovulation_offset = period_length + phase_lengths(cycle_length, period_length)[0] - 1
+    start = _first_forecast_cycle(last_period_start, cycle_length, from_date)
+    number = 0
+    while True:
+        yield CycleForecast(
+            number,
+            date.fromordinal(start),
+            date.fromordinal(start + period_length - 1),
+            date.fromordinal(start + ovulation_offset),
+            date.fromordinal(start + cycle_length - 1),
+        )
+        start += cycle_length
+        number += 1
+
+
+def forecast_phase_events(last_period_start: date, cycle_length: int, period_length: int, from_date: date = None):
+    """Лениво выдаёт PhaseEvent — начала фаз/подфаз с from_date (включительно) по порядку дат, цикл за циклом."""
+    layout = get_phase_layout(cycle_length, period_length)
+    starts = [(offset, day.starts) for offset, day in enumerate(layout) if day.starts]
+    start = _first_forecast_cycle(last_period_start, cycle_length, from_date)
+    first = from_date.toordinal() if from_date is not None else start
+    while True:
+        for offset, phases in starts:
+            # Раскладка не выходит за длину цикла, поэтому события соседних циклов идут по порядку дат
+            if offset >= cycle_length or start + offset < first:
+                continue
+            event_date = date.fromordinal(start + offset)
+            for phase_name, stage in phases:
+                yield PhaseEvent(event_date, phase_name, stage)
+        start += cycle_length
+
+
+# Компактное хранение cycle_data в истории циклов: все даты — небольшие смещения в днях от начала цикла,
+# поэтому результат calculate_menstrual_cycle укладывается в ~30 байт вместо ~1,5 КБ JSON.
+# Формат: байт версии + знаковые байты: длины цикла и менструации, смещения дат cycle_info,
+# затем по каждой фазе (в порядке CYCLE_ENCODING_PHASES) duration_days и смещения начала/конца подфаз.
+CYCLE_ENCODING_VERSION = 1
+CYCLE_ENCODING_PHASES = (
+    ("Menstrual Phase", True),
+    ("Follicular Phase", True),
+    ("Ovulation", False),
+    ("Luteal Phase", True),
+)
+OVULATION_NOTE = "Peak fertility window"
+
+
+def encode_cycle_data(cycle_data: dict, cycle_start) -> bytes:
+    """
+    Упаковать результат calculate_menstrual_cycle в смещения от cycle_start.
+    Возвращает None, если структура отличается от ожидаемой (такую запись оставляют в JSON).
+    """
+    start = _to_date(cycle_start)
+    try:
+        info = cycle_data["cycle_info"]
+        values = [info["cycle_length_days"], info["menstruation_length_days"]]
+        dates = [
+            info["last_menstruation_start"],
+            info["cycle_end_date"],
+            info["next_cycle_start"],
+            info["estimated_ovulation_date"],
+            info["fertile_window"]["start_date"],
+            info["fertile_window"]["end_date"],
+        ]
+        offsets = [(_to_date(d) - start).days for d in dates]
+        for (phase_name, has_subphases), ph in zip(CYCLE_ENCODING_PHASES, cycle_data["phases"]):
+            values.append(ph["duration_days"])
+            if has_subphases:
+                bounds = [d for sub in ph["subphases"] for d in (sub["start_date"], sub["end_date"])]
+            else:
+                bounds = [ph["start_date"], ph["end_date"]]
+            offsets.extend((_to_date(d) - start).days for d in bounds)
+        packed = struct.pack(f"<B{len(values) + len(offsets)}b", CYCLE_ENCODING_VERSION, *values, *offsets)
+    except (KeyError, TypeError, ValueError, AttributeError, struct.error):
+        return None
+    # Упаковка без потерь: всё, что не восстанавливается один в один, остаётся в JSON
+    # (индекс boundaries не хранится — он строится из фаз при первом поиске по дате)
+    expected = {key: value for key, value in cycle_data.items() if key != "boundaries"}
+    return packed if decode_cycle_data(packed, start) == expected else None
+
+
+def decode_cycle_data(packed: bytes, cycle_start) -> dict:
+    """
+    Восстановить cycle_data (та же структура, что у calculate_menstrual_cycle, без индекса boundaries)
+    из encode_cycle_data.
+    """
+    if packed[0] != CYCLE_ENCODING_VERSION:
+        raise ValueError(f"Неизвестная версия упаковки цикла: {packed[0]}")
+    values = struct.unpack_from(f"<{len(packed) - 1}b", packed, 1)
+    cycle_length, menstruation_length = values[0], values[1]
+    durations = values[2:2 + len(CYCLE_ENCODING_PHASES)]
+    start_ordinal = _to_date(cycle_start).toordinal()
+    dates = [_iso_date(start_ordinal + offset) for offset in values[2 + len(CYCLE_ENCODING_PHASES):]]
+    result = {
+        "cycle_info": {
+            "cycle_length_days": cycle_length,
+            "menstruation_length_days": menstruation_length,
+            "last_menstruation_start": dates[0],
+            "cycle_end_date": dates[1],
+            "next_cycle_start": dates[2],
+            "estimated_ovulation_date": dates[3],
+            "fertile_window": {
+                "start_date": dates[4],
+                "end_date": dates[5],
+            }
+        },
+        "phases": []
+    }
+    i = 6
+    for (phase_name, has_subphases), duration in zip(CYCLE_ENCODING_PHASES, durations):
+        if has_subphases:
+            result["phases"].append({
+                "phase_name": phase_name,
+                "duration_days": duration,
+                "subphases": [
+                    {"stage": "early", "start_date": dates[i], "end_date": dates[i + 1]},
+                    {"stage": "mid", "start_date": dates[i + 2], "end_date": dates[i + 3]},
+                    {"stage": "late", "start_date": dates[i + 4], "end_date": dates[i + 5]},
+                ]
+            })
+            i += 6
         else:
-            if ph.get("start_date") == d_str:
-                result.append((ph["phase_name"], None))
+            result["phases"].append({
+                "phase_name": phase_name,
+                "start_date": dates[i],
+                "end_date": dates[i + 1],
+                "duration_days": duration,
+                "note": OVULATION_NOTE
+            })
+            i += 2
     return result
 
 
+@lru_cache(maxsize=4096)
+def _iso_date(ordinal: int) -> str:
+    # Даты записей истории повторяются (соседние циклы, одни и те же пользователи) — строка строится один раз
+    return date.fromordinal(ordinal).isoformat()
+
+
+class PhaseInfo(NamedTuple):
+    """Неизменяемая запись справочника фаз (поля как у модели CyclePhase)."""
+    name: str
+    name_ru: str
+    start_day: int
+    end_day: int
+    description: str
+    symptoms: str
+    behavior: str
+    recommendations: str
+
+
+# Справочник фаз (4 строки cycle_phases) загружается из БД один раз на процесс и дальше читается из памяти
+_phase_catalogue = None
+
+
+def reload_phase_catalogue() -> tuple:
+    """Перечитать справочник фаз из БД (после заполнения в init_db или изменения таблицы cycle_phases)."""
+    global _phase_catalogue
+    _catalogue_days.clear()
+    session = SessionLocal()
+    try:
+        phases = session.query(CyclePhase).order_by(CyclePhase.start_day).all()
+        _phase_catalogue = tuple(
+            PhaseInfo(
+                phase.name, phase.name_ru, phase.start_day, phase.end_day,
+                phase.description, phase.symptoms, phase.behavior, phase.recommendations,
+            )
+            for phase in phases
+        )
+    finally:
+        session.close()
+    return _phase_catalogue
+
+
+def get_phase_catalogue() -> tuple:
+    """Фазы цикла (PhaseInfo), отсортированные по start_day; при первом обращении загружаются из БД."""
+    if _phase_catalogue is None:
+        return reload_phase_catalogue()
+    return _phase_catalogue
+
+
+# День цикла -> (фаза справочника, день в фазе, осталось дней, ПМС); сбрасывается при перезагрузке справочника
+_catalogue_days = {}
+
+
+def _catalogue_day(current_day: int) -> tuple:
+    """Фаза справочника для дня цикла — как CycleCalculator.get_current_phase (от длины цикла не зависит)."""
+    cached = _catalogue_days.get(current_day)
+    if cached is not None:
+        return cached
+    catalogue = get_phase_catalogue()
+    for phase in catalogue:
+        if phase.start_day <= current_day <= phase.end_day:
+            cached = (
+                phase, current_day - phase.start_day + 1, phase.end_day - current_day,
+                phase.name == 'luteal' and current_day >= 21,  # ПМС обычно с 21 дня
+            )
+            break
+    else:
+        cached = (catalogue[0] if catalogue else None, 1, 0, False)
+    _catalogue_days[current_day] = cached
+    return cached
+
+
+# Пакетная классификация дней цикла для планировщика: фаза/подфаза, начало фазы, дней до следующей фазы
+# и завершение цикла сразу для многих пользователей (с NumPy — векторно, без него — тем же расчётом по одному)
+PHASE_NAMES = tuple(name for name, _ in CYCLE_ENCODING_PHASES)
+STAGE_NAMES = ("early", "mid", "late")
+
+
+class CycleDay(NamedTuple):
+    """Классификация одного дня цикла (строка результата classify_cycle_days)."""
+    phase: int  # индекс в PHASE_NAMES, -1 — день вне рассчитанного цикла
+    stage: int  # индекс в STAGE_NAMES, -1 — фаза без подфаз
+    starts_today: bool  # в этот день начинается фаза/подфаза (get_phase_day(...).starts не пуст)
+    next_phase: int  # индекс следующей фазы в get_phase_catalogue() (как CycleCalculator.get_next_phase), -1 — справочник пуст
+    days_until_next_phase: int
+    cycle_ended: bool  # прошло >= (длина цикла + продление) дней
+
+
+def classify_cycle_day(last_period_start: date, cycle_length: int, period_length: int,
+                       extension: int, local_date: date) -> CycleDay:
+    """Классификация дня для одного пользователя (поэлементный путь classify_cycle_days)."""
+    phase_day = get_phase_day(cycle_length, period_length, last_period_start, local_date)
+    next_phase_info = CycleCalculator(last_period_start, cycle_length, period_length).get_next_phase(local_date)
+    if next_phase_info:
+        next_phase = get_phase_catalogue().index(next_phase_info['phase'])
+        days_until = next_phase_info['days_until']
+    else:
+        next_phase, days_until = -1, -1
+    return CycleDay(
+        PHASE_NAMES.index(phase_day.phase_name) if phase_day.phase_name else -1,
+        STAGE_NAMES.index(phase_day.stage) if phase_day.stage else -1,
+        bool(phase_day.starts),
+        next_phase,
+        days_until,
+        (local_date - last_period_start).days + 1 >= cycle_length + extension,
+    )
+
+
+_layout_arrays = None
+
+
+def _phase_layout_arrays():
+    """PHASE_LAYOUTS стандартных значений в виде массивов [длина цикла, менструация, смещение] (строятся один раз)."""
+    global _layout_arrays
+    if _layout_arrays is None:
+        depth = max(len(get_phase_layout(c, p)) for c in PHASE_LAYOUT_CYCLE_LENGTHS for p in PHASE_LAYOUT_PERIOD_LENGTHS)
+        shape = (PHASE_LAYOUT_CYCLE_LENGTHS.stop, PHASE_LAYOUT_PERIOD_LENGTHS.stop, depth)
+        phases = np.full(shape, -1, dtype=np.int8)
+        stages = np.full(shape, -1, dtype=np.int8)
+        starts = np.zeros(shape, dtype=bool)
+        for cycle_length in PHASE_LAYOUT_CYCLE_LENGTHS:
+            for period_length in PHASE_LAYOUT_PERIOD_LENGTHS:
+                for offset, day in enumerate(get_phase_layout(cycle_length, period_length)):
+                    phases[cycle_length, period_length, offset] = PHASE_NAMES.index(day.phase_name) if day.phase_name else -1
+                    stages[cycle_length, period_length, offset] = STAGE_NAMES.index(day.stage) if day.stage else -1
+                    starts[cycle_length, period_length, offset] = bool(day.starts)
+        _layout_arrays = (phases, stages, starts)
+    return _layout_arrays
+
+
+def classify_cycle_days(last_period_starts, cycle_lengths, period_lengths, extensions, local_dates) -> dict:
+    """
+    Классифицировать день цикла сразу для многих пользователей.
+    Даты — порядковые номера (date.toordinal()), все аргументы — последовательности одной длины.
+    Возвращает {поле CycleDay: массив значений по пользователям}: np.ndarray, если установлен NumPy, иначе списки.
+    """
+    if np is None:
+        rows = [
+            classify_cycle_day(date.fromordinal(start), cycle_length, period_length, extension, date.fromordinal(day))
+            for start, cycle_length, period_length, extension, day
+            in zip(last_period_starts, cycle_lengths, period_lengths, extensions, local_dates)
+        ]
+        return {field: [row[i] for row in rows] for i, field in enumerate(CycleDay._fields)}
+    
+    starts = np.asarray(last_period_starts, dtype=np.int64)
+    cycle_lengths = np.asarray(cycle_lengths, dtype=np.int64)
+    period_lengths = np.asarray(period_lengths, dtype=np.int64)
+    days = np.asarray(local_dates, dtype=np.int64)
+    offsets = days - starts
+    
+    # Фаза/подфаза и начало фазы — по раскладкам (вне цикла и для нестандартных длин — -1 / False)
+    phase_table, stage_table, starts_table = _phase_layout_arrays()
+    standard = (
+        (cycle_lengths >= PHASE_LAYOUT_CYCLE_LENGTHS.start) & (cycle_lengths < PHASE_LAYOUT_CYCLE_LENGTHS.stop)
+        & (period_lengths >= PHASE_LAYOUT_PERIOD_LENGTHS.start) & (period_lengths < PHASE_LAYOUT_PERIOD_LENGTHS.stop)
+    )
+    in_table = standard & (offsets >= 0) & (offsets < phase_table.shape[2])
+    # Индекс в развёрнутой таблице; строки вне таблицы указывают на ячейку [0, 0, 0], где всегда -1 / False
+    _, periods, depth = phase_table.shape
+    index = np.where(in_table, (cycle_lengths * periods + period_lengths) * depth + offsets, 0)
+    phase = phase_table.ravel().take(index)
+    stage = stage_table.ravel().take(index)
+    starts_today = starts_table.ravel().take(index)
+    
+    # Следующая фаза по справочнику (как CycleCalculator.get_next_phase): первая с start_day > текущего дня,
+    # иначе первая фаза следующего цикла
+    catalogue_starts = np.array([ph.start_day for ph in get_phase_catalogue()], dtype=np.int64)
+    current_day = np.mod(offsets, cycle_lengths) + 1
+    if len(catalogue_starts):
+        next_phase = np.searchsorted(catalogue_starts, current_day, side='right')
+        wraps = next_phase >= len(catalogue_starts)
+        next_phase = np.where(wraps, 0, next_phase)
+        days_until = np.where(
+            wraps, cycle_lengths - current_day + catalogue_starts[0], catalogue_starts[next_phase] - current_day
+        )
+    else:
+        next_phase = np.full(len(days), -1)
+        days_until = np.full(len(days), -1)
+    
+    result = {
+        "phase": phase,
+        "stage": stage,
+        "starts_today": starts_today,
+        "next_phase": next_phase,
+        "days_until_next_phase": days_until,
+        "cycle_ended": offsets + 1 >= cycle_lengths + np.asarray(extensions, dtype=np.int64),
+    }
+    
+    # Нестандартные длины (нет в массивах раскладок) — поэлементно
+    for i in np.flatnonzero(~standard).tolist():
+        row = classify_cycle_day(
+            date.fromordinal(int(starts[i])), int(cycle_lengths[i]), int(period_lengths[i]), 0, date.fromordinal(int(days[i]))
+        )
+        result["phase"][i], result["stage"][i], result["starts_today"][i] = row.phase, row.stage, row.starts_today
+    return result
+
+
+def cycle_days_from_batch(batch: dict) -> list:
+    """Результат classify_cycle_days построчно: список CycleDay."""
+    columns = [
+        values.tolist() if hasattr(values, 'tolist') else values
+        for values in (batch[field] for field in CycleDay._fields)
+    ]
+    return [CycleDay(*row) for row in zip(*columns)]
+
+
+class CycleSnapshot(NamedTuple):
+    """
+    Состояние цикла пользователя на дату: всё, что выводят профиль и отчёты, рассчитанное за один проход
+    (те же значения, что get_phase_day и методы CycleCalculator). Неизменяемо; строится через CycleSnapshot.at.
+    """
+    today: date
+    cycle_length: int
+    period_length: int
+    current_day: int  # день цикла (1..cycle_length), как CycleCalculator.get_current_day
+    phase_day: PhaseDay  # фаза/подфаза по раскладке calculate_menstrual_cycle
+    phase: PhaseInfo  # фаза из справочника, как CycleCalculator.get_current_phase
+    days_in_phase: int
+    days_left_in_phase: int
+    is_pms: bool
+    last_ovulation: date
+    next_ovulation: date
+    next_period: date
+    
+    @classmethod
+    def at(cls, last_period_start: date, cycle_length: int, period_length: int, today: date = None) -> "CycleSnapshot":
+        if today is None:
+            today = date.today()
+        # Все даты — через порядковые номера: один расчёт дня цикла вместо отдельного в каждом методе
+        today_ordinal = today.toordinal()
+        offset = today_ordinal - last_period_start.toordinal()
+        current_day = offset % cycle_length + 1
+        
+        layout = get_phase_layout(cycle_length, period_length)
+        phase_day = layout[offset] if 0 <= offset < len(layout) else NO_PHASE_DAY
+        
+        ovulation_day = period_length + phase_lengths(cycle_length, period_length)[0]
+        next_period = today_ordinal + cycle_length - current_day + 1
+        if current_day >= ovulation_day:
+            last_ovulation = today_ordinal - (current_day - ovulation_day)
+            next_ovulation = next_period + ovulation_day - 1
+        else:
+            last_ovulation = today_ordinal - (cycle_length - ovulation_day + current_day)
+            next_ovulation = today_ordinal + ovulation_day - current_day
+        
+        return cls(
+            today, cycle_length, period_length, current_day, phase_day, *_catalogue_day(current_day),
+            date.fromordinal(last_ovulation), date.fromordinal(next_ovulation), date.fromordinal(next_period),
+        )
+    
+    @property
+    def days_until_period(self) -> int:
+        return (self.next_period - self.today).days
+    
+    @property
+    def days_until_ovulation(self) -> int:
+        return (self.next_ovulation - self.today).days
+
+
 class CycleCalculator:
     """Класс для расчета фаз менструального цикла"""
     
@@ -216,37 +765,15 @@ class CycleCalculator:
             Словарь с информацией о текущей фазе
         """
         current_day = self.get_current_day(today)
-        
-        session = SessionLocal()
-        try:
-            # Получаем все фазы из базы
-            phases = session.query(CyclePhase).order_by(CyclePhase.start_day).all()
-            
-            # Находим текущую фазу
-            for phase in phases:
-                if phase.start_day <= current_day <= phase.end_day:
-                    days_in_phase = current_day - phase.start_day + 1
-                    days_left_in_phase = phase.end_day - current_day
-                    
-                    return {
-                        'phase': phase,
-                        'current_day': current_day,
-                        'days_in_phase': days_in_phase,
-                        'days_left_in_phase': days_left_in_phase,
-                        'is_pms': phase.name == 'luteal' and current_day >= 21,  # ПМС обычно с 21 дня
-                    }
-            
-            # Если фаза не найдена, возвращаем первую
-            phase = phases[0] if phases else None
-            return {
-                'phase': phase,
-                'current_day': current_day,
-                'days_in_phase': 1,
-                'days_left_in_phase': 0,
-                'is_pms': False,
-            }
-        finally:
-            session.close()
+        # Фаза, в диапазон которой попадает день; если не найдена — первая
+        phase, days_in_phase, days_left_in_phase, is_pms = _catalogue_day(current_day)
+        return {
+            'phase': phase,
+            'current_day': current_day,
+            'days_in_phase': days_in_phase,
+            'days_left_in_phase': days_left_in_phase,
+            'is_pms': is_pms,
+        }
     
     def get_ovulation_day_number(self) -> int:
         """
@@ -254,11 +781,7 @@ class CycleCalculator:
         ovulation_day = menstruation_length + follicular_length,
         follicular_length = cycle_length - menstruation_length - luteal_length, luteal_length = 12.
         """
-        luteal_length = 12
-        follicular_length = self.cycle_length - self.period_length - luteal_length
-        if follicular_length < 5:
-            luteal_length = max(10, self.cycle_length - self.period_length - 5)
-            follicular_length = self.cycle_length - self.period_length - luteal_length
+        follicular_length, _ = phase_lengths(self.cycle_length, self.period_length)
         return self.period_length + follicular_length
     
     def get_next_period_date(self, today: date = None) -> date:
@@ -315,43 +838,53 @@ class CycleCalculator:
         """
         if today is None:
             today = date.today()
-        
+        return self._next_phase_from(get_phase_catalogue(), today)
+    
+    def _next_phase_from(self, phases: list, today: date) -> dict:
+        """Следующая фаза по уже загруженному (отсортированному по start_day) списку фаз."""
         current_day = self.get_current_day(today)
         
-        session = SessionLocal()
-        try:
-            # Получаем все фазы из базы
-            phases = session.query(CyclePhase).order_by(CyclePhase.start_day).all()
-            
-            # Находим следующую фазу
-            for phase in phases:
-                if phase.start_day > current_day:
-                    days_until_phase = phase.start_day - current_day
-                    return {
-                        'phase': phase,
-                        'days_until': days_until_phase,
-                        'start_date': today + timedelta(days=days_until_phase)
-                    }
-            
-            # Если следующая фаза в следующем цикле
-            days_until_next_cycle = self.cycle_length - current_day + 1
-            next_cycle_start = today + timedelta(days=days_until_next_cycle)
-            
-            # Первая фаза следующего цикла
-            if phases:
-                first_phase = phases[0]
-                phase_start_date = next_cycle_start + timedelta(days=first_phase.start_day - 1)
-                days_until = (phase_start_date - today).days
-                
+        # Находим следующую фазу
+        for phase in phases:
+            if phase.start_day > current_day:
+                days_until_phase = phase.start_day - current_day
                 return {
-                    'phase': first_phase,
-                    'days_until': days_until,
-                    'start_date': phase_start_date
+                    'phase': phase,
+                    'days_until': days_until_phase,
+                    'start_date': today + timedelta(days=days_until_phase)
                 }
+        
+        # Если следующая фаза в следующем цикле
+        days_until_next_cycle = self.cycle_length - current_day + 1
+        next_cycle_start = today + timedelta(days=days_until_next_cycle)
+        
+        # Первая фаза следующего цикла
+        if phases:
+            first_phase = phases[0]
+            phase_start_date = next_cycle_start + timedelta(days=first_phase.start_day - 1)
+            days_until = (phase_start_date - today).days
             
-            return None
-        finally:
-            session.close()
+            return {
+                'phase': first_phase,
+                'days_until': days_until,
+                'start_date': phase_start_date
+            }
+        
+        return None
+    
+    def get_phase_advance_date(self, from_date: date, days_before: int = 2) -> date:
+        """
+        Ближайшая дата (начиная с from_date), в которую до следующей фазы остаётся ровно days_before дней,
+        т.е. день напоминания о приближении фазы. None, если такой даты нет.
+        """
+        phases = get_phase_catalogue()
+        # Расчёт фаз периодичен с шагом cycle_length, поэтому достаточно одного цикла
+        for offset in range(self.cycle_length):
+            day = from_date + timedelta(days=offset)
+            next_phase = self._next_phase_from(phases, day)
+            if next_phase and next_phase['days_until'] == days_before:
+                return day
+        return None
     
     def get_phase_info(self, phase_name: str) -> dict:
         """
@@ -363,10 +896,8 @@ class CycleCalculator:
         Returns:
             Словарь с информацией о фазе
         """
-        session = SessionLocal()
-        try:
-            phase = session.query(CyclePhase).filter(CyclePhase.name == phase_name).first()
-            if phase:
+        for phase in get_phase_catalogue():
+            if phase.name == phase_name:
                 return {
                     'name': phase.name_ru,
                     'description': phase.description,
@@ -376,6 +907,4 @@ class CycleCalculator:
                     'start_day': phase.start_day,
                     'end_day': phase.end_day,
                 }
-            return None
-        finally:
-            session.close()
+        return None
@@ -1,22 +1,49 @@
 """
 Модели базы данных для бота отслеживания менструального цикла
 """
-from sqlalchemy import create_engine, Column, Integer, String, Date, Boolean, DateTime, Float, Text, ForeignKey
+from sqlalchemy import create_engine, event, func, inspect, literal, select, update, Column, Integer, String, Date, Boolean, DateTime, Float, Text, LargeBinary, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, date as date_type
+from typing import NamedTuple
 import config
 import logging
 import json
+import math
+import pytz
 
 logger = logging.getLogger(__name__)
 
 Base = declarative_base()
 
 
+def compute_notification_minute_utc(notification_time, timezone_offset) -> int:
+    """
+    Минута суток по UTC (0–1439), в которую пользователю приходят отчёты.
+    notification_time — «ЧЧ:ММ» во времени пользователя, timezone_offset — смещение относительно МСК (число или строка «+3»).
+    """
+    try:
+        hours, minutes = (int(part) for part in str(notification_time or '09:00').split(':'))
+    except ValueError:
+        hours, minutes = 9, 0
+    try:
+        offset = int(timezone_offset or 0)
+    except (TypeError, ValueError):
+        offset = 0
+    msk_offset = pytz.timezone('Europe/Moscow').utcoffset(datetime.utcnow())
+    msk_offset_minutes = int(msk_offset.total_seconds()) // 60
+    return (hours * 60 + minutes - offset * 60 - msk_offset_minutes) % 1440
+
+
 class User(Base):
     """Модель пользователя"""
     __tablename__ = 'users'
+    __table_args__ = (
+        # Когорты планировщика: минута отчёта + наступившее событие графика, часовой пояс + напоминание о фазе
+        Index('ix_users_due_stage', 'notification_minute_utc', 'next_stage_start_date'),
+        Index('ix_users_due_cycle_end', 'notification_minute_utc', 'cycle_end_date'),
+        Index('ix_users_phase_advance', 'timezone', 'next_phase_advance_date'),
+    )
     
     id = Column(Integer, primary_key=True)  # Telegram user ID
     username = Column(String, nullable=True)
@@ -33,6 +60,17 @@ class User(Base):
     period_length = Column(Integer, default=5)  # Длительность менструации в днях
     last_period_start = Column(Date, nullable=True)  # Дата начала последней менструации
     cycle_extended_days = Column(Integer, default=0)  # Доп. дни продления (цикл не завершился вовремя)
+    # Прогноз длительности цикла по истории — EWMA завершённых циклов (21–35); None — истории недостаточно.
+    # Обновляется только при записи истории (save_cycle_record, update_cycle_record_actual_end).
+    avg_cycle_length = Column(Integer, nullable=True)
+    # Скользящая статистика длительностей завершённых циклов (см. CycleLengthStats): при записи истории
+    # обновляется по одному циклу за O(1), без чтения истории
+    cycle_stats_count = Column(Integer, nullable=True)
+    cycle_stats_mean = Column(Float, nullable=True)
+    cycle_stats_m2 = Column(Float, nullable=True)  # сумма квадратов отклонений (алгоритм Уэлфорда)
+    cycle_stats_ewma = Column(Float, nullable=True)
+    cycle_stats_last_start = Column(Date, nullable=True)  # начало последнего учтённого цикла
+    cycle_stats_last_length = Column(Integer, nullable=True)
     
     # Настройки уведомлений
     notifications_enabled = Column(Boolean, default=True)
@@ -40,6 +78,17 @@ class User(Base):
     timezone = Column(Integer, default=0)  # Часовой пояс относительно МСК (например: +3, -1)
     notify_daily = Column(Boolean, default=True)  # Ежедневные уведомления
     notify_phase_start = Column(Boolean, default=True)  # Уведомления о начале фаз
+    # Минута суток UTC, в которую пользователю положены отчёты (из notification_time + timezone).
+    # Индекс позволяет планировщику выбирать только пользователей, у которых отчёт в текущую минуту.
+    notification_minute_utc = Column(
+        Integer, index=True, default=lambda: compute_notification_minute_utc('09:00', 0)
+    )
+    
+    # Материализованный график событий (см. notification_schedule.py): пересчитывается при изменении
+    # last_period_start, period_length, cycle_extended_days и истории циклов
+    next_stage_start_date = Column(Date, nullable=True, index=True)  # Ближайшее начало фазы/подфазы
+    next_phase_advance_date = Column(Date, nullable=True, index=True)  # День напоминания о приближении фазы
+    cycle_end_date = Column(Date, nullable=True, index=True)  # Дата, с которой цикл считается завершённым
     
     # Статистика
     days_with_notifications = Column(Integer, default=0)  # Дней с включенными уведомлениями
@@ -54,13 +103,94 @@ class User(Base):
 class CycleRecord(Base):
     """История циклов: один цикл на запись (cycle_info + phases с subphases)."""
     __tablename__ = 'cycle_records'
+    __table_args__ = (
+        # Последние циклы пользователя: WHERE user_id = ? ORDER BY cycle_start_date DESC
+        Index('ix_cycle_records_user_start', 'user_id', 'cycle_start_date'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     cycle_start_date = Column(Date, nullable=False)  # last_menstruation_start этого цикла
-    cycle_data = Column(Text, nullable=False)  # JSON: cycle_info + phases
+    # cycle_info + phases: упакованные смещения от cycle_start_date (см. cycle_calculator.encode_cycle_data);
+    # в cycle_data JSON остаётся только у записей, которые нельзя упаковать без потерь (иначе пустая строка)
+    cycle_offsets = Column(LargeBinary, nullable=True)
+    cycle_data = Column(Text, nullable=False, default='')
     cycle_actual_end_date = Column(Date, nullable=True)  # фактическая дата окончания (если цикл закончился раньше)
     created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def get_cycle_data(self) -> dict:
+        """Рассчитанный цикл (структура calculate_menstrual_cycle); распаковывается только при обращении."""
+        if self.cycle_offsets is not None:
+            from cycle_calculator import decode_cycle_data
+            return decode_cycle_data(self.cycle_offsets, self.cycle_start_date)
+        return json.loads(self.cycle_data)
+
+
+class NotificationOutbox(Base):
+    """
+    Очередь исходящих уведомлений (outbox): планировщик записывает готовые тексты,
+    отдельный цикл отправки (outbox.py) доставляет их с повторами. idempotency_key исключает дубли.
+    """
+    __tablename__ = 'notification_outbox'
+    __table_args__ = (
+        Index('ix_notification_outbox_due', 'status', 'next_attempt_at'),
+        # Пометка просроченных записей: WHERE status = 'pending' AND created_at < ?
+        Index('ix_notification_outbox_status_created', 'status', 'created_at'),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    kind = Column(String, nullable=False)  # phase_start | phase_advance | cycle_end
+    idempotency_key = Column(String, nullable=False, unique=True)  # вид:пользователь:дата[:фаза:подфаза]
+    text = Column(Text, nullable=False)
+    reply_markup = Column(Text, nullable=True)  # JSON InlineKeyboardMarkup
+    parse_mode = Column(String, nullable=True)
+    pin = Column(Boolean, default=False)  # Закрепить после отправки (вместо ранее закреплённого)
+    status = Column(String, nullable=False, default='pending')  # pending | sending | sent | failed | expired
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    claimed_at = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    message_id = Column(Integer, nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SchemaMigration(Base):
+    """Применённые миграции схемы (см. migrations.py): одна строка на версию."""
+    __tablename__ = 'schema_migrations'
+    
+    version = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SchedulerState(Base):
+    """Состояние планировщика: до какой минуты (UTC) события уже обработаны."""
+    __tablename__ = 'scheduler_state'
+    
+    key = Column(String, primary_key=True)
+    cursor = Column(DateTime, nullable=False)  # Первая необработанная минута (UTC, без tzinfo)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class SchedulerLease(Base):
+    """Аренда шарда планировщика: какой процесс бота обрабатывает пользователей с id % shards == shard."""
+    __tablename__ = 'scheduler_leases'
+
+    shard = Column(Integer, primary_key=True)
+    owner = Column(String, nullable=True)  # Идентификатор процесса; None — шард свободен
+    expires_at = Column(DateTime, nullable=False)  # UTC, без tzinfo; после — шард может забрать другой процесс
+    heartbeat_at = Column(DateTime, nullable=True)
+
+
+class SchedulerWorker(Base):
+    """Живые процессы планировщика (heartbeat) — по ним шарды делятся поровну."""
+    __tablename__ = 'scheduler_workers'
+
+    worker_id = Column(String, primary_key=True)
+    heartbeat_at = Column(DateTime, nullable=False, index=True)  # UTC, без tzinfo
+    started_at = Column(DateTime, default=datetime.utcnow)
 
 
 class CyclePhase(Base):
@@ -83,65 +213,46 @@ engine = create_engine(config.DATABASE_URL, echo=False)
 SessionLocal = sessionmaker(bind=engine)
 
 
+class QueryCounter:
+    """
+    Счётчик SQL-запросов сессии внутри блока with (для отчётов планировщика).
+    Считаются только запросы соединений этой сессии: запросы других потоков к тому же движку
+    (отправка outbox, аренды шардов) в счёт не попадают.
+    """
+    
+    def __init__(self, session):
+        self.session = session
+        self.count = 0
+        self._connections = []
+    
+    def _on_execute(self, *args):
+        self.count += 1
+    
+    def _on_begin(self, session, transaction, connection):
+        # После commit сессия берёт новое соединение — слушатель добавляется на каждое
+        if connection not in self._connections:
+            event.listen(connection, "before_cursor_execute", self._on_execute)
+            self._connections.append(connection)
+    
+    def __enter__(self):
+        event.listen(self.session, "after_begin", self._on_begin)
+        if self.session.in_transaction():
+            self._on_begin(self.session, None, self.session.connection())
+        return self
+    
+    def __exit__(self, *exc):
+        event.remove(self.session, "after_begin", self._on_begin)
+        for connection in self._connections:
+            event.remove(connection, "before_cursor_execute", self._on_execute)
+        self._connections.clear()
+
+
 def init_db():
-    """Инициализация базы данных - создание таблиц"""
+    """Инициализация базы данных: создание таблиц, версионные миграции схемы (migrations.py), справочник фаз"""
     Base.metadata.create_all(engine)
     
-    # Миграция: добавление нового столбца pinned_message_id, если его нет
-    session = SessionLocal()
-    try:
-        # Проверяем, существует ли столбец pinned_message_id
-        from sqlalchemy import inspect, text
-        inspector = inspect(engine)
-        
-        if 'cycle_records' in inspector.get_table_names():
-            cycle_columns = [col['name'] for col in inspector.get_columns('cycle_records')]
-            if 'cycle_actual_end_date' not in cycle_columns:
-                logger.info("Добавление столбца cycle_actual_end_date в таблицу cycle_records...")
-                try:
-                    session.execute(text('ALTER TABLE cycle_records ADD COLUMN cycle_actual_end_date DATE'))
-                    session.commit()
-                    logger.info("Столбец cycle_actual_end_date успешно добавлен")
-                except Exception as e:
-                    logger.error(f"Ошибка при добавлении столбца cycle_actual_end_date: {e}")
-                    session.rollback()
-        
-        if 'users' in inspector.get_table_names():
-            columns = [col['name'] for col in inspector.get_columns('users')]
-            
-            if 'pinned_message_id' not in columns:
-                logger.info("Добавление столбца pinned_message_id в таблицу users...")
-                try:
-                    session.execute(text('ALTER TABLE users ADD COLUMN pinned_message_id INTEGER'))
-                    session.commit()
-                    logger.info("Столбец pinned_message_id успешно добавлен")
-                except Exception as e:
-                    logger.error(f"Ошибка при добавлении столбца pinned_message_id: {e}")
-                    session.rollback()
-            
-            if 'cycle_extended_days' not in columns:
-                logger.info("Добавление столбца cycle_extended_days в таблицу users...")
-                try:
-                    session.execute(text('ALTER TABLE users ADD COLUMN cycle_extended_days INTEGER DEFAULT 0'))
-                    session.commit()
-                    logger.info("Столбец cycle_extended_days успешно добавлен")
-                except Exception as e:
-                    logger.error(f"Ошибка при добавлении столбца cycle_extended_days: {e}")
-                    session.rollback()
-            # Миграция: добавление столбца last_phase_advance_date
-            if 'last_phase_advance_date' not in columns:
-                logger.info("Добавление столбца last_phase_advance_date в таблицу users...")
-                try:
-                    session.execute(text('ALTER TABLE users ADD COLUMN last_phase_advance_date DATE'))
-                    session.commit()
-                    logger.info("Столбец last_phase_advance_date успешно добавлен")
-                except Exception as e:
-                    logger.error(f"Ошибка при добавлении столбца last_phase_advance_date: {e}")
-                    session.rollback()
-    except Exception as e:
-        logger.warning(f"Ошибка при миграции базы данных: {e}")
-    finally:
-        session.close()
+    from migrations import run_migrations
+    run_migrations(engine)
     
     # Заполнение справочника фаз цикла
     session = SessionLocal()
@@ -194,15 +305,103 @@ def init_db():
             session.commit()
     finally:
         session.close()
+    
+    # Справочник фаз в памяти процесса (CycleCalculator не обращается к БД)
+    from cycle_calculator import reload_phase_catalogue
+    reload_phase_catalogue()
 
 
-def get_db():
-    """Получение сессии базы данных"""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def rebuild_user_schedules(session, batch_size: int = 1000) -> int:
+    """
+    Пересчитать материализованный график событий всех пользователей с заполненным циклом.
+    Пользователи обрабатываются пачками по batch_size с commit после каждой (без долгих блокировок таблицы).
+    Читаются только нужные столбцы, поэтому функция работает и в миграциях, пока более поздних столбцов модели ещё нет.
+    Длительность цикла — как у планировщика (effective_cycle_length): прогноз по статистике users.avg_cycle_length,
+    а до миграции, добавляющей этот столбец, — users.cycle_length.
+    """
+    from notification_schedule import compute_user_schedule, local_today
+    avg_cycle_length = (
+        User.avg_cycle_length if "avg_cycle_length" in {col["name"] for col in inspect(session.get_bind()).get_columns("users")}
+        else literal(None).label("avg_cycle_length")
+    )
+    columns = (
+        User.id, User.cycle_length, avg_cycle_length, User.period_length, User.last_period_start,
+        User.cycle_extended_days, User.timezone,
+    )
+    total = 0
+    last_id = 0
+    while True:
+        users = session.execute(
+            select(*columns).where(User.last_period_start.isnot(None), User.id > last_id).order_by(User.id).limit(batch_size)
+        ).all()
+        if not users:
+            break
+        updates = [
+            {"id": user.id, **compute_user_schedule(user, local_today(user.timezone), effective_cycle_length(user))}
+            for user in users
+        ]
+        session.execute(update(User), updates)
+        session.commit()
+        total += len(users)
+        last_id = users[-1].id
+    logger.info(f"Пересчитан график событий для {total} пользователей")
+    return total
+
+
+def enqueue_notifications(session, items: list) -> int:
+    """
+    Добавить уведомления в outbox в рамках переданной сессии (commit — у вызывающего кода).
+    items — dict с полями NotificationOutbox (user_id, kind, idempotency_key, text, ...).
+    Уже поставленные в очередь ключи пропускаются. Возвращает число добавленных записей.
+    """
+    if not items:
+        return 0
+    keys = [item["idempotency_key"] for item in items]
+    existing = {
+        key for (key,) in session.query(NotificationOutbox.idempotency_key).filter(
+            NotificationOutbox.idempotency_key.in_(keys)
+        )
+    }
+    added = 0
+    for item in items:
+        if item["idempotency_key"] in existing:
+            continue
+        existing.add(item["idempotency_key"])
+        session.add(NotificationOutbox(**item))
+        added += 1
+    return added
+
+
+def get_scheduler_cursor(session, key: str):
+    """Первая необработанная минута планировщика (UTC, без tzinfo) или None, если планировщик ещё не запускался."""
+    state = session.get(SchedulerState, key)
+    return state.cursor if state else None
+
+
+def set_scheduler_cursor(session, key: str, cursor) -> None:
+    """Сохранить позицию планировщика в рамках переданной сессии (commit — у вызывающего кода)."""
+    state = session.get(SchedulerState, key)
+    if state is None:
+        session.add(SchedulerState(key=key, cursor=cursor))
+    else:
+        state.cursor = cursor
+
+
+def build_cycle_record(user_id: int, cycle_start_date, cycle_data: dict) -> CycleRecord:
+    """Новая запись истории циклов (без сохранения); общая для синхронного и асинхронного слоя."""
+    start_date = cycle_start_date.date() if isinstance(cycle_start_date, datetime) else cycle_start_date
+    if not isinstance(start_date, date_type):
+        start_date = cycle_data["cycle_info"]["last_menstruation_start"]
+        if isinstance(start_date, str):
+            start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
+    from cycle_calculator import encode_cycle_data
+    packed = encode_cycle_data(cycle_data, start_date)
+    return CycleRecord(
+        user_id=user_id,
+        cycle_start_date=start_date,
+        cycle_offsets=packed,
+        cycle_data='' if packed is not None else json.dumps(cycle_data, ensure_ascii=False)
+    )
 
 
 def save_cycle_record(user_id: int, cycle_start_date, cycle_data: dict):
@@ -212,19 +411,17 @@ def save_cycle_record(user_id: int, cycle_start_date, cycle_data: dict):
     """
     session = SessionLocal()
     try:
-        start_date = cycle_start_date.date() if isinstance(cycle_start_date, datetime) else cycle_start_date
-        if not isinstance(start_date, date_type):
-            start_date = cycle_data["cycle_info"]["last_menstruation_start"]
-            if isinstance(start_date, str):
-                start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
-        record = CycleRecord(
-            user_id=user_id,
-            cycle_start_date=start_date,
-            cycle_data=json.dumps(cycle_data, ensure_ascii=False)
-        )
+        record = build_cycle_record(user_id, cycle_start_date, cycle_data)
         session.add(record)
+        session.flush()
+        previous = session.execute(previous_cycle_query(user_id, record.cycle_start_date)).first()
+        if previous is not None:
+            # Начало нового цикла завершает предыдущий
+            record_completed_cycle(session, user_id, previous.cycle_start_date, completed_cycle_length(
+                previous.cycle_start_date, previous.cycle_actual_end_date, record.cycle_start_date
+            ))
         session.commit()
-        logger.info(f"Сохранён цикл для user_id={user_id}, start={start_date}")
+        logger.info(f"Сохранён цикл для user_id={user_id}, start={record.cycle_start_date}")
     except Exception as e:
         logger.error(f"Ошибка сохранения цикла: {e}")
         session.rollback()
@@ -232,38 +429,178 @@ def save_cycle_record(user_id: int, cycle_start_date, cycle_data: dict):
         session.close()
 
 
-def get_last_cycle_record(user_id: int):
-    """Получить последнюю запись цикла пользователя (по дате начала)."""
-    session = SessionLocal()
-    try:
-        return session.query(CycleRecord).filter(
-            CycleRecord.user_id == user_id
-        ).order_by(CycleRecord.cycle_start_date.desc()).first()
-    finally:
-        session.close()
+def get_average_cycle_lengths(session, user_ids: list) -> dict:
+    """
+    Средняя длительность цикла по истории сразу для многих пользователей одним запросом
+    (для заполнения users.avg_cycle_length). Возвращает {user_id: длительность или None}.
+    """
+    if not user_ids:
+        return {}
+    rn = func.row_number().over(
+        partition_by=CycleRecord.user_id, order_by=CycleRecord.cycle_start_date.desc()
+    ).label("rn")
+    recent = select(
+        CycleRecord.user_id, CycleRecord.cycle_start_date, CycleRecord.cycle_actual_end_date, rn
+    ).where(CycleRecord.user_id.in_(list(user_ids))).subquery()
+    records_by_user = {}
+    for row in session.execute(select(recent).where(recent.c.rn <= 4).order_by(recent.c.user_id, recent.c.rn)):
+        records_by_user.setdefault(row.user_id, []).append(row)
+    return {
+        user_id: average_cycle_length_from_records(records_by_user.get(user_id, []))
+        for user_id in user_ids
+    }
 
 
-def get_last_n_cycle_records(user_id: int, n: int = 4):
-    """Последние n записей циклов пользователя (по убыванию даты начала)."""
-    session = SessionLocal()
-    try:
-        return session.query(CycleRecord).filter(
-            CycleRecord.user_id == user_id
-        ).order_by(CycleRecord.cycle_start_date.desc()).limit(n).all()
-    finally:
-        session.close()
+class CycleLengthStats(NamedTuple):
+    """
+    Скользящая статистика длительностей завершённых циклов пользователя (столбцы users.cycle_stats_*):
+    число, среднее и сумма квадратов отклонений по Уэлфорду, экспоненциальное среднее (EWMA).
+    last_start/last_length — последний учтённый цикл: повторное завершение того же цикла
+    (изменили дату окончания) заменяет его длительность, а не добавляет новую.
+    """
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+    ewma: float = None
+    last_start: date_type = None
+    last_length: int = None
+
+
+CYCLE_STATS_COLUMNS = (
+    User.cycle_stats_count,
+    User.cycle_stats_mean,
+    User.cycle_stats_m2,
+    User.cycle_stats_ewma,
+    User.cycle_stats_last_start,
+    User.cycle_stats_last_length,
+)
+
+# Стандартное отклонение длительности цикла (дней), начиная с которого регулярность считается нулевой
+IRREGULAR_CYCLE_STD_DAYS = 4.0
+
+
+def cycle_stats_from_row(row) -> CycleLengthStats:
+    """Статистика из объекта User или строки выборки CYCLE_STATS_COLUMNS."""
+    if not row.cycle_stats_count:
+        return CycleLengthStats()
+    return CycleLengthStats(
+        row.cycle_stats_count, row.cycle_stats_mean, row.cycle_stats_m2, row.cycle_stats_ewma,
+        row.cycle_stats_last_start, row.cycle_stats_last_length,
+    )
 
 
-def get_effective_cycle_length(user_id: int, fallback_cycle_length: int = 28) -> int:
+def _without_last_cycle(stats: CycleLengthStats) -> CycleLengthStats:
+    """Обратный шаг Уэлфорда и EWMA для последней учтённой длительности."""
+    if stats.count <= 1:
+        return CycleLengthStats()
+    x = stats.last_length
+    alpha = config.CYCLE_LENGTH_EWMA_ALPHA
+    mean = (stats.count * stats.mean - x) / (stats.count - 1)
+    return CycleLengthStats(
+        stats.count - 1, mean, max(0.0, stats.m2 - (x - mean) * (x - stats.mean)),
+        (stats.ewma - alpha * x) / (1 - alpha),
+    )
+
+
+def add_cycle_length(stats: CycleLengthStats, cycle_start, length: int) -> CycleLengthStats:
+    """Учесть завершённый цикл (начало cycle_start, length дней). Циклы старше последнего учтённого пропускаются."""
+    if length is None or length < 1:
+        return stats
+    if stats.last_start is not None:
+        if cycle_start < stats.last_start:
+            return stats
+        if cycle_start == stats.last_start:
+            stats = _without_last_cycle(stats)
+    count = stats.count + 1
+    delta = length - stats.mean
+    mean = stats.mean + delta / count
+    alpha = config.CYCLE_LENGTH_EWMA_ALPHA
+    ewma = length if stats.ewma is None else alpha * length + (1 - alpha) * stats.ewma
+    return CycleLengthStats(count, mean, stats.m2 + delta * (length - mean), ewma, cycle_start, length)
+
+
+def predicted_cycle_length(stats: CycleLengthStats):
+    """Прогноз длительности следующего цикла (EWMA, 21–35); None — завершённых циклов нет."""
+    if not stats.count:
+        return None
+    return max(21, min(35, round(stats.ewma)))
+
+
+def cycle_stats_values(stats: CycleLengthStats) -> dict:
+    """Значения столбцов users для статистики (вместе с прогнозом avg_cycle_length)."""
+    return {
+        "cycle_stats_count": stats.count,
+        "cycle_stats_mean": stats.mean,
+        "cycle_stats_m2": stats.m2,
+        "cycle_stats_ewma": stats.ewma,
+        "cycle_stats_last_start": stats.last_start,
+        "cycle_stats_last_length": stats.last_length,
+        "avg_cycle_length": predicted_cycle_length(stats),
+    }
+
+
+def cycle_regularity(user):
+    """
+    Регулярность цикла: (оценка 0–100, стандартное отклонение в днях, число циклов) по скользящей статистике;
+    None — завершённых циклов меньше двух.
+    """
+    stats = cycle_stats_from_row(user)
+    if stats.count < 2:
+        return None
+    std = math.sqrt(stats.m2 / (stats.count - 1))
+    score = round(100 * max(0.0, 1 - std / IRREGULAR_CYCLE_STD_DAYS))
+    return score, std, stats.count
+
+
+def completed_cycle_length(cycle_start, cycle_actual_end_date, next_cycle_start=None):
+    """Длительность завершённого цикла (как в average_cycle_length_from_records); None — цикл ещё идёт."""
+    if cycle_actual_end_date is not None:
+        return (cycle_actual_end_date - cycle_start).days + 1
+    if next_cycle_start is not None:
+        return (next_cycle_start - cycle_start).days
+    return None
+
+
+def replay_cycle_length_stats(records: list) -> CycleLengthStats:
+    """Статистика по всей истории (записи по возрастанию даты начала) — для заполнения в миграции."""
+    stats = CycleLengthStats()
+    for i, record in enumerate(records):
+        next_start = records[i + 1].cycle_start_date if i + 1 < len(records) else None
+        stats = add_cycle_length(stats, record.cycle_start_date, completed_cycle_length(
+            record.cycle_start_date, record.cycle_actual_end_date, next_start
+        ))
+    return stats
+
+
+def previous_cycle_query(user_id: int, before):
+    """Последний цикл пользователя, начавшийся раньше before (его завершает новый цикл)."""
+    return select(CycleRecord.cycle_start_date, CycleRecord.cycle_actual_end_date).where(
+        CycleRecord.user_id == user_id, CycleRecord.cycle_start_date < before
+    ).order_by(CycleRecord.cycle_start_date.desc()).limit(1)
+
+
+def record_completed_cycle(session, user_id: int, cycle_start, length):
+    """Учесть завершённый цикл в статистике пользователя в транзакции вызывающего кода (без commit)."""
+    row = session.execute(select(*CYCLE_STATS_COLUMNS).where(User.id == user_id)).first()
+    if row is None:
+        return None
+    stats = add_cycle_length(cycle_stats_from_row(row), cycle_start, length)
+    session.execute(update(User).where(User.id == user_id).values(**cycle_stats_values(stats)))
+    return stats
+
+
+def effective_cycle_length(user) -> int:
     """
-    Длительность цикла по среднему за последние 1–3 завершённых цикла из БД.
-    Длина цикла = (дата окончания − дата начала) в днях.
-    Если записей меньше двух — возвращается fallback_cycle_length (исходное значение пользователя).
-    Результат ограничен диапазоном 21–35.
+    Длительность цикла для расчётов: средняя по истории (users.avg_cycle_length) или user.cycle_length,
+    ограниченная диапазоном 21–35. Без запросов к БД — подходит и для объекта User, и для строки выборки.
     """
-    records = get_last_n_cycle_records(user_id, n=4)
-    if not records:
-        return max(21, min(35, fallback_cycle_length))
+    if user.avg_cycle_length is not None:
+        return user.avg_cycle_length
+    return max(21, min(35, user.cycle_length or 28))
+
+
+def average_cycle_length_from_records(records: list):
+    """Средняя длительность по записям (по убыванию даты начала), 21–35; None — завершённых циклов нет."""
     lengths = []
     for i in range(1, len(records)):
         r_cur = records[i]
@@ -277,11 +614,15 @@ def get_effective_cycle_length(user_id: int, fallback_cycle_length: int = 28) ->
         if len(lengths) >= 3:
             break
     if not lengths:
-        return max(21, min(35, fallback_cycle_length))
+        return None
     avg = round(sum(lengths) / len(lengths))
     return max(21, min(35, avg))
 
 
+def as_date(value):
+    return value.date() if hasattr(value, 'date') else value
+
+
 def update_cycle_record_actual_end(user_id: int, cycle_actual_end_date) -> bool:
     """
     Обновить фактическую дату окончания у последнего цикла пользователя.
@@ -294,7 +635,11 @@ def update_cycle_record_actual_end(user_id: int, cycle_actual_end_date) -> bool:
         ).order_by(CycleRecord.cycle_start_date.desc()).first()
         if not record:
             return False
-        record.cycle_actual_end_date = cycle_actual_end_date.date() if hasattr(cycle_actual_end_date, 'date') else cycle_actual_end_date
+        record.cycle_actual_end_date = as_date(cycle_actual_end_date)
+        session.flush()
+        record_completed_cycle(session, user_id, record.cycle_start_date, completed_cycle_length(
+            record.cycle_start_date, record.cycle_actual_end_date
+        ))
         session.commit()
         logger.info(f"Обновлена дата окончания цикла user_id={user_id}, record_id={record.id}, end={record.cycle_actual_end_date}")
         return True
@@ -316,22 +661,7 @@ def reset_user_and_cycle_data(session, user_id: int) -> bool:
         user = session.query(User).filter(User.id == user_id).first()
         if not user:
             return False
-        user.name = None
-        user.girlfriend_name = None
-        user.cycle_length = 28
-        user.period_length = 5
-        user.last_period_start = None
-        user.cycle_extended_days = 0
-        user.data_collection_state = None
-        user.notification_time = "09:00"
-        user.timezone = 0
-        user.notifications_enabled = True
-        user.notify_daily = True
-        user.notify_phase_start = True
-        user.last_notification_date = None
-        user.last_phase_advance_date = None
-        user.pinned_message_id = None
-        user.days_with_notifications = 0
+        reset_user_fields(user)
         session.commit()
         logger.info(f"Данные пользователя и циклов сброшены для user_id={user_id}")
         return True
@@ -339,3 +669,30 @@ def reset_user_and_cycle_data(session, user_id: int) -> bool:
         logger.error(f"Ошибка сброса данных пользователя: {e}")
         session.rollback()
         return False
+
+
+def reset_user_fields(user: User) -> None:
+    """Сбросить данные профиля и уведомлений к значениям по умолчанию (без commit)."""
+    user.name = None
+    user.girlfriend_name = None
+    user.cycle_length = 28
+    user.period_length = 5
+    user.last_period_start = None
+    user.cycle_extended_days = 0
+    user.avg_cycle_length = None
+    for column in CYCLE_STATS_COLUMNS:
+        setattr(user, column.key, None)
+    user.data_collection_state = None
+    user.notification_time = "09:00"
+    user.timezone = 0
+    user.notification_minute_utc = compute_notification_minute_utc("09:00", 0)
+    user.notifications_enabled = True
+    user.notify_daily = True
+    user.notify_phase_start = True
+    user.last_notification_date = None
+    user.last_phase_advance_date = None
+    user.next_stage_start_date = None
+    user.next_phase_advance_date = None
+    user.cycle_end_date = None
+    user.pinned_message_id = None
+    user.days_with_notifications = 0
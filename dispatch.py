@@ -0,0 +1,167 @@
+"""
+Параллельная рассылка уведомлений с ограничением скорости Telegram.
+
+Задания (по одному на чат) выполняются пулом из нескольких воркеров. Каждый вызов Bot API проходит через
+общий лимит (~30 сообщений в секунду на бота) и лимит на чат (не чаще одного сообщения в секунду в один чат).
+При ответе RetryAfter (flood control) рассылка приостанавливается на указанное Telegram время и вызов повторяется.
+"""
+import asyncio
+import contextvars
+import logging
+import time
+from telegram.error import RetryAfter
+import config
+
+logger = logging.getLogger(__name__)
+
+# Статистика текущего запуска run() — доступна в вызовах API внутри заданий
+_current_stats = contextvars.ContextVar("dispatch_stats", default=None)
+
+
+class DispatchStats:
+    """Статистика одного запуска рассылки (за один тик планировщика)."""
+
+    def __init__(self):
+        self.jobs = 0
+        self.failed_jobs = 0
+        self.api_calls = 0
+        self.messages_sent = 0
+        self.retries = 0
+        self.started_at = time.monotonic()
+        self.elapsed = 0.0
+
+    @property
+    def throughput(self) -> float:
+        """Отправленных сообщений в секунду."""
+        return self.messages_sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return (
+            f"заданий {self.jobs} (ошибок {self.failed_jobs}), сообщений {self.messages_sent}, "
+            f"вызовов API {self.api_calls}, повторов {self.retries}, "
+            f"за {self.elapsed:.2f} с ({self.throughput:.1f} сообщ./с)"
+        )
+
+
+class TokenBucket:
+    """Асинхронное «ведро токенов»: не более rate операций в секунду с запасом capacity."""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Приостановить выдачу токенов (например, по RetryAfter от Telegram)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class NotificationDispatcher:
+    """Пул воркеров для рассылки с глобальным и поканальным ограничением скорости."""
+
+    def __init__(self, bot, workers: int = None, global_rate: float = None,
+                 per_chat_interval: float = None, max_retries: int = 3):
+        self.bot = bot
+        self.workers = workers or config.NOTIFICATION_WORKERS
+        self.per_chat_interval = per_chat_interval if per_chat_interval is not None else config.TELEGRAM_PER_CHAT_INTERVAL
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate or config.TELEGRAM_GLOBAL_RATE)
+        self._chat_next_slot = {}
+
+    async def _wait_chat_slot(self, chat_id: int):
+        """Зарезервировать ближайший свободный слот для чата и дождаться его."""
+        now = time.monotonic()
+        slot = max(now, self._chat_next_slot.get(chat_id, 0.0))
+        self._chat_next_slot[chat_id] = slot + self.per_chat_interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def call(self, chat_id: int, method, **kwargs):
+        """Вызвать метод Bot API для чата с учётом лимитов; при RetryAfter — подождать и повторить."""
+        stats = _current_stats.get()
+        for attempt in range(self.max_retries + 1):
+            await self._wait_chat_slot(chat_id)
+            await self._global.acquire()
+            try:
+                result = await method(chat_id=chat_id, **kwargs)
+            except RetryAfter as e:
+                if attempt >= self.max_retries:
+                    raise
+                retry_after = float(e.retry_after)
+                logger.warning(f"Flood control для чата {chat_id}: пауза {retry_after} с")
+                self._global.pause(retry_after)
+                if stats:
+                    stats.retries += 1
+                await asyncio.sleep(retry_after)
+                continue
+            if stats:
+                stats.api_calls += 1
+            return result
+
+    async def send_message(self, chat_id: int, **kwargs):
+        """send_message с учётом лимитов (считается в статистике отправленных сообщений)."""
+        message = await self.call(chat_id, self.bot.send_message, **kwargs)
+        stats = _current_stats.get()
+        if stats:
+            stats.messages_sent += 1
+        return message
+
+    async def run(self, jobs: list) -> DispatchStats:
+        """
+        Выполнить задания пулом воркеров. jobs — список (chat_id, async-функция без аргументов);
+        задания одного чата должны быть объединены в одно, чтобы сохранить порядок сообщений.
+        """
+        stats = DispatchStats()
+        stats.jobs = len(jobs)
+        queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+
+        async def worker():
+            _current_stats.set(stats)
+            while True:
+                try:
+                    chat_id, job = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                try:
+                    await job()
+                except Exception as e:
+                    stats.failed_jobs += 1
+                    logger.error(f"Ошибка рассылки в чат {chat_id}: {e}")
+
+        await asyncio.gather(*(asyncio.create_task(worker()) for _ in range(min(self.workers, len(jobs)))))
+        stats.elapsed = time.monotonic() - stats.started_at
+        # Освобождаем слоты чатов, которые уже прошли
+        now = time.monotonic()
+        self._chat_next_slot = {chat: slot for chat, slot in self._chat_next_slot.items() if slot > now}
+        return stats
+
+
+_dispatcher = None
+
+
+def get_dispatcher(bot) -> NotificationDispatcher:
+    """Общий для процесса диспетчер рассылки (лимиты Telegram действуют на бота целиком)."""
+    global _dispatcher
+    if _dispatcher is None or _dispatcher.bot is not bot:
+        _dispatcher = NotificationDispatcher(bot)
+    return _dispatcher
@@ -0,0 +1,299 @@
+"""
+Версионные миграции схемы базы данных.
+
+Каждая миграция — функция с номером версии в MIGRATIONS; применённые версии записываются в schema_migrations,
+поэтому при старте выполняются только новые миграции (без проверки столбцов на каждом запуске).
+Миграции идемпотентны: если процесс упал посередине, повторный запуск безопасно доделает работу.
+
+Изменения рассчитаны на большие таблицы и работу без остановки бота:
+- столбцы добавляются без значения по умолчанию (в PostgreSQL это изменение только метаданных),
+  а заполняются пачками по MIGRATION_BATCH_SIZE строк с commit после каждой;
+- индексы в PostgreSQL строятся через CREATE INDEX CONCURRENTLY (без блокировки записи).
+Несколько реплик бота не применяют миграции одновременно: в PostgreSQL их сериализует advisory lock.
+"""
+import json
+import logging
+from sqlalchemy import inspect, select, text, update
+from database import (
+    SessionLocal,
+    SchemaMigration,
+    User,
+    CycleRecord,
+    compute_notification_minute_utc,
+    cycle_stats_values,
+    get_average_cycle_lengths,
+    rebuild_user_schedules,
+    replay_cycle_length_stats,
+)
+from cycle_calculator import encode_cycle_data
+from notification_schedule import compute_user_schedule, local_today
+import config
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory lock PostgreSQL для миграций (произвольная константа)
+MIGRATIONS_LOCK_KEY = 72817001
+
+
+def _is_postgresql(engine) -> bool:
+    return engine.dialect.name == "postgresql"
+
+
+def column_exists(engine, table: str, column: str) -> bool:
+    return column in {col["name"] for col in inspect(engine).get_columns(table)}
+
+
+def add_column(engine, table: str, column: str, ddl_type: str) -> None:
+    """Добавить столбец, если его нет (без DEFAULT — быстро и без перезаписи таблицы)."""
+    if column_exists(engine, table, column):
+        return
+    logger.info(f"Добавление столбца {table}.{column}...")
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl_type}"))
+
+
+def create_index(engine, name: str, table: str, columns: tuple) -> None:
+    """Создать индекс, если его нет; в PostgreSQL — CONCURRENTLY, вне транзакции."""
+    cols = ", ".join(columns)
+    if _is_postgresql(engine):
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({cols})"))
+    else:
+        with engine.begin() as conn:
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({cols})"))
+
+
+def backfill(engine, select_sql: str, update_sql: str, compute) -> int:
+    """
+    Заполнить столбец пачками: select_sql выбирает до :limit ещё не заполненных строк (id > :last_id, по id),
+    compute(row) возвращает параметры update_sql для строки (None — строку не менять). Каждая пачка — отдельная транзакция.
+    """
+    total = 0
+    last_id = 0  # id — Telegram ID пользователя / автоинкремент, всегда положительный
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(
+                text(select_sql), {"last_id": last_id, "limit": config.MIGRATION_BATCH_SIZE}
+            ).fetchall()
+            if not rows:
+                return total
+            params = [p for p in map(compute, rows) if p is not None]
+            if params:
+                conn.execute(text(update_sql), params)
+        total += len(rows)
+        last_id = rows[-1].id
+        logger.info(f"Заполнено строк: {total}")
+
+
+# --- Миграции (номер версии никогда не меняется; новые — только в конец) ---
+
+def m001_cycle_actual_end_date(engine):
+    add_column(engine, "cycle_records", "cycle_actual_end_date", "DATE")
+
+
+def m002_pinned_message_id(engine):
+    add_column(engine, "users", "pinned_message_id", "INTEGER")
+
+
+def m003_cycle_extended_days(engine):
+    add_column(engine, "users", "cycle_extended_days", "INTEGER")
+    backfill(
+        engine,
+        "SELECT id FROM users WHERE cycle_extended_days IS NULL AND id > :last_id ORDER BY id LIMIT :limit",
+        "UPDATE users SET cycle_extended_days = 0 WHERE id = :id",
+        lambda row: {"id": row.id},
+    )
+
+
+def m004_last_phase_advance_date(engine):
+    add_column(engine, "users", "last_phase_advance_date", "DATE")
+
+
+def m005_notification_minute_utc(engine):
+    add_column(engine, "users", "notification_minute_utc", "INTEGER")
+    backfill(
+        engine,
+        "SELECT id, notification_time, timezone FROM users "
+        "WHERE notification_minute_utc IS NULL AND id > :last_id ORDER BY id LIMIT :limit",
+        "UPDATE users SET notification_minute_utc = :minute WHERE id = :id",
+        lambda row: {"id": row.id, "minute": compute_notification_minute_utc(row.notification_time, row.timezone)},
+    )
+    create_index(engine, "ix_users_notification_minute_utc", "users", ("notification_minute_utc",))
+
+
+def m006_schedule_columns(engine):
+    added = False
+    for column in ("next_stage_start_date", "next_phase_advance_date", "cycle_end_date"):
+        if not column_exists(engine, "users", column):
+            add_column(engine, "users", column, "DATE")
+            added = True
+        create_index(engine, f"ix_users_{column}", "users", (column,))
+    if added:
+        session = SessionLocal()
+        try:
+            rebuild_user_schedules(session, batch_size=config.MIGRATION_BATCH_SIZE)
+        finally:
+            session.close()
+
+
+def m007_cycle_records_user_start_index(engine):
+    # get_last_cycle_record / get_last_n_cycle_records / update_cycle_record_actual_end / окно row_number
+    create_index(engine, "ix_cycle_records_user_start", "cycle_records", ("user_id", "cycle_start_date"))
+
+
+def m008_scheduler_indexes(engine):
+    create_index(engine, "ix_users_due_stage", "users", ("notification_minute_utc", "next_stage_start_date"))
+    create_index(engine, "ix_users_due_cycle_end", "users", ("notification_minute_utc", "cycle_end_date"))
+    create_index(engine, "ix_users_phase_advance", "users", ("timezone", "next_phase_advance_date"))
+    create_index(engine, "ix_notification_outbox_status_created", "notification_outbox", ("status", "created_at"))
+
+
+def m009_avg_cycle_length(engine):
+    add_column(engine, "users", "avg_cycle_length", "INTEGER")
+    # Средняя длительность считается по истории циклов (оконный запрос на пачку пользователей)
+    session = SessionLocal()
+    try:
+        total = 0
+        last_id = 0
+        while True:
+            user_ids = session.execute(
+                select(User.id).where(User.id > last_id).order_by(User.id).limit(config.MIGRATION_BATCH_SIZE)
+            ).scalars().all()
+            if not user_ids:
+                break
+            averages = get_average_cycle_lengths(session, user_ids)
+            updates = [{"id": user_id, "avg_cycle_length": avg} for user_id, avg in averages.items() if avg is not None]
+            if updates:
+                session.execute(update(User), updates)
+            session.commit()
+            total += len(user_ids)
+            last_id = user_ids[-1]
+        logger.info(f"Средняя длительность цикла заполнена для {total} пользователей")
+    finally:
+        session.close()
+
+
+def _packed_cycle_record(row):
+    try:
+        packed = encode_cycle_data(json.loads(row.cycle_data), row.cycle_start_date)
+    except (TypeError, ValueError):
+        packed = None
+    if packed is None:
+        # Нестандартная структура — запись остаётся в JSON
+        return None
+    return {"id": row.id, "packed": packed}
+
+
+def m010_cycle_offsets(engine):
+    add_column(engine, "cycle_records", "cycle_offsets", "BYTEA" if _is_postgresql(engine) else "BLOB")
+    backfill(
+        engine,
+        "SELECT id, cycle_start_date, cycle_data FROM cycle_records "
+        "WHERE cycle_offsets IS NULL AND id > :last_id ORDER BY id LIMIT :limit",
+        "UPDATE cycle_records SET cycle_offsets = :packed, cycle_data = '' WHERE id = :id",
+        _packed_cycle_record,
+    )
+
+
+def m011_cycle_length_stats(engine):
+    for column, ddl_type in (
+        ("cycle_stats_count", "INTEGER"),
+        ("cycle_stats_mean", "FLOAT"),
+        ("cycle_stats_m2", "FLOAT"),
+        ("cycle_stats_ewma", "FLOAT"),
+        ("cycle_stats_last_start", "DATE"),
+        ("cycle_stats_last_length", "INTEGER"),
+    ):
+        add_column(engine, "users", column, ddl_type)
+    # Статистика — по всей истории каждого пользователя. Прогноз avg_cycle_length переходит на EWMA,
+    # поэтому график событий пересчитывается вместе с ним
+    columns = (
+        User.id, User.cycle_length, User.period_length, User.last_period_start, User.cycle_extended_days, User.timezone,
+    )
+    session = SessionLocal()
+    try:
+        total = 0
+        last_id = 0
+        while True:
+            users = session.execute(
+                select(*columns).where(User.id > last_id).order_by(User.id).limit(config.MIGRATION_BATCH_SIZE)
+            ).all()
+            if not users:
+                break
+            records_by_user = {}
+            for row in session.execute(
+                select(CycleRecord.user_id, CycleRecord.cycle_start_date, CycleRecord.cycle_actual_end_date)
+                .where(CycleRecord.user_id.in_([user.id for user in users]))
+                .order_by(CycleRecord.user_id, CycleRecord.cycle_start_date)
+            ):
+                records_by_user.setdefault(row.user_id, []).append(row)
+            updates = []
+            for user in users:
+                values = cycle_stats_values(replay_cycle_length_stats(records_by_user.get(user.id, [])))
+                if user.last_period_start is not None:
+                    effective_len = values["avg_cycle_length"] or max(21, min(35, user.cycle_length or 28))
+                    values.update(compute_user_schedule(user, local_today(user.timezone), effective_len))
+                updates.append({"id": user.id, **values})
+            session.execute(update(User), updates)
+            session.commit()
+            total += len(users)
+            last_id = users[-1].id
+        logger.info(f"Статистика длительности циклов заполнена для {total} пользователей")
+    finally:
+        session.close()
+
+
+MIGRATIONS = [
+    (1, "cycle_records.cycle_actual_end_date", m001_cycle_actual_end_date),
+    (2, "users.pinned_message_id", m002_pinned_message_id),
+    (3, "users.cycle_extended_days", m003_cycle_extended_days),
+    (4, "users.last_phase_advance_date", m004_last_phase_advance_date),
+    (5, "users.notification_minute_utc", m005_notification_minute_utc),
+    (6, "users schedule columns", m006_schedule_columns),
+    (7, "index cycle_records (user_id, cycle_start_date)", m007_cycle_records_user_start_index),
+    (8, "scheduler and outbox composite indexes", m008_scheduler_indexes),
+    (9, "users.avg_cycle_length", m009_avg_cycle_length),
+    (10, "cycle_records.cycle_offsets", m010_cycle_offsets),
+    (11, "users cycle length statistics", m011_cycle_length_stats),
+]
+
+
+def _applied_versions() -> set:
+    session = SessionLocal()
+    try:
+        return {version for (version,) in session.query(SchemaMigration.version)}
+    finally:
+        session.close()
+
+
+def _mark_applied(version: int, name: str) -> None:
+    session = SessionLocal()
+    try:
+        session.add(SchemaMigration(version=version, name=name))
+        session.commit()
+    finally:
+        session.close()
+
+
+def run_migrations(engine) -> int:
+    """Применить ещё не применённые миграции по порядку. Возвращает число применённых."""
+    lock_conn = None
+    if _is_postgresql(engine):
+        lock_conn = engine.connect().execution_options(isolation_level="AUTOCOMMIT")
+        lock_conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+    try:
+        applied = _applied_versions()
+        count = 0
+        for version, name, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info(f"Миграция {version}: {name}...")
+            migrate(engine)
+            _mark_applied(version, name)
+            count += 1
+            logger.info(f"Миграция {version} применена")
+        return count
+    finally:
+        if lock_conn is not None:
+            lock_conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+            lock_conn.close()
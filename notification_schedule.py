@@ -0,0 +1,115 @@
+"""
+Материализованный график событий пользователя для планировщика уведомлений.
+
+В таблице users хранятся ближайшие даты событий (начало фазы/подфазы, напоминание о приближении фазы,
+завершение цикла), чтобы планировщик выбирал индексным запросом только тех, у кого событие наступило,
+а не пересчитывал цикл для всех подряд. График пересчитывается при любом изменении данных цикла.
+"""
+from datetime import date, datetime, timedelta
+import pytz
+from database import effective_cycle_length
+from cycle_calculator import CycleCalculator, get_next_stage_start
+
+# За сколько дней до новой фазы отправляется напоминание
+PHASE_ADVANCE_DAYS = 2
+
+
+def local_today(timezone_offset) -> date:
+    """Текущая дата в часовом поясе со смещением timezone_offset относительно МСК."""
+    try:
+        offset = int(timezone_offset or 0)
+    except (TypeError, ValueError):
+        offset = 0
+    msk_now = datetime.now(pytz.timezone("Europe/Moscow"))
+    return (msk_now + timedelta(hours=offset)).date()
+
+
+def compute_user_schedule(user, from_date: date, effective_len: int = None) -> dict:
+    """
+    Рассчитать ближайшие события пользователя начиная с from_date.
+    Возвращает dict: next_stage_start_date, next_phase_advance_date, cycle_end_date (date или None).
+    """
+    if user.last_period_start is None:
+        return {
+            "next_stage_start_date": None,
+            "next_phase_advance_date": None,
+            "cycle_end_date": None,
+        }
+    if effective_len is None:
+        effective_len = effective_cycle_length(user)
+    extended = user.cycle_extended_days or 0
+    calculator = CycleCalculator(user.last_period_start, effective_len, user.period_length)
+    return {
+        "next_stage_start_date": get_next_stage_start(
+            effective_len, user.period_length, user.last_period_start, from_date
+        ),
+        "next_phase_advance_date": calculator.get_phase_advance_date(from_date, PHASE_ADVANCE_DAYS),
+        # Цикл считается завершённым, когда прошло >= (длина + продление) дней
+        "cycle_end_date": user.last_period_start + timedelta(days=effective_len + extended - 1),
+    }
+
+
+def refresh_user_schedule(user, from_date: date = None, effective_len: int = None) -> None:
+    """
+    Пересчитать материализованный график пользователя (без commit — сохраняет вызывающий код).
+    from_date по умолчанию — сегодняшняя дата в часовом поясе пользователя.
+    """
+    if from_date is None:
+        from_date = local_today(user.timezone)
+    for field, value in compute_user_schedule(user, from_date, effective_len).items():
+        setattr(user, field, value)
+
+
+class TickWindow:
+    """
+    Полуинтервал минут [start, end) по UTC, который обрабатывает один тик планировщика.
+    Если тик опоздал или бот был остановлен, окно охватывает все пропущенные минуты (не более суток),
+    и события за них обрабатываются одним пакетом.
+    """
+    
+    def __init__(self, start: datetime, end: datetime):
+        self.start = start
+        self.end = end
+    
+    @property
+    def minutes(self) -> int:
+        return int((self.end - self.start).total_seconds() // 60)
+    
+    def minutes_of_day(self) -> list:
+        """Минуты суток (UTC), попадающие в окно; None — окно покрывает сутки целиком."""
+        if self.minutes >= 1440:
+            return None
+        first = self.start.hour * 60 + self.start.minute
+        return [(first + i) % 1440 for i in range(self.minutes)]
+    
+    def occurrence_of_minute(self, minute_of_day: int):
+        """Последний момент в окне (UTC) с заданной минутой суток или None."""
+        if minute_of_day is None:
+            return None
+        last = self.end - timedelta(minutes=1)
+        back = (last.hour * 60 + last.minute - minute_of_day) % 1440
+        moment = last - timedelta(minutes=back)
+        return moment if moment >= self.start else None
+    
+    def occurrence_of_local_time(self, timezone_offset: int, local_time: str):
+        """Последний момент в окне (UTC), когда в часовом поясе (смещение от МСК) было local_time (ЧЧ:ММ)."""
+        hours, minutes = (int(part) for part in local_time.split(':'))
+        msk_offset = int(pytz.timezone("Europe/Moscow").utcoffset(self.start.replace(tzinfo=None)).total_seconds()) // 60
+        return self.occurrence_of_minute((hours * 60 + minutes - timezone_offset * 60 - msk_offset) % 1440)
+    
+    def timezones_with_local_time(self, local_time: str) -> list:
+        """Смещения относительно МСК (-12…+14), в которых за время окна наступало local_time."""
+        return [
+            offset for offset in range(-12, 15)
+            if self.occurrence_of_local_time(offset, local_time) is not None
+        ]
+    
+    def latest_local_date(self):
+        """Самая поздняя местная дата в окне среди всех часовых поясов (МСК+14)."""
+        last = (self.end - timedelta(minutes=1)).astimezone(pytz.timezone("Europe/Moscow"))
+        return (last + timedelta(hours=14)).date()
+
+
+def local_datetime(moment: datetime, timezone_offset: int) -> datetime:
+    """Местное время пользователя (смещение от МСК) в момент moment (UTC)."""
+    return moment.astimezone(pytz.timezone("Europe/Moscow")) + timedelta(hours=timezone_offset)
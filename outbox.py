@@ -0,0 +1,248 @@
+"""
+Отправка уведомлений из outbox (таблица notification_outbox).
+
+Планировщик только рассчитывает и записывает готовые уведомления, а этот цикл забирает созревшие записи,
+рассылает их через диспетчер (dispatch.py) и отмечает результат. Ошибки доставки повторяются
+с экспоненциальной задержкой; записи, «зависшие» в отправке после падения процесса, возвращаются в очередь.
+
+claimed_at записи — метка взятия в отправку: отправитель продлевает её перед отправкой чата и отмечает
+результат только у записей со своей меткой, поэтому записи, которые уже вернули в очередь и забрал другой
+отправитель, повторно не отправляются и не перезаписываются.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime, timedelta
+from telegram import InlineKeyboardMarkup
+from telegram.error import BadRequest, Forbidden
+from database import SessionLocal, User, NotificationOutbox
+from dispatch import get_dispatcher
+import config
+
+logger = logging.getLogger(__name__)
+
+STATUS_PENDING = 'pending'
+STATUS_SENDING = 'sending'
+STATUS_SENT = 'sent'
+STATUS_FAILED = 'failed'
+STATUS_EXPIRED = 'expired'
+
+# Одна отправка на процесс: задача тика (run_once) может совпасть с периодической drain_outbox
+_drain_lock = asyncio.Lock()
+
+
+def retry_delay(attempts: int) -> timedelta:
+    """Экспоненциальная задержка перед повтором: base * 2^(attempts-1), не более OUTBOX_RETRY_MAX_DELAY."""
+    seconds = config.OUTBOX_RETRY_BASE_DELAY * (2 ** max(0, attempts - 1))
+    return timedelta(seconds=min(seconds, config.OUTBOX_RETRY_MAX_DELAY))
+
+
+def release_stale_claims() -> int:
+    """Вернуть в очередь записи, взятые в отправку процессом, который не отчитался (упал или перезапущен)."""
+    session = SessionLocal()
+    try:
+        deadline = datetime.utcnow() - timedelta(seconds=config.OUTBOX_CLAIM_TIMEOUT)
+        released = session.query(NotificationOutbox).filter(
+            NotificationOutbox.status == STATUS_SENDING,
+            NotificationOutbox.claimed_at < deadline
+        ).update({NotificationOutbox.status: STATUS_PENDING}, synchronize_session=False)
+        session.commit()
+        if released:
+            logger.warning(f"Outbox: возвращено в очередь {released} незавершённых отправок")
+        return released
+    finally:
+        session.close()
+
+
+def claim_due_notifications(limit: int) -> list:
+    """
+    Забрать в отправку до limit созревших записей (по порядку создания) и вернуть их снимки (dict).
+    Просроченные (старше OUTBOX_TTL_HOURS) помечаются expired и не отправляются.
+    """
+    session = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        session.query(NotificationOutbox).filter(
+            NotificationOutbox.status == STATUS_PENDING,
+            NotificationOutbox.created_at < now - timedelta(hours=config.OUTBOX_TTL_HOURS)
+        ).update({NotificationOutbox.status: STATUS_EXPIRED}, synchronize_session=False)
+        rows = session.query(NotificationOutbox, User.pinned_message_id).join(
+            User, User.id == NotificationOutbox.user_id
+        ).filter(
+            NotificationOutbox.status == STATUS_PENDING,
+            NotificationOutbox.next_attempt_at <= now
+        ).order_by(NotificationOutbox.id).limit(limit).with_for_update(skip_locked=True, of=NotificationOutbox).all()
+        claimed = []
+        for row, pinned_message_id in rows:
+            row.status = STATUS_SENDING
+            row.claimed_at = now
+            row.attempts = (row.attempts or 0) + 1
+            claimed.append({
+                "id": row.id,
+                "user_id": row.user_id,
+                "kind": row.kind,
+                "text": row.text,
+                "reply_markup": row.reply_markup,
+                "parse_mode": row.parse_mode,
+                "pin": row.pin,
+                "attempts": row.attempts,
+                "claimed_at": now,
+                "pinned_before": pinned_message_id,
+            })
+        session.commit()
+        return claimed
+    finally:
+        session.close()
+
+
+def renew_claims(rows: list) -> bool:
+    """
+    Продлить взятие записей одного чата (одна метка claimed_at) перед их отправкой.
+    False — записи уже вернули в очередь (отправка затянулась дольше OUTBOX_CLAIM_TIMEOUT), отправлять их нельзя.
+    """
+    session = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        renewed = session.query(NotificationOutbox).filter(
+            NotificationOutbox.id.in_([row["id"] for row in rows]),
+            NotificationOutbox.status == STATUS_SENDING,
+            NotificationOutbox.claimed_at == rows[0]["claimed_at"]
+        ).update({NotificationOutbox.claimed_at: now}, synchronize_session=False)
+        if renewed != len(rows):
+            session.rollback()
+            return False
+        session.commit()
+        for row in rows:
+            row["claimed_at"] = now
+        return True
+    finally:
+        session.close()
+
+
+def record_results(results: list):
+    """
+    Сохранить результаты отправки. results — dict с полями:
+    id, user_id, status, attempts, claimed_at, message_id | error + delay (задержка до повтора),
+    pinned_message_id (если закреплённое сообщение изменилось).
+    Записи, которые уже не числятся за этим отправителем (другая метка claimed_at), не изменяются.
+    """
+    if not results:
+        return
+    session = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        for result in results:
+            values = {
+                NotificationOutbox.status: result["status"],
+                NotificationOutbox.attempts: result["attempts"],
+            }
+            if result["status"] == STATUS_SENT:
+                values[NotificationOutbox.sent_at] = now
+                values[NotificationOutbox.message_id] = result.get("message_id")
+                values[NotificationOutbox.last_error] = None
+            else:
+                values[NotificationOutbox.last_error] = result.get("error")
+                if result["status"] == STATUS_PENDING:
+                    values[NotificationOutbox.next_attempt_at] = now + result["delay"]
+            updated = session.query(NotificationOutbox).filter(
+                NotificationOutbox.id == result["id"],
+                NotificationOutbox.status == STATUS_SENDING,
+                NotificationOutbox.claimed_at == result["claimed_at"]
+            ).update(values, synchronize_session=False)
+            if not updated:
+                logger.warning(f"Outbox: запись {result['id']} уже возвращена в очередь, результат не сохранён")
+                continue
+            if "pinned_message_id" in result:
+                session.query(User).filter(User.id == result["user_id"]).update(
+                    {User.pinned_message_id: result["pinned_message_id"]}, synchronize_session=False
+                )
+        session.commit()
+    finally:
+        session.close()
+
+
+def _failure_status(error: Exception, attempts: int) -> str:
+    """Постоянные ошибки (бот заблокирован, чат не найден) и исчерпанные попытки — failed, иначе повтор."""
+    if isinstance(error, (Forbidden, BadRequest)) or attempts >= config.OUTBOX_MAX_ATTEMPTS:
+        return STATUS_FAILED
+    return STATUS_PENDING
+
+
+def _chat_job(dispatcher, rows: list):
+    """Задание для одного чата: отправить записи по порядку; после первой ошибки остальные ждут повтора."""
+    async def job():
+        if not await asyncio.to_thread(renew_claims, rows):
+            logger.warning(f"Outbox: записи пользователя {rows[0]['user_id']} уже возвращены в очередь, пропускаем")
+            return
+        results = []
+        pinned_message_id = rows[0]["pinned_before"]
+        try:
+            for i, row in enumerate(rows):
+                try:
+                    reply_markup = None
+                    if row["reply_markup"]:
+                        reply_markup = InlineKeyboardMarkup.de_json(json.loads(row["reply_markup"]), dispatcher.bot)
+                    msg = await dispatcher.send_message(
+                        row["user_id"], text=row["text"], reply_markup=reply_markup, parse_mode=row["parse_mode"]
+                    )
+                except Exception as e:
+                    logger.error(f"Outbox: ошибка отправки записи {row['id']} пользователю {row['user_id']}: {e}")
+                    delay = retry_delay(row["attempts"])
+                    results.append({**row, "status": _failure_status(e, row["attempts"]), "error": str(e), "delay": delay})
+                    # Порядок сообщений в чате сохраняем: оставшиеся записи повторятся вместе с неудачной,
+                    # попытка им не засчитывается
+                    results.extend(
+                        {**rest, "status": STATUS_PENDING, "attempts": rest["attempts"] - 1, "error": None, "delay": delay}
+                        for rest in rows[i + 1:]
+                    )
+                    break
+                result = {**row, "status": STATUS_SENT, "message_id": msg.message_id}
+                if row["pin"]:
+                    if pinned_message_id:
+                        try:
+                            await dispatcher.call(
+                                row["user_id"], dispatcher.bot.unpin_chat_message, message_id=pinned_message_id
+                            )
+                        except Exception as e:
+                            logger.warning(f"Не удалось открепить сообщение для пользователя {row['user_id']}: {e}")
+                        pinned_message_id = None
+                        result["pinned_message_id"] = None
+                    try:
+                        await dispatcher.call(
+                            row["user_id"], dispatcher.bot.pin_chat_message,
+                            message_id=msg.message_id,
+                            disable_notification=True
+                        )
+                        pinned_message_id = msg.message_id
+                        result["pinned_message_id"] = msg.message_id
+                    except Exception as e:
+                        logger.warning(f"Не удалось закрепить сообщение для пользователя {row['user_id']}: {e}")
+                results.append(result)
+        finally:
+            # Отмечаем результат сразу по завершении чата, чтобы после падения не отправить повторно
+            await asyncio.to_thread(record_results, results)
+    return job
+
+
+async def drain_outbox(context):
+    """Задача JobQueue: отправить созревшие уведомления из outbox (пропускается, если отправка уже идёт)."""
+    if _drain_lock.locked():
+        return
+    async with _drain_lock:
+        await _drain(get_dispatcher(context.bot))
+
+
+async def _drain(dispatcher):
+    # Запросы к БД — в отдельном потоке, чтобы не задерживать обработку апдейтов
+    await asyncio.to_thread(release_stale_claims)
+    while True:
+        rows = await asyncio.to_thread(claim_due_notifications, config.OUTBOX_BATCH_SIZE)
+        if not rows:
+            return
+        by_chat = {}
+        for row in rows:
+            by_chat.setdefault(row["user_id"], []).append(row)
+        stats = await dispatcher.run([(chat_id, _chat_job(dispatcher, chat_rows)) for chat_id, chat_rows in by_chat.items()])
+        logger.info(f"Outbox: {stats}")
+        if len(rows) < config.OUTBOX_BATCH_SIZE:
+            return
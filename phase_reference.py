@@ -0,0 +1,127 @@
+"""
+Справочник фаз и подфаз (data/phase_reference.json) для текстов отчётов и раздела «Фазы цикла».
+
+Файл загружается в индекс по ключу (фаза англ., подфаза): поиск — один запрос к словарю, а блоки Markdown
+(симптомы, поведение, рекомендации) отрисовываются один раз при загрузке и хранятся рядом с исходными списками.
+При изменении файла (mtime/размер) справочник перечитывается без перезапуска бота: новый индекс собирается
+целиком и подменяет старый одной операцией, поэтому читатели видят либо старую, либо новую версию.
+"""
+import json
+import logging
+import os
+import threading
+import time
+import config
+
+logger = logging.getLogger(__name__)
+
+# Маппинг рассчитанных фаз (англ.) на phase_name в справочнике (рус.)
+PHASE_NAME_TO_REF = {
+    "Menstrual Phase": "Менструальная фаза (общая)",
+    "Follicular Phase": "Фолликулярная фаза (общая информация)",
+    "Ovulation": "Овуляция",
+    "Luteal Phase": "Лютеиновая фаза (общая информация)",
+}
+REF_NAME_TO_PHASE = {ref_name: phase_name for phase_name, ref_name in PHASE_NAME_TO_REF.items()}
+
+# Списки записи справочника; у каждого есть готовый блок Markdown с суффиксом _md
+REF_BLOCKS = ("symptoms", "behavior", "male_recommendations")
+
+
+def format_ref_block(items: list) -> str:
+    if not items:
+        return ""
+    return "\n".join(f"• {s}" for s in items) if isinstance(items[0], str) else "\n".join(items)
+
+
+def _entry(item: dict, title_key: str, title: str) -> dict:
+    entry = {title_key: title}
+    for block in REF_BLOCKS:
+        items = item.get(block, [])
+        entry[block] = items
+        entry[f"{block}_md"] = format_ref_block(items)
+    return entry
+
+
+def build_reference_index(data: dict) -> dict:
+    """
+    {(phase_name_en, stage): запись}: stage None — фаза целиком (с phase_name_ru), иначе подфаза (с subphase_name).
+    При повторе фазы или подфазы в файле действует первая запись.
+    """
+    index = {}
+    for phase in data.get("phases", []):
+        phase_name_en = REF_NAME_TO_PHASE.get(phase.get("phase_name"))
+        if phase_name_en is None or (phase_name_en, None) in index:
+            continue
+        index[(phase_name_en, None)] = _entry(phase, "phase_name_ru", phase.get("phase_name", ""))
+        for sub in phase.get("subphases") or []:
+            if sub.get("stage"):
+                index.setdefault((phase_name_en, sub["stage"]), _entry(sub, "subphase_name", sub.get("subphase_name", "")))
+    return index
+
+
+class PhaseReference:
+    """Справочник фаз из JSON-файла с перезагрузкой при изменении файла."""
+
+    def __init__(self, path: str, check_interval: float = None):
+        self.path = path
+        self.check_interval = config.PHASE_REFERENCE_CHECK_INTERVAL if check_interval is None else check_interval
+        self._index = None
+        self._signature = None  # (mtime_ns, размер) загруженного файла
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self._reload_callbacks = []
+
+    def on_reload(self, callback) -> None:
+        """Вызывать callback() после каждой перезагрузки (например, чтобы сбросить кэши готовых текстов)."""
+        self._reload_callbacks.append(callback)
+
+    def _file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Перечитать файл, если он изменился (проверка не чаще раза в check_interval секунд).
+        Возвращает True, если справочник был перезагружен.
+        """
+        now = time.monotonic()
+        if not force and self._index is not None and now - self._checked_at < self.check_interval:
+            return False
+        with self._lock:
+            self._checked_at = now
+            signature = self._file_signature()
+            if not force and self._index is not None and signature == self._signature:
+                return False
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    index = build_reference_index(json.load(f))
+            except Exception as e:
+                if self._index is None:
+                    logger.warning(f"Не удалось загрузить справочник фаз: {e}")
+                    self._index = {}
+                else:
+                    logger.warning(f"Не удалось перечитать справочник фаз, остаётся прежняя версия: {e}")
+                self._signature = signature
+                return False
+            reloaded = self._index is not None
+            self._index = index
+            self._signature = signature
+        if reloaded:
+            logger.info(f"Справочник фаз перезагружен: {self.path}")
+        for callback in self._reload_callbacks:
+            callback()
+        return True
+
+    def get(self, phase_name_en: str, stage: str = None) -> dict:
+        """
+        Запись справочника: symptoms, behavior, male_recommendations (+ готовые *_md) и subphase_name для подфазы
+        или phase_name_ru для фазы (в том числе если подфазы stage нет). {} — фаза не найдена.
+        Запись общая для всех вызывающих — изменять её нельзя.
+        """
+        self.refresh()
+        index = self._index
+        return index.get((phase_name_en, stage or None)) or index.get((phase_name_en, None)) or {}
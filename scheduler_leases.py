@@ -0,0 +1,140 @@
+"""
+Шардирование планировщика уведомлений между процессами бота через аренды в БД.
+
+Пользователи делятся на SCHEDULER_SHARDS шардов по id (id % shards). Каждый процесс на каждом тике отмечается
+в scheduler_workers (heartbeat), продлевает свои аренды в scheduler_leases и забирает свободные или просроченные
+шарды — но не больше своей доли ceil(shards / живых процессов); лишние шарды отдаёт, чтобы новый процесс
+получил свою часть. Если процесс упал, его аренды истекают через SCHEDULER_LEASE_TTL, шарды забирают остальные
+и продолжают с позиции шарда в scheduler_state (пропущенные минуты догоняются окном тика).
+
+Все захваты — условные UPDATE (compare-and-set), поэтому работают одинаково на SQLite и PostgreSQL.
+"""
+import logging
+import math
+import os
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal, SchedulerLease, SchedulerWorker
+import config
+
+logger = logging.getLogger(__name__)
+
+# Идентификатор этого процесса в таблицах аренд
+WORKER_ID = config.SCHEDULER_WORKER_ID or f"{socket.gethostname()}:{os.getpid()}"
+
+# Аренда, которой никогда не было, считается давно истёкшей
+_NEVER = datetime(1970, 1, 1)
+
+
+def _ensure_lease_rows(session, shards: int) -> None:
+    """Создать недостающие строки аренд (при первом запуске или увеличении числа шардов)."""
+    existing = {shard for (shard,) in session.query(SchedulerLease.shard).filter(SchedulerLease.shard < shards)}
+    missing = [shard for shard in range(shards) if shard not in existing]
+    if not missing:
+        return
+    try:
+        session.add_all(SchedulerLease(shard=shard, owner=None, expires_at=_NEVER) for shard in missing)
+        session.commit()
+    except IntegrityError:
+        # Строки одновременно создал другой процесс
+        session.rollback()
+
+
+def _heartbeat(session, now: datetime) -> None:
+    """Отметить, что процесс жив."""
+    updated = session.query(SchedulerWorker).filter(SchedulerWorker.worker_id == WORKER_ID).update(
+        {SchedulerWorker.heartbeat_at: now}, synchronize_session=False
+    )
+    if not updated:
+        session.add(SchedulerWorker(worker_id=WORKER_ID, heartbeat_at=now, started_at=now))
+    # Давно молчащие процессы больше не нужны даже для диагностики
+    session.query(SchedulerWorker).filter(
+        SchedulerWorker.heartbeat_at < now - timedelta(days=1)
+    ).delete(synchronize_session=False)
+    session.commit()
+
+
+def acquire_shards(shards: int = None) -> list:
+    """
+    Продлить свои аренды и добрать шарды до своей доли. Возвращает отсортированный список шардов,
+    которые этот процесс обрабатывает в текущем тике.
+    """
+    shards = shards or config.SCHEDULER_SHARDS
+    ttl = timedelta(seconds=config.SCHEDULER_LEASE_TTL)
+    session = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        _ensure_lease_rows(session, shards)
+        _heartbeat(session, now)
+
+        live_workers = session.query(SchedulerWorker.worker_id).filter(
+            SchedulerWorker.heartbeat_at > now - ttl
+        ).count()
+        fair_share = math.ceil(shards / max(1, live_workers))
+
+        leases = session.query(SchedulerLease).filter(SchedulerLease.shard < shards).order_by(SchedulerLease.shard).all()
+        held = [lease.shard for lease in leases if lease.owner == WORKER_ID]
+        free = [lease.shard for lease in leases if lease.owner != WORKER_ID and (lease.owner is None or lease.expires_at <= now)]
+        session.expunge_all()
+
+        # Лишние шарды (появились новые процессы) отдаём сразу — их заберут на своём тике
+        surplus = held[fair_share:]
+        if surplus:
+            session.query(SchedulerLease).filter(
+                SchedulerLease.shard.in_(surplus), SchedulerLease.owner == WORKER_ID
+            ).update({SchedulerLease.owner: None, SchedulerLease.expires_at: now}, synchronize_session=False)
+            logger.info(f"Планировщик {WORKER_ID}: отданы шарды {surplus}")
+
+        owned = []
+        for shard in held[:fair_share]:
+            # Продление засчитывается, только если аренду за время паузы не забрал другой процесс
+            if _compare_and_set(session, shard, now, ttl, SchedulerLease.owner == WORKER_ID):
+                owned.append(shard)
+        for shard in free:
+            if len(owned) >= fair_share:
+                break
+            claimable = (SchedulerLease.owner.is_(None)) | (SchedulerLease.expires_at <= now)
+            if _compare_and_set(session, shard, now, ttl, claimable):
+                owned.append(shard)
+                logger.info(f"Планировщик {WORKER_ID}: получен шард {shard}")
+        session.commit()
+        return sorted(owned)
+    finally:
+        session.close()
+
+
+def _compare_and_set(session, shard: int, now: datetime, ttl: timedelta, condition) -> bool:
+    """Занять/продлить аренду шарда, если выполняется condition; True — аренда за этим процессом."""
+    updated = session.query(SchedulerLease).filter(SchedulerLease.shard == shard, condition).update({
+        SchedulerLease.owner: WORKER_ID,
+        SchedulerLease.expires_at: now + ttl,
+        SchedulerLease.heartbeat_at: now,
+    }, synchronize_session=False)
+    return updated == 1
+
+
+def renew_lease(session, shard: int) -> bool:
+    """
+    Продлить аренду шарда в транзакции вызывающего кода (перед сохранением позиции шарда).
+    False — шард уже обрабатывает другой процесс, и изменения нужно откатить.
+    """
+    now = datetime.utcnow()
+    return _compare_and_set(
+        session, shard, now, timedelta(seconds=config.SCHEDULER_LEASE_TTL), SchedulerLease.owner == WORKER_ID
+    )
+
+
+def release_all() -> None:
+    """Отдать все аренды процесса при штатной остановке, чтобы шарды забрали без ожидания TTL."""
+    session = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        session.query(SchedulerLease).filter(SchedulerLease.owner == WORKER_ID).update(
+            {SchedulerLease.owner: None, SchedulerLease.expires_at: now}, synchronize_session=False
+        )
+        session.query(SchedulerWorker).filter(SchedulerWorker.worker_id == WORKER_ID).delete(synchronize_session=False)
+        session.commit()
+        logger.info(f"Планировщик {WORKER_ID}: аренды освобождены")
+    finally:
+        session.close()
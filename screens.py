@@ -0,0 +1,270 @@
+"""
+Статические экраны бота: текст и клавиатура, собранные один раз при импорте.
+
+Объекты клавиатур python-telegram-bot неизменяемы, поэтому одни и те же экземпляры безопасно отдавать
+во всех ответах: обработчики берут готовый экран из реестра, а не собирают разметку и текст на каждое нажатие.
+Здесь только то, что не зависит от пользователя; выбор варианта (например, главного меню) — в bot.py.
+"""
+from typing import NamedTuple
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, KeyboardButton, ReplyKeyboardMarkup
+
+
+class Screen(NamedTuple):
+    """Готовый экран: текст, клавиатура и режим разметки."""
+    text: str
+    reply_markup: object = None
+    parse_mode: str = None
+
+    async def edit(self, query, reply_markup=None):
+        """Показать экран, отредактировав сообщение с кнопкой (reply_markup — заменить клавиатуру экрана)."""
+        kwargs = {"parse_mode": self.parse_mode} if self.parse_mode else {}
+        return await query.edit_message_text(self.text, reply_markup=reply_markup or self.reply_markup, **kwargs)
+
+    async def reply(self, message, reply_markup=None):
+        """Показать экран новым сообщением."""
+        kwargs = {"parse_mode": self.parse_mode} if self.parse_mode else {}
+        return await message.reply_text(self.text, reply_markup=reply_markup or self.reply_markup, **kwargs)
+
+
+def _keyboard(*rows) -> InlineKeyboardMarkup:
+    """Клавиатура из рядов кнопок (текст, callback_data)."""
+    return InlineKeyboardMarkup([[InlineKeyboardButton(text, callback_data=data) for text, data in row] for row in rows])
+
+
+# --- Постоянная клавиатура (горячие кнопки в интерфейсе, не в сообщении) ---
+
+KEYBOARD_MAIN_MENU = "🏠 Главное меню"
+KEYBOARD_RESTART = "🔄 Перезапуск"
+PERSISTENT_REPLY_KEYBOARD = ReplyKeyboardMarkup(
+    [[KeyboardButton(KEYBOARD_MAIN_MENU), KeyboardButton(KEYBOARD_RESTART)]],
+    resize_keyboard=True,
+    is_persistent=True,
+)
+
+# --- Главное меню: новый пользователь, заполненный профиль, администратор ---
+
+_MAIN_MENU_FILLED_ROWS = (
+    # Порядок: 1. Мой профиль, 2. Настройка уведомлений, 3. Обновить дату цикла, 4. Объяснение фаз, 5. Заполнить заново
+    (("👤 Мой профиль", "profile"),),
+    (("🔔 Настройка уведомлений", "notification_settings"),),
+    (("📆 Обновить дату цикла / цикл закончился раньше", "update_cycle_choice"),),
+    (("📚 Объяснение фаз цикла", "cycle_info"),),
+    (("🔄 Заполнить данные заново", "start_data_collection"),),
+)
+# Первое использование — только кнопка «Приступить к работе»
+MAIN_MENU_NEW = _keyboard((("🚀 Приступить к работе", "start_data_collection"),))
+MAIN_MENU_FILLED = _keyboard(*_MAIN_MENU_FILLED_ROWS)
+MAIN_MENU_ADMIN = _keyboard(
+    *_MAIN_MENU_FILLED_ROWS,
+    (("🧪 Тест: отчёт по текущей фазе", "admin_test_daily"), ("🧪 Тест: приближение фазы", "admin_test_phase")),
+    (("🧪 Тест: завершение цикла", "admin_test_cycle"),),
+)
+
+WELCOME_TEXT = (
+    "👋 Привет! Добро пожаловать в бот для отслеживания менструального цикла.\n\n"
+    "Этот бот создан специально для мужчин, которые хотят лучше понимать и поддерживать "
+    "свою девушку в разные периоды её цикла. 💕\n\n"
+    "Бот поможет вам:\n"
+    "📊 Отслеживать текущую фазу цикла\n"
+    "🔔 Получать отчёты при смене фазы и подфазы\n"
+    "💡 Получать рекомендации, как лучше поддержать партнершу\n"
+    "📚 Изучать информацию о фазах цикла\n\n"
+    "Помните: ваша забота и внимание - это проявление любви и уважения! ❤️"
+)
+WELCOME_NEW = Screen(WELCOME_TEXT, MAIN_MENU_NEW)
+WELCOME_FILLED = Screen(WELCOME_TEXT, MAIN_MENU_FILLED)
+WELCOME_ADMIN = Screen(WELCOME_TEXT, MAIN_MENU_ADMIN)
+
+PERSISTENT_KEYBOARD_HINT = Screen("💡 Кнопки ниже доступны всегда для быстрого доступа.", PERSISTENT_REPLY_KEYBOARD)
+
+# --- Общие клавиатуры ---
+
+BACK_TO_MAIN = _keyboard((("🔙 Назад", "back_to_main"),))
+MAIN_MENU_BUTTON = _keyboard((("🏠 Главное меню", "back_to_main"),))
+BACK_TO_SETTINGS = _keyboard((("🔙 Назад в настройки", "notification_settings"),))
+# Напоминание о завершении цикла (в ответах и в outbox — JSON сериализуется один раз)
+CYCLE_END_KEYBOARD = _keyboard(
+    (("📆 Обновить дату цикла / цикл закончился раньше", "update_cycle_choice"),),
+    (("⏳ Цикл не завершился вовремя", "cycle_not_ended_on_time"),),
+    (("🔙 Главное меню", "back_to_main"),),
+)
+CYCLE_END_KEYBOARD_JSON = CYCLE_END_KEYBOARD.to_json()
+
+# --- Экраны главного меню ---
+
+MAIN_MENU_TITLE = "👋 Главное меню"
+
+REFILL_CONFIRM = Screen(
+    "⚠️ **Вы уверены?**\n\n"
+    "При перезаполнении все данные по предыдущим циклам и вашему профилю будут удалены из базы. "
+    "Это действие нельзя отменить.\n\n"
+    "Продолжить?",
+    _keyboard(
+        (("✅ Да, перезаполнить", "confirm_refill_data"),),
+        (("❌ Отмена", "cancel_refill_data"),),
+    ),
+    "Markdown",
+)
+
+UPDATE_CYCLE_CHOICE = Screen(
+    "📆 **Обновить дату цикла**\n\n"
+    "Выберите вариант:\n\n"
+    "• **Цикл закончился раньше** — сначала укажете дату окончания текущего цикла, затем дату начала нового.\n\n"
+    "• **Цикл завершился вовремя** — укажете только дату начала нового цикла.",
+    _keyboard(
+        (("⏪ Цикл закончился раньше", "cycle_ended_earlier"),),
+        (("📆 Обновить дату начала цикла", "update_cycle_date"),),
+        (("🔙 Назад", "back_to_main"),),
+    ),
+    "Markdown",
+)
+
+# Только текст: клавиатура — главное меню пользователя (подставляется в bot.py)
+FILL_LATER_TEXT = (
+    "✅ Отлично, возвращайтесь скорее! 💕\n\n"
+    "Когда будете готовы, просто нажмите кнопку '🔄 Заполнить данные заново' в главном меню."
+)
+
+DATA_COLLECTION_INTRO = Screen(
+    "📝 Для работы бота необходимо собрать некоторые данные.\n\n"
+    "💡 **Важно:** Не бойтесь спрашивать у своей девушки! "
+    "Её это только порадует, что вы настолько вовлечены в отношения и заботитесь о ней. "
+    "Это показывает вашу зрелость и внимание к её состоянию. ❤️\n\n"
+    "📋 **Необходимые данные:**\n\n"
+    "1️⃣ Ваше имя\n"
+    "2️⃣ Имя вашей девушки\n"
+    "3️⃣ Длительность цикла (обычно 21-35 дней, среднее 28)\n"
+    "4️⃣ Длительность менструации (обычно 3-7 дней)\n"
+    "5️⃣ Дата начала последней менструации (формат: ДД.ММ.ГГГГ)\n"
+    "6️⃣ Ваш часовой пояс (например: +3, -1, 0 относительно МСК)\n"
+    "7️⃣ Время для уведомлений (формат: ЧЧ:ММ, например 09:00)\n\n"
+    "Вы можете заполнить все данные сейчас или взять паузу, чтобы собрать информацию.\n\n"
+    "Начнем?",
+    _keyboard(
+        (("✅ Начать заполнение", "start_filling"),),
+        (("⏸️ Заполнить позже", "fill_later"),),
+    ),
+    "Markdown",
+)
+
+UPDATE_CYCLE_DATE = Screen(
+    "📆 **Обновление даты начала нового цикла**\n\n"
+    "💡 **ВАЖНО:** Обязательно уточните у своей девушки, началась ли у неё менструация. "
+    "Не обновляйте дату, если менструация еще не началась!\n\n"
+    "Введите дату начала нового цикла (формат: ДД.ММ.ГГГГ, например: 25.01.2026):",
+    BACK_TO_MAIN,
+    "Markdown",
+)
+
+CYCLE_ENDED_EARLIER = Screen(
+    "⏪ **Цикл закончился раньше**\n\n"
+    "Введите дату окончания текущего цикла (формат ДД.ММ.ГГГГ, например: 10.02.2026).\n\n"
+    "Эта дата будет записана в текущий цикл в истории.",
+    BACK_TO_MAIN,
+    "Markdown",
+)
+
+# --- Справочник: фазы и термины ---
+
+CYCLE_INFO = Screen(
+    "📚 **Справочник фаз менструального цикла**\n\n"
+    "Здесь вы можете узнать подробную информацию о каждой фазе цикла, "
+    "симптомах, поведении и рекомендациях по поддержке вашей девушки.\n\n"
+    "Выберите, что вас интересует:",
+    _keyboard(
+        (("🩸 Менструальная фаза", "phase_info_menstrual"),),
+        (("🌱 Фолликулярная фаза", "phase_info_follicular"),),
+        (("💫 Овуляция", "phase_info_ovulation"),),
+        (("🌙 Лютеиновая фаза (ПМС)", "phase_info_luteal"),),
+        (("🔙 Назад", "back_to_main"),),
+    ),
+    "Markdown",
+)
+
+# Клавиатуры экрана фазы/подфазы (текст берётся из справочника фаз, он перезагружается)
+PHASES_WITH_SUBPHASES = ("menstrual", "follicular", "luteal")
+_BACK_TO_PHASES = (("🔙 Назад к фазам", "cycle_info"),)
+PHASE_DETAILS_KEYBOARDS = {}
+for _phase in PHASES_WITH_SUBPHASES + ("ovulation",):
+    if _phase in PHASES_WITH_SUBPHASES:
+        # Кнопки подфаз только для фаз с подфазами (не Овуляция)
+        PHASE_DETAILS_KEYBOARDS[(_phase, None)] = _keyboard(
+            (
+                ("Начало", f"phase_subphase_{_phase}_early"),
+                ("Середина", f"phase_subphase_{_phase}_mid"),
+                ("Конец", f"phase_subphase_{_phase}_late"),
+            ),
+            _BACK_TO_PHASES,
+        )
+    else:
+        PHASE_DETAILS_KEYBOARDS[(_phase, None)] = _keyboard(_BACK_TO_PHASES)
+    for _stage in ("early", "mid", "late"):
+        PHASE_DETAILS_KEYBOARDS[(_phase, _stage)] = _keyboard(
+            (("🔙 Назад к фазе", f"phase_info_{_phase}"),), _BACK_TO_PHASES,
+        )
+
+TERMS_LIST = Screen(
+    "📖 **Ключевые термины**\n\n"
+    "Выберите термин для получения подробной информации:",
+    _keyboard(
+        (("🩸 Менструация", "term_info_menstruation"),),
+        (("💫 Овуляция", "term_info_ovulation"),),
+        (("🌙 ПМС", "term_info_pms"),),
+        (("📅 Цикл", "term_info_cycle"),),
+        (("🔙 Назад", "cycle_info"),),
+    ),
+    "Markdown",
+)
+
+_BACK_TO_TERMS = _keyboard((("🔙 Назад к терминам", "terms_list"),))
+TERMS = {
+    "menstruation": Screen(
+        "🩸 **Менструация**\n\n"
+        "Менструация - это ежемесячное кровотечение, которое происходит, "
+        "когда организм избавляется от неоплодотворенной яйцеклетки и эндометрия "
+        "(слизистой оболочки матки). Обычно длится 3-7 дней.\n\n"
+        "В этот период женщина может испытывать слабость, боли, усталость.",
+        _BACK_TO_TERMS,
+        "Markdown",
+    ),
+    "ovulation": Screen(
+        "💫 **Овуляция**\n\n"
+        "Овуляция - это процесс выхода зрелой яйцеклетки из фолликула яичника. "
+        "Обычно происходит на 14 день цикла (при 28-дневном цикле). "
+        "Это период максимальной фертильности.\n\n"
+        "Во время овуляции женщина чувствует прилив сил, повышение либидо, "
+        "уверенность в себе.",
+        _BACK_TO_TERMS,
+        "Markdown",
+    ),
+    "pms": Screen(
+        "🌙 **ПМС (Предменструальный синдром)**\n\n"
+        "ПМС - это комплекс симптомов, которые возникают за несколько дней "
+        "до начала менструации (обычно за 1-2 недели).\n\n"
+        "Симптомы включают:\n"
+        "• Перепады настроения\n"
+        "• Раздражительность\n"
+        "• Усталость\n"
+        "• Отеки\n"
+        "• Изменения аппетита\n"
+        "• Вздутие живота\n\n"
+        "Это нормальная часть цикла, требующая понимания и поддержки.",
+        _BACK_TO_TERMS,
+        "Markdown",
+    ),
+    "cycle": Screen(
+        "📅 **Менструальный цикл**\n\n"
+        "Менструальный цикл - это регулярные изменения в организме женщины, "
+        "подготовка к возможной беременности. Обычно длится 21-35 дней "
+        "(в среднем 28 дней).\n\n"
+        "Цикл состоит из четырех фаз:\n"
+        "1. Менструальная (дни 1-7)\n"
+        "2. Фолликулярная (дни 7-14)\n"
+        "3. Овуляция (день 14)\n"
+        "4. Лютеиновая (дни 15-28)\n\n"
+        "Каждая фаза имеет свои особенности и требует разного подхода.",
+        _BACK_TO_TERMS,
+        "Markdown",
+    ),
+}
+TERM_NOT_FOUND = Screen("Термин не найден", _BACK_TO_TERMS, "Markdown")
@@ -0,0 +1,33 @@
+"""
+Общие фикстуры тестов.
+
+Модули бота читают DATABASE_URL и BOT_TOKEN при импорте (config.py) и сразу создают движок БД, поэтому
+импортируются только через фикстуру project, после подготовки окружения: сбор тестов базу не создаёт.
+
+Запуск:
+    python -m pytest -q tests
+"""
+import importlib
+import os
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="session")
+def project(tmp_path_factory):
+    """Импорт модулей проекта в окружении с временной SQLite-базой (одна на сессию): project("bot")."""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.syspath_prepend(ROOT)
+        patch.setenv("DATABASE_URL", f"sqlite:///{tmp_path_factory.mktemp('db') / 'test.db'}")
+        patch.setenv("BOT_TOKEN", "0:test")
+        yield importlib.import_module
+
+
+@pytest.fixture
+def db(project):
+    """Модуль database с пустой базой актуальной схемы (таблицы пересоздаются перед каждым тестом)."""
+    database = project("database")
+    database.Base.metadata.drop_all(database.engine)
+    database.init_db()
+    return database
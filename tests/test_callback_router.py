@@ -0,0 +1,141 @@
+"""
+Таблица маршрутов кнопок (CallbackRouter) и обработчики кнопок без пользователя в БД.
+"""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+
+class StubQuery:
+    """Нажатие кнопки: callback_data и ответы бота."""
+
+    def __init__(self, data: str, user_id: int = 1):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id)
+        self.answers = []
+        self.replies = []
+        self.message = SimpleNamespace(reply_text=self._reply_text)
+
+    async def answer(self, text=None, **kwargs):
+        self.answers.append(text)
+
+    async def _reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+class StubSession:
+    def __init__(self):
+        self.closed = False
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def callback_router(project):
+    return project("callback_router")
+
+
+def make_router(callback_router, users=None):
+    """Роутер с заглушками сессии и загрузки пользователя; sessions — открытые сессии."""
+    sessions = []
+
+    def session_factory():
+        session = StubSession()
+        sessions.append(session)
+        return session
+
+    async def load_user(session, user_id):
+        return (users or {}).get(user_id)
+
+    return callback_router.CallbackRouter(session_factory, load_user), sessions
+
+
+def test_add_expands_pattern_parameters(callback_router):
+    router, _ = make_router(callback_router)
+
+    async def handler(query, **params):
+        pass
+
+    router.add("phase_{phase}_{stage}", handler, needs_user=False, phase=("luteal", "follicular"), stage=("early", "late"))
+
+    route = router.resolve("phase_follicular_late")
+    assert (route.pattern, route.handler, route.needs_user) == ("phase_{phase}_{stage}", handler, False)
+    assert route.params == {"phase": "follicular", "stage": "late"}
+    assert len([data for data in ("phase_luteal_early", "phase_luteal_late", "phase_follicular_early")
+                if router.resolve(data)]) == 3
+    assert router.resolve("phase_ovulation_early") is None
+    assert list(router.stats) == ["phase_{phase}_{stage}"]
+
+
+def test_add_rejects_duplicate_data_and_missing_choices(callback_router):
+    router, _ = make_router(callback_router)
+
+    async def handler(query, **params):
+        pass
+
+    router.add("term_info_{term}", handler, needs_user=False, term=("pms", "cycle"))
+    with pytest.raises(ValueError):
+        router.add("term_info_pms", handler, needs_user=False)
+    with pytest.raises(ValueError):
+        router.add("phase_{phase}", handler, needs_user=False)
+    with pytest.raises(ValueError):
+        router.add("profile", handler, extra=("x",))
+
+
+def test_dispatch_without_user_does_not_open_session(callback_router):
+    router, sessions = make_router(callback_router)
+    calls = []
+
+    async def show_term(query, term):
+        calls.append((query.data, term))
+
+    router.add("term_info_{term}", show_term, needs_user=False, term=("pms",))
+    query = StubQuery("term_info_pms")
+
+    assert asyncio.run(router.dispatch(query)) is True
+    assert calls == [("term_info_pms", "pms")]
+    assert sessions == []
+    assert router.stats["term_info_{term}"].calls == 1
+
+
+def test_dispatch_with_user_loads_user_and_closes_session(callback_router):
+    user = SimpleNamespace(id=1)
+    router, sessions = make_router(callback_router, users={1: user})
+    calls = []
+
+    async def show_profile(query, user, session):
+        calls.append((user, session))
+
+    router.add("profile", show_profile)
+
+    assert asyncio.run(router.dispatch(StubQuery("profile"))) is True
+    assert calls == [(user, sessions[0])]
+    assert sessions[0].closed
+
+
+def test_dispatch_counts_errors_and_unmatched(callback_router):
+    router, sessions = make_router(callback_router)
+
+    async def broken(query, user, session):
+        raise RuntimeError("boom")
+
+    router.add("broken", broken)
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(router.dispatch(StubQuery("broken")))
+    assert sessions[0].closed
+    assert (router.stats["broken"].calls, router.stats["broken"].errors) == (1, 1)
+    assert asyncio.run(router.dispatch(StubQuery("unknown"))) is False
+    assert router.unmatched == 1
+
+
+def test_extend_cycle_without_user_answers_not_found(project, db):
+    bot = project("bot")
+    query = StubQuery("cycle_not_ended_on_time", user_id=404)
+
+    asyncio.run(bot.extend_cycle(query, None, StubSession()))
+
+    assert query.answers == ["Ошибка: пользователь не найден."]
+    assert query.replies == []
@@ -0,0 +1,110 @@
+"""
+Расчёт цикла в cycle_calculator.py: упаковка истории циклов, поиск фазы по дате и прогноз на несколько циклов.
+"""
+from datetime import date, timedelta
+from itertools import islice, takewhile
+
+import pytest
+
+CYCLE_START = date(2026, 2, 27)
+# (длина цикла, менструация, с какой даты прогноз): с начала цикла, с середины, до last_period_start
+FORECAST_CASES = [
+    (28, 5, CYCLE_START),
+    (21, 1, CYCLE_START + timedelta(days=10)),
+    (35, 10, CYCLE_START + timedelta(days=34)),
+    (30, 4, CYCLE_START - timedelta(days=45)),
+]
+
+
+@pytest.fixture
+def calculator(project):
+    return project("cycle_calculator")
+
+
+def test_encode_decode_round_trip(calculator):
+    for cycle_length in range(21, 36):
+        for period_length in range(1, 11):
+            cycle_data = calculator.calculate_menstrual_cycle(cycle_length, period_length, CYCLE_START)
+            packed = calculator.encode_cycle_data(cycle_data, CYCLE_START)
+            assert packed is not None, (cycle_length, period_length)
+
+            decoded = calculator.decode_cycle_data(packed, CYCLE_START)
+            # Индекс boundaries не распаковывается — он строится при первом поиске по дате
+            assert decoded == {key: value for key, value in cycle_data.items() if key != "boundaries"}
+            for day in range(-1, cycle_length + 2):
+                target = CYCLE_START + timedelta(days=day)
+                assert calculator.get_phase_and_stage_for_date(decoded, target) == \
+                    calculator.get_phase_and_stage_for_date(cycle_data, target)
+                assert calculator.get_phase_subphase_starts_on_date(decoded, target) == \
+                    calculator.get_phase_subphase_starts_on_date(cycle_data, target)
+            assert decoded["boundaries"] == cycle_data["boundaries"]
+
+
+def test_non_standard_cycle_data_is_not_packed(calculator):
+    cycle_data = calculator.calculate_menstrual_cycle(28, 5, CYCLE_START)
+    cycle_data["phases"][2]["note"] = "Другая заметка"
+
+    assert calculator.encode_cycle_data(cycle_data, CYCLE_START) is None
+    assert calculator.encode_cycle_data({"custom": True}, CYCLE_START) is None
+
+
+def forecast_cycle_start(last_period_start: date, cycle_length: int, target: date) -> date:
+    """Начало цикла, в который попадает target, при циклах по cycle_length дней от last_period_start."""
+    return last_period_start + timedelta(days=(target - last_period_start).days // cycle_length * cycle_length)
+
+
+@pytest.mark.parametrize("cycle_length,period_length,from_date", FORECAST_CASES)
+def test_forecast_cycles_match_calculated_cycles(calculator, cycle_length, period_length, from_date):
+    first_start = forecast_cycle_start(CYCLE_START, cycle_length, from_date)
+    forecast = list(islice(calculator.forecast_cycles(CYCLE_START, cycle_length, period_length, from_date), 6))
+
+    assert forecast[0].start <= from_date <= forecast[0].end
+    for number, cycle in enumerate(forecast):
+        start = first_start + timedelta(days=number * cycle_length)
+        info = calculator.calculate_menstrual_cycle(cycle_length, period_length, start)["cycle_info"]
+        assert cycle == calculator.CycleForecast(
+            number,
+            date.fromisoformat(info["last_menstruation_start"]),
+            start + timedelta(days=period_length - 1),
+            date.fromisoformat(info["estimated_ovulation_date"]),
+            date.fromisoformat(info["cycle_end_date"]),
+        )
+        assert calculator.get_phase_day(cycle_length, period_length, start, cycle.period_end).phase_name == "Menstrual Phase"
+        assert calculator.get_phase_day(cycle_length, period_length, start, cycle.period_end + timedelta(days=1)) \
+            .phase_name == "Follicular Phase"
+
+
+@pytest.mark.parametrize("cycle_length,period_length,from_date", FORECAST_CASES)
+def test_forecast_phase_events_match_phase_days(calculator, cycle_length, period_length, from_date):
+    until = from_date + timedelta(days=4 * cycle_length)
+    events = list(takewhile(
+        lambda event: event.date <= until,
+        calculator.forecast_phase_events(CYCLE_START, cycle_length, period_length, from_date),
+    ))
+
+    expected = []
+    calculated = {}
+    for day in range((until - from_date).days + 1):
+        target = from_date + timedelta(days=day)
+        start = forecast_cycle_start(CYCLE_START, cycle_length, target)
+        starts = calculator.get_phase_day(cycle_length, period_length, start, target).starts
+        if start not in calculated:
+            calculated[start] = calculator.calculate_menstrual_cycle(cycle_length, period_length, start)
+        assert list(starts) == calculator.get_phase_subphase_starts_on_date(calculated[start], target)
+        expected.extend(calculator.PhaseEvent(target, phase_name, stage) for phase_name, stage in starts)
+    assert events == expected
+    assert len(calculated) >= 4
+
+
+def test_forecasts_are_lazy(calculator):
+    # Генераторы бесконечны: далёкий цикл берётся через islice без расчёта всего прогноза заранее
+    cycles = calculator.forecast_cycles(CYCLE_START, 28, 5)
+    (far,) = islice(cycles, 10_000, 10_001)
+    assert (far.number, far.start) == (10_000, CYCLE_START + timedelta(days=10_000 * 28))
+    assert next(cycles).number == 10_001
+
+    events = calculator.forecast_phase_events(CYCLE_START, 28, 5, CYCLE_START)
+    per_cycle = sum(1 for event in takewhile(lambda event: event.date < CYCLE_START + timedelta(days=28), events))
+    (event,) = islice(calculator.forecast_phase_events(CYCLE_START, 28, 5, CYCLE_START), 1000 * per_cycle, 1000 * per_cycle + 1)
+    assert event.date == CYCLE_START + timedelta(days=1000 * 28)
+    assert (event.phase_name, event.stage) == ("Menstrual Phase", "early")
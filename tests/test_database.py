@@ -0,0 +1,127 @@
+"""
+Вспомогательные функции database.py.
+"""
+import random
+import threading
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import select, text
+
+
+def run_in_other_thread(db):
+    def query():
+        session = db.SessionLocal()
+        try:
+            session.execute(text("SELECT 1"))
+        finally:
+            session.close()
+    worker = threading.Thread(target=query)
+    worker.start()
+    worker.join()
+
+
+def test_query_counter_counts_only_its_session(db):
+    session = db.SessionLocal()
+    other = db.SessionLocal()
+    try:
+        with db.QueryCounter(session) as queries:
+            session.execute(text("SELECT 1"))
+            # Запросы другой сессии и другого потока к тому же движку не считаются
+            other.execute(select(db.User.id)).all()
+            run_in_other_thread(db)
+            session.commit()
+            # После commit сессия берёт новое соединение — его запросы тоже считаются
+            session.execute(select(db.User.id)).all()
+        session.execute(text("SELECT 1"))
+        assert queries.count == 2
+    finally:
+        session.close()
+        other.close()
+
+
+def recomputed_stats(lengths: list, alpha: float) -> tuple:
+    """(число, среднее, сумма квадратов отклонений, EWMA) заново по всей истории длительностей."""
+    mean = sum(lengths) / len(lengths)
+    ewma = lengths[0]
+    for length in lengths[1:]:
+        ewma = alpha * length + (1 - alpha) * ewma
+    return len(lengths), mean, sum((length - mean) ** 2 for length in lengths), ewma
+
+
+def assert_matches_history(stats, lengths: list, alpha: float):
+    count, mean, m2, ewma = recomputed_stats(lengths, alpha)
+    assert stats.count == count
+    assert stats.mean == pytest.approx(mean)
+    assert stats.m2 == pytest.approx(m2, abs=1e-6)
+    assert stats.ewma == pytest.approx(ewma)
+
+
+def test_incremental_stats_match_full_history(db):
+    alpha = db.config.CYCLE_LENGTH_EWMA_ALPHA
+    rng = random.Random(20)
+    stats = db.CycleLengthStats()
+    history = []  # (начало цикла, длительность) — как после всех изменений
+    start = date(2024, 1, 1)
+    for _ in range(300):
+        if history and rng.random() < 0.3:
+            # Повторное завершение последнего цикла (изменили дату окончания) заменяет его длительность
+            length = rng.randint(18, 40)
+            history[-1] = (history[-1][0], length)
+            stats = db.add_cycle_length(stats, history[-1][0], length)
+        else:
+            if history:
+                start = history[-1][0] + timedelta(days=history[-1][1])
+            length = rng.randint(18, 40)
+            history.append((start, length))
+            stats = db.add_cycle_length(stats, start, length)
+        assert_matches_history(stats, [length for _, length in history], alpha)
+        assert db.predicted_cycle_length(stats) == max(21, min(35, round(stats.ewma)))
+
+
+def test_replacing_the_only_cycle_and_older_cycles(db):
+    stats = db.add_cycle_length(db.CycleLengthStats(), date(2026, 1, 1), 30)
+    stats = db.add_cycle_length(stats, date(2026, 1, 1), 26)
+    assert_matches_history(stats, [26], db.config.CYCLE_LENGTH_EWMA_ALPHA)
+    # Цикл старше последнего учтённого статистику не меняет
+    assert db.add_cycle_length(stats, date(2025, 12, 1), 31) == stats
+    assert db.predicted_cycle_length(db.CycleLengthStats()) is None
+
+
+def test_history_updates_keep_stats_in_sync(db, project):
+    calculator = project("cycle_calculator")
+    session = db.SessionLocal()
+    try:
+        session.add(db.User(id=1, cycle_length=28, period_length=5))
+        session.commit()
+    finally:
+        session.close()
+
+    def save_cycle(start: date):
+        db.save_cycle_record(1, start, calculator.calculate_menstrual_cycle(28, 5, start))
+
+    def stored_stats():
+        session = db.SessionLocal()
+        try:
+            user = session.get(db.User, 1)
+            return db.cycle_stats_from_row(user), user.avg_cycle_length
+        finally:
+            session.close()
+
+    alpha = db.config.CYCLE_LENGTH_EWMA_ALPHA
+    starts = [date(2026, 1, 1), date(2026, 1, 30), date(2026, 2, 26)]
+    for start in starts:
+        save_cycle(start)
+    assert_matches_history(stored_stats()[0], [29, 27], alpha)
+
+    # «Цикл закончился раньше» завершает текущий цикл, повторное изменение даты — заменяет его длительность
+    assert db.update_cycle_record_actual_end(1, starts[-1] + timedelta(days=24))
+    assert_matches_history(stored_stats()[0], [29, 27, 25], alpha)
+    assert db.update_cycle_record_actual_end(1, starts[-1] + timedelta(days=31))
+    assert_matches_history(stored_stats()[0], [29, 27, 32], alpha)
+
+    # Новый цикл завершает предыдущий по фактической дате окончания — длительность та же, без дубля
+    save_cycle(starts[-1] + timedelta(days=35))
+    stats, avg_cycle_length = stored_stats()
+    assert_matches_history(stats, [29, 27, 32], alpha)
+    assert avg_cycle_length == round(recomputed_stats([29, 27, 32], alpha)[3])
@@ -0,0 +1,156 @@
+"""
+Обновление базы исходной схемы (до версионных миграций) через init_db(): миграции m001–m011
+заполняют новые столбцы, повторный запуск ничего не меняет.
+"""
+import json
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import Boolean, Column, Date, DateTime, ForeignKey, Integer, MetaData, String, Table, Text, select
+
+LAST_PERIOD_START = date(2026, 3, 1)
+
+
+def baseline_tables(metadata: MetaData):
+    """Таблицы в том виде, в каком они были до миграций (столбцы моделей исходной версии)."""
+    Table(
+        "users", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("username", String), Column("first_name", String), Column("last_name", String),
+        Column("created_at", DateTime),
+        Column("name", String), Column("girlfriend_name", String),
+        Column("cycle_length", Integer), Column("period_length", Integer), Column("last_period_start", Date),
+        Column("cycle_extended_days", Integer),
+        Column("notifications_enabled", Boolean), Column("notification_time", String), Column("timezone", Integer),
+        Column("notify_daily", Boolean), Column("notify_phase_start", Boolean),
+        Column("days_with_notifications", Integer), Column("last_notification_date", Date),
+        Column("last_phase_advance_date", Date), Column("pinned_message_id", Integer),
+        Column("data_collection_state", String),
+    )
+    Table(
+        "cycle_records", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("user_id", Integer, ForeignKey("users.id"), nullable=False),
+        Column("cycle_start_date", Date, nullable=False),
+        Column("cycle_data", Text, nullable=False),
+        Column("cycle_actual_end_date", Date),
+        Column("created_at", DateTime),
+    )
+    Table(
+        "cycle_phases", metadata,
+        Column("id", Integer, primary_key=True),
+        Column("name", String, nullable=False), Column("name_ru", String, nullable=False),
+        Column("start_day", Integer, nullable=False), Column("end_day", Integer, nullable=False),
+        Column("description", String), Column("symptoms", String), Column("behavior", String),
+        Column("recommendations", String),
+    )
+    return metadata
+
+
+@pytest.fixture
+def baseline_db(project):
+    """Модуль database с базой исходной схемы: пользователь с историей циклов и пользователь без данных цикла."""
+    database = project("database")
+    calculator = project("cycle_calculator")
+    # Справочник фаз в исходной базе уже заполнен (его заполняла init_db исходной версии)
+    database.Base.metadata.drop_all(database.engine)
+    database.init_db()
+    with database.engine.connect() as conn:
+        phases = [dict(row._mapping) for row in conn.execute(select(database.CyclePhase.__table__))]
+    database.Base.metadata.drop_all(database.engine)
+    metadata = baseline_tables(MetaData())
+    metadata.create_all(database.engine)
+
+    def cycle_json(start: date, cycle_length: int) -> str:
+        # В исходной версии индекс boundaries не сохранялся
+        cycle_data = calculator.calculate_menstrual_cycle(cycle_length, 5, start)
+        del cycle_data["boundaries"]
+        return json.dumps(cycle_data)
+
+    users, records = metadata.tables["users"], metadata.tables["cycle_records"]
+    with database.engine.begin() as conn:
+        conn.execute(metadata.tables["cycle_phases"].insert(), phases)
+        conn.execute(users.insert().values(
+            id=1, name="Тест", girlfriend_name="Аня", cycle_length=30, period_length=5,
+            last_period_start=LAST_PERIOD_START, cycle_extended_days=None, notifications_enabled=True,
+            notification_time="10:30", timezone=2, notify_phase_start=True, days_with_notifications=3,
+        ))
+        conn.execute(users.insert().values(id=2, name="Новый"))
+        conn.execute(records.insert(), [
+            # Завершён началом следующего цикла: 30 дней
+            dict(user_id=1, cycle_start_date=LAST_PERIOD_START - timedelta(days=58),
+                 cycle_data=cycle_json(LAST_PERIOD_START - timedelta(days=58), 30)),
+            # Закончился раньше: фактическая дата окончания, 28 дней
+            dict(user_id=1, cycle_start_date=LAST_PERIOD_START - timedelta(days=28),
+                 cycle_data=cycle_json(LAST_PERIOD_START - timedelta(days=28), 30),
+                 cycle_actual_end_date=LAST_PERIOD_START - timedelta(days=1)),
+            dict(user_id=1, cycle_start_date=LAST_PERIOD_START, cycle_data=cycle_json(LAST_PERIOD_START, 30)),
+            # Нестандартная структура — остаётся в JSON
+            dict(user_id=2, cycle_start_date=LAST_PERIOD_START, cycle_data=json.dumps({"custom": True})),
+        ])
+    return database
+
+
+def snapshot(database) -> tuple:
+    with database.engine.connect() as conn:
+        return (
+            conn.execute(select(database.User.__table__).order_by(database.User.id)).all(),
+            conn.execute(select(database.CycleRecord.__table__).order_by(database.CycleRecord.id)).all(),
+        )
+
+
+def test_baseline_schema_is_upgraded_and_backfilled(project, baseline_db):
+    database = baseline_db
+    calculator = project("cycle_calculator")
+    schedule = project("notification_schedule")
+    migrations = project("migrations")
+
+    database.init_db()
+
+    session = database.SessionLocal()
+    try:
+        applied = [version for (version,) in session.query(database.SchemaMigration.version).order_by("version")]
+        assert applied == [version for version, _, _ in migrations.MIGRATIONS]
+
+        user, new_user = session.get(database.User, 1), session.get(database.User, 2)
+        assert user.notification_minute_utc == database.compute_notification_minute_utc("10:30", 2)
+        assert new_user.notification_minute_utc == database.compute_notification_minute_utc("09:00", 0)
+        assert (user.cycle_extended_days, new_user.cycle_extended_days) == (0, 0)
+
+        # Статистика по всей истории: циклы 30 и 28 дней, прогноз — EWMA
+        assert (user.cycle_stats_count, user.cycle_stats_mean) == (2, 29.0)
+        assert user.cycle_stats_m2 == pytest.approx(2.0)
+        assert (user.cycle_stats_last_start, user.cycle_stats_last_length) == (LAST_PERIOD_START - timedelta(days=28), 28)
+        alpha = database.config.CYCLE_LENGTH_EWMA_ALPHA
+        assert user.cycle_stats_ewma == pytest.approx(alpha * 28 + (1 - alpha) * 30)
+        assert user.avg_cycle_length == 29
+        assert new_user.cycle_stats_count == 0 and new_user.avg_cycle_length is None
+
+        # График событий — по прогнозу длительности, как у планировщика
+        expected = schedule.compute_user_schedule(user, schedule.local_today(user.timezone), user.avg_cycle_length)
+        assert expected["cycle_end_date"] == LAST_PERIOD_START + timedelta(days=user.avg_cycle_length - 1)
+        assert {field: getattr(user, field) for field in expected} == expected
+        assert (new_user.next_stage_start_date, new_user.cycle_end_date) == (None, None)
+
+        records = session.query(database.CycleRecord).order_by(database.CycleRecord.id).all()
+        for record in records[:3]:
+            assert record.cycle_offsets is not None and record.cycle_data == ""
+            expected = calculator.calculate_menstrual_cycle(30, 5, record.cycle_start_date)
+            del expected["boundaries"]
+            assert record.get_cycle_data() == expected
+        assert records[3].cycle_offsets is None
+        assert records[3].get_cycle_data() == {"custom": True}
+    finally:
+        session.close()
+
+
+def test_second_run_is_a_no_op(project, baseline_db):
+    database = baseline_db
+    migrations = project("migrations")
+    database.init_db()
+    before = snapshot(database)
+
+    assert migrations.run_migrations(database.engine) == 0
+    database.init_db()
+
+    assert snapshot(database) == before
@@ -0,0 +1,235 @@
+"""
+Outbox уведомлений: повторы с задержкой, срок жизни, возврат «зависших» отправок, метка взятия в отправку
+и пауза диспетчера по RetryAfter.
+"""
+import asyncio
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import Forbidden, RetryAfter, TimedOut
+
+
+class StubBot:
+    """Заглушка Bot API: записывает отправленные сообщения; send_errors — исключения для первых вызовов."""
+
+    def __init__(self, send_errors=(), delay: float = 0.0):
+        self.sent = []
+        self.send_errors = list(send_errors)
+        self.delay = delay
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.send_errors:
+            raise self.send_errors.pop(0)
+        self.sent.append((chat_id, text))
+        return SimpleNamespace(message_id=len(self.sent))
+
+    async def pin_chat_message(self, chat_id, message_id, **kwargs):
+        return True
+
+    async def unpin_chat_message(self, chat_id, message_id, **kwargs):
+        return True
+
+
+@pytest.fixture
+def outbox(project, db):
+    return project("outbox")
+
+
+@pytest.fixture
+def dispatch(project):
+    return project("dispatch")
+
+
+def add_user(db, user_id: int):
+    session = db.SessionLocal()
+    try:
+        session.add(db.User(id=user_id, name="Тест", girlfriend_name="Тест"))
+        session.commit()
+    finally:
+        session.close()
+
+
+def add_notification(db, user_id: int, key: str, **fields) -> int:
+    session = db.SessionLocal()
+    try:
+        row = db.NotificationOutbox(user_id=user_id, kind="phase_start", idempotency_key=key, text=key, **fields)
+        session.add(row)
+        session.commit()
+        return row.id
+    finally:
+        session.close()
+
+
+def get_row(db, row_id: int):
+    session = db.SessionLocal()
+    try:
+        return session.get(db.NotificationOutbox, row_id)
+    finally:
+        session.close()
+
+
+def send_claimed(outbox, dispatch, bot, rows: list):
+    dispatcher = dispatch.NotificationDispatcher(bot, workers=4, global_rate=1000, per_chat_interval=0)
+    by_chat = {}
+    for row in rows:
+        by_chat.setdefault(row["user_id"], []).append(row)
+    jobs = [(chat_id, outbox._chat_job(dispatcher, chat_rows)) for chat_id, chat_rows in by_chat.items()]
+    return asyncio.run(dispatcher.run(jobs))
+
+
+def test_retry_delay_backoff(outbox, monkeypatch):
+    monkeypatch.setattr(outbox.config, "OUTBOX_RETRY_BASE_DELAY", 30)
+    monkeypatch.setattr(outbox.config, "OUTBOX_RETRY_MAX_DELAY", 3600)
+
+    assert [outbox.retry_delay(n).total_seconds() for n in (0, 1, 2, 3, 4)] == [30, 30, 60, 120, 240]
+    assert outbox.retry_delay(20) == timedelta(seconds=3600)
+
+
+def test_claim_and_send_marks_sent(db, outbox, dispatch):
+    add_user(db, 1)
+    row_id = add_notification(db, 1, "a")
+
+    rows = outbox.claim_due_notifications(10)
+    assert [row["id"] for row in rows] == [row_id]
+    claimed = get_row(db, row_id)
+    assert (claimed.status, claimed.attempts) == (outbox.STATUS_SENDING, 1)
+    assert outbox.claim_due_notifications(10) == []
+
+    bot = StubBot()
+    send_claimed(outbox, dispatch, bot, rows)
+
+    sent = get_row(db, row_id)
+    assert bot.sent == [(1, "a")]
+    assert (sent.status, sent.message_id, sent.last_error) == (outbox.STATUS_SENT, 1, None)
+    assert sent.sent_at is not None
+
+
+def test_transient_error_is_retried_later(db, outbox, dispatch):
+    add_user(db, 1)
+    first = add_notification(db, 1, "a")
+    second = add_notification(db, 1, "b")
+
+    started = datetime.utcnow()
+    send_claimed(outbox, dispatch, StubBot(send_errors=[TimedOut()]), outbox.claim_due_notifications(10))
+
+    failed, waiting = get_row(db, first), get_row(db, second)
+    assert (failed.status, failed.attempts) == (outbox.STATUS_PENDING, 1)
+    assert failed.next_attempt_at >= started + outbox.retry_delay(1)
+    assert failed.last_error
+    # Следующее сообщение чата ждёт вместе с неудачным, попытка ему не засчитывается
+    assert (waiting.status, waiting.attempts) == (outbox.STATUS_PENDING, 0)
+    # До истечения задержки повтора записи не забираются
+    assert outbox.claim_due_notifications(10) == []
+
+
+def test_permanent_error_and_exhausted_attempts_fail(db, outbox, dispatch, monkeypatch):
+    monkeypatch.setattr(outbox.config, "OUTBOX_MAX_ATTEMPTS", 2)
+    add_user(db, 1)
+    add_user(db, 2)
+    blocked = add_notification(db, 1, "a")
+    exhausted = add_notification(db, 2, "b", attempts=1)
+
+    bot = StubBot(send_errors=[Forbidden("bot was blocked by the user"), TimedOut()])
+    dispatcher = dispatch.NotificationDispatcher(bot, workers=1, global_rate=1000, per_chat_interval=0)
+    rows = outbox.claim_due_notifications(10)
+    asyncio.run(dispatcher.run([(row["user_id"], outbox._chat_job(dispatcher, [row])) for row in rows]))
+
+    assert get_row(db, blocked).status == outbox.STATUS_FAILED
+    assert (get_row(db, exhausted).status, get_row(db, exhausted).attempts) == (outbox.STATUS_FAILED, 2)
+
+
+def test_expired_notifications_are_not_sent(db, outbox, monkeypatch):
+    monkeypatch.setattr(outbox.config, "OUTBOX_TTL_HOURS", 24)
+    add_user(db, 1)
+    old = add_notification(db, 1, "old", created_at=datetime.utcnow() - timedelta(hours=25))
+    fresh = add_notification(db, 1, "fresh")
+
+    rows = outbox.claim_due_notifications(10)
+
+    assert [row["id"] for row in rows] == [fresh]
+    assert get_row(db, old).status == outbox.STATUS_EXPIRED
+
+
+def test_release_stale_claims(db, outbox, monkeypatch):
+    monkeypatch.setattr(outbox.config, "OUTBOX_CLAIM_TIMEOUT", 300)
+    add_user(db, 1)
+    now = datetime.utcnow()
+    stale = add_notification(db, 1, "stale", status="sending", claimed_at=now - timedelta(seconds=301))
+    live = add_notification(db, 1, "live", status="sending", claimed_at=now - timedelta(seconds=10))
+
+    assert outbox.release_stale_claims() == 1
+    assert get_row(db, stale).status == outbox.STATUS_PENDING
+    assert get_row(db, live).status == outbox.STATUS_SENDING
+
+
+def test_reclaimed_rows_are_not_sent_or_overwritten_by_previous_sender(db, outbox, dispatch, monkeypatch):
+    add_user(db, 1)
+    row_id = add_notification(db, 1, "a")
+    previous = outbox.claim_due_notifications(10)
+    # Отправка затянулась: запись вернули в очередь и забрал другой отправитель
+    monkeypatch.setattr(outbox.config, "OUTBOX_CLAIM_TIMEOUT", 0)
+    assert outbox.release_stale_claims() == 1
+    current = outbox.claim_due_notifications(10)
+
+    bot = StubBot()
+    send_claimed(outbox, dispatch, bot, previous)
+    assert bot.sent == []
+    outbox.record_results([{**previous[0], "status": outbox.STATUS_SENT, "message_id": 99}])
+    assert get_row(db, row_id).status == outbox.STATUS_SENDING
+
+    send_claimed(outbox, dispatch, bot, current)
+    assert bot.sent == [(1, "a")]
+    assert (get_row(db, row_id).status, get_row(db, row_id).message_id) == (outbox.STATUS_SENT, 1)
+
+
+def test_overlapping_drains_send_each_notification_once(db, outbox, monkeypatch):
+    # Без ожидания: любая вторая отправка сразу вернула бы в очередь записи первой
+    monkeypatch.setattr(outbox.config, "OUTBOX_CLAIM_TIMEOUT", 0)
+    for user_id in (1, 2, 3):
+        add_user(db, user_id)
+        add_notification(db, user_id, f"n{user_id}")
+    context = SimpleNamespace(bot=StubBot(delay=0.05))
+
+    async def tick_during_poll():
+        # Отправка по тику начинается, пока периодическая ещё рассылает взятые записи
+        async def tick():
+            await asyncio.sleep(0.02)
+            await outbox.drain_outbox(context)
+        await asyncio.gather(outbox.drain_outbox(context), tick())
+
+    asyncio.run(tick_during_poll())
+
+    assert sorted(context.bot.sent) == [(1, "n1"), (2, "n2"), (3, "n3")]
+
+
+def test_dispatcher_pauses_on_retry_after_and_retries(dispatch):
+    bot = StubBot(send_errors=[RetryAfter(0.2)])
+    dispatcher = dispatch.NotificationDispatcher(bot, workers=2, global_rate=1000, per_chat_interval=0)
+    sent_at = {}
+
+    def job(chat_id):
+        async def send():
+            await dispatcher.send_message(chat_id, text=str(chat_id))
+            sent_at[chat_id] = time.monotonic()
+        return chat_id, send
+
+    started = time.monotonic()
+    stats = asyncio.run(dispatcher.run([job(1), job(2)]))
+
+    assert sorted(bot.sent) == [(1, "1"), (2, "2")]
+    assert (stats.retries, stats.messages_sent, stats.failed_jobs) == (1, 2, 0)
+    # Повтор — только после паузы, которую назвал Telegram
+    assert max(sent_at.values()) - started >= 0.2
+
+
+def test_dispatcher_gives_up_after_max_retries(dispatch):
+    bot = StubBot(send_errors=[RetryAfter(0.01)] * 3)
+    dispatcher = dispatch.NotificationDispatcher(bot, workers=1, global_rate=1000, per_chat_interval=0, max_retries=2)
+
+    with pytest.raises(RetryAfter):
+        asyncio.run(dispatcher.send_message(1, text="x"))
+    assert bot.sent == []
@@ -0,0 +1,90 @@
+"""
+Отчёт о начале фазы строится на местную дату события из окна тика, а не на дату сервера.
+"""
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+import pytz
+
+CYCLE_LENGTH = 28
+PERIOD_LENGTH = 5
+# Дата сервера в тестах фиксирована: результат не зависит от того, когда запущены тесты
+SERVER_TODAY = date(2026, 3, 10)
+
+
+@pytest.fixture
+def bot(project, db):
+    return project("bot")
+
+
+@pytest.fixture
+def calculator(project):
+    return project("cycle_calculator")
+
+
+def make_user(last_period_start: date, timezone: int, minute_utc: int):
+    return SimpleNamespace(
+        id=1, girlfriend_name="Аня", cycle_length=CYCLE_LENGTH, avg_cycle_length=None, period_length=PERIOD_LENGTH,
+        last_period_start=last_period_start, cycle_extended_days=0, timezone=timezone,
+        notification_minute_utc=minute_utc, notify_phase_start=False, last_notification_date=None,
+        last_phase_advance_date=None, days_with_notifications=0,
+    )
+
+
+def phase_start_offset(calculator, event_date: date) -> int:
+    """Сколько дней назад должен начаться цикл, чтобы event_date был днём начала фазы/подфазы (не первым днём)."""
+    for days_ago in range(1, CYCLE_LENGTH):
+        last_period_start = event_date - timedelta(days=days_ago)
+        if calculator.get_phase_day(CYCLE_LENGTH, PERIOD_LENGTH, last_period_start, event_date).starts:
+            return days_ago
+    raise AssertionError("в каталоге фаз нет начала фазы после первого дня")
+
+
+def plan_phase_start(bot, user, start: datetime, length: timedelta) -> tuple:
+    """Уведомления о начале фазы за окно тика [start, start + length)."""
+    due_date, advance_date = bot._user_event_dates(user, bot.TickWindow(start, start + length))
+    due_day = bot._classify_chunk([user], [CYCLE_LENGTH], [due_date])[0]
+    _, items = bot._plan_user_notifications(user, CYCLE_LENGTH, due_date, due_day, None, None)
+    return due_date, [item for item in items if item["kind"] == "phase_start"]
+
+
+def assert_report_for(bot, calculator, item: dict, user, event_date: date):
+    snapshot = calculator.CycleSnapshot.at(user.last_period_start, CYCLE_LENGTH, PERIOD_LENGTH, event_date)
+    assert f"Текущий день: {snapshot.current_day} из {CYCLE_LENGTH}" in item["text"]
+    assert bot.format_date_russian(snapshot.next_period) in item["text"]
+    assert str(event_date) in item["idempotency_key"]
+    # Отчёт на дату сервера дал бы другой день цикла
+    server_snapshot = calculator.CycleSnapshot.at(user.last_period_start, CYCLE_LENGTH, PERIOD_LENGTH, SERVER_TODAY)
+    server_day = server_snapshot.current_day
+    assert f"Текущий день: {server_day} из" not in item["text"]
+
+
+def test_user_ahead_of_server_date(bot, calculator):
+    """Пользователь в МСК+6 (UTC+9): в 20:00 UTC у него уже 05:00 следующего дня."""
+    event_date = SERVER_TODAY + timedelta(days=1)
+    last_period_start = event_date - timedelta(days=phase_start_offset(calculator, event_date))
+    user = make_user(last_period_start, timezone=6, minute_utc=20 * 60)
+    start = datetime(SERVER_TODAY.year, SERVER_TODAY.month, SERVER_TODAY.day, 20, 0, tzinfo=pytz.utc)
+
+    due_date, items = plan_phase_start(bot, user, start, timedelta(minutes=1))
+
+    assert due_date == event_date
+    assert items
+    for item in items:
+        assert_report_for(bot, calculator, item, user, event_date)
+
+
+def test_catch_up_window_uses_window_date(bot, calculator):
+    """Окно догоняет пропущенную вчерашнюю минуту отчёта: текст — на вчерашнюю дату."""
+    event_date = SERVER_TODAY - timedelta(days=1)
+    last_period_start = event_date - timedelta(days=phase_start_offset(calculator, event_date))
+    user = make_user(last_period_start, timezone=0, minute_utc=6 * 60)
+    start = datetime(event_date.year, event_date.month, event_date.day, 5, 0, tzinfo=pytz.utc)
+
+    due_date, items = plan_phase_start(bot, user, start, timedelta(hours=2))
+
+    assert due_date == event_date
+    assert items
+    for item in items:
+        assert_report_for(bot, calculator, item, user, event_date)
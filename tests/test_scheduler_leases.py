@@ -0,0 +1,101 @@
+"""
+Аренды шардов планировщика между процессами (compare-and-set в scheduler_leases).
+Процессы изображаются подменой scheduler_leases.WORKER_ID.
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+
+@pytest.fixture
+def leases(project, db, monkeypatch):
+    module = project("scheduler_leases")
+    monkeypatch.setattr(module.config, "SCHEDULER_LEASE_TTL", 180)
+    return module
+
+
+def acquire_as(leases, monkeypatch, worker_id: str, shards: int) -> list:
+    monkeypatch.setattr(leases, "WORKER_ID", worker_id)
+    return leases.acquire_shards(shards)
+
+
+def expire_worker(db, worker_id: str):
+    """Процесс упал: heartbeat и аренды не продлевались дольше TTL."""
+    session = db.SessionLocal()
+    try:
+        past = datetime.utcnow() - timedelta(seconds=181)
+        session.query(db.SchedulerWorker).filter(db.SchedulerWorker.worker_id == worker_id).update(
+            {db.SchedulerWorker.heartbeat_at: past}
+        )
+        session.query(db.SchedulerLease).filter(db.SchedulerLease.owner == worker_id).update(
+            {db.SchedulerLease.expires_at: past}
+        )
+        session.commit()
+    finally:
+        session.close()
+
+
+def owners(db) -> dict:
+    session = db.SessionLocal()
+    try:
+        return {lease.shard: lease.owner for lease in session.query(db.SchedulerLease)}
+    finally:
+        session.close()
+
+
+def test_workers_share_shards_fairly(db, leases, monkeypatch):
+    assert acquire_as(leases, monkeypatch, "a", 4) == [0, 1, 2, 3]
+    # Новый процесс не отнимает живые аренды, а ждёт, пока владелец отдаст лишние
+    assert acquire_as(leases, monkeypatch, "b", 4) == []
+    assert acquire_as(leases, monkeypatch, "a", 4) == [0, 1]
+    assert acquire_as(leases, monkeypatch, "b", 4) == [2, 3]
+    assert owners(db) == {0: "a", 1: "a", 2: "b", 3: "b"}
+    # Следующие тики ничего не меняют
+    assert acquire_as(leases, monkeypatch, "a", 4) == [0, 1]
+    assert acquire_as(leases, monkeypatch, "b", 4) == [2, 3]
+
+
+def test_expired_leases_are_taken_over(db, leases, monkeypatch):
+    acquire_as(leases, monkeypatch, "a", 2)
+    assert acquire_as(leases, monkeypatch, "b", 2) == []
+
+    expire_worker(db, "a")
+
+    assert acquire_as(leases, monkeypatch, "b", 2) == [0, 1]
+    assert owners(db) == {0: "b", 1: "b"}
+
+
+def test_renew_fails_after_takeover(db, leases, monkeypatch):
+    acquire_as(leases, monkeypatch, "a", 1)
+    expire_worker(db, "a")
+    acquire_as(leases, monkeypatch, "b", 1)
+
+    monkeypatch.setattr(leases, "WORKER_ID", "a")
+    session = db.SessionLocal()
+    try:
+        assert leases.renew_lease(session, 0) is False
+        session.rollback()
+    finally:
+        session.close()
+    # Прежний владелец не возвращает шард и на следующем тике
+    assert acquire_as(leases, monkeypatch, "a", 1) == []
+    assert owners(db) == {0: "b"}
+
+    monkeypatch.setattr(leases, "WORKER_ID", "b")
+    session = db.SessionLocal()
+    try:
+        assert leases.renew_lease(session, 0) is True
+        session.commit()
+    finally:
+        session.close()
+
+
+def test_release_all_hands_shards_over_immediately(db, leases, monkeypatch):
+    acquire_as(leases, monkeypatch, "a", 3)
+    assert acquire_as(leases, monkeypatch, "b", 3) == []
+
+    monkeypatch.setattr(leases, "WORKER_ID", "a")
+    leases.release_all()
+
+    # Без ожидания TTL: аренды свободны, а остановленный процесс не учитывается в доле
+    assert acquire_as(leases, monkeypatch, "b", 3) == [0, 1, 2]
@@ -0,0 +1,70 @@
+"""
+Обработка апдейтов PerUserUpdateProcessor: разные пользователи параллельно, один пользователь — по очереди.
+"""
+import asyncio
+import random
+
+import pytest
+from telegram import CallbackQuery, Update, User
+
+
+@pytest.fixture
+def update_processor(project):
+    return project("update_processor")
+
+
+def button_update(update_id: int, user_id: int) -> Update:
+    user = User(id=user_id, first_name="Тест", is_bot=False)
+    return Update(update_id, callback_query=CallbackQuery(str(update_id), user, chat_instance="test"))
+
+
+def process_all(processor, updates: list, handle) -> None:
+    """Передаёт апдейты процессору в порядке поступления, как Application, и ждёт завершения всех."""
+    async def run():
+        tasks = [asyncio.create_task(processor.process_update(update, handle(update))) for update in updates]
+        await asyncio.gather(*tasks)
+    asyncio.run(run())
+
+
+def test_interleaved_updates_keep_per_user_order(update_processor):
+    processor = update_processor.PerUserUpdateProcessor(4)
+    rng = random.Random(25)
+    updates = [button_update(update_id, 100 + update_id % 3) for update_id in range(30)]
+    handled = {}
+    running = set()
+    max_running = 0
+
+    async def handle(update):
+        nonlocal max_running
+        key = update.effective_user.id
+        assert key not in running  # апдейты одного пользователя не пересекаются
+        running.add(key)
+        max_running = max(max_running, len(running))
+        await asyncio.sleep(rng.uniform(0, 0.01))
+        running.discard(key)
+        handled.setdefault(key, []).append(update.update_id)
+
+    process_all(processor, updates, handle)
+
+    assert handled == {
+        key: [update.update_id for update in updates if update.effective_user.id == key] for key in (100, 101, 102)
+    }
+    assert max_running > 1  # разные пользователи обрабатывались одновременно
+    assert processor.active_keys == 0
+
+
+def test_error_does_not_drop_later_updates(update_processor):
+    processor = update_processor.PerUserUpdateProcessor(2)
+    updates = [button_update(update_id, user_id) for update_id, user_id in enumerate([1, 1, 2, 1, 2])]
+    handled = []
+
+    async def handle(update):
+        await asyncio.sleep(0)
+        if update.update_id in (0, 2):
+            raise RuntimeError("ошибка обработчика")
+        handled.append(update.update_id)
+
+    process_all(processor, updates, handle)
+
+    assert handled == [1, 3, 4]
+    assert processor.active_keys == 0
@@ -0,0 +1,77 @@
+"""
+Параллельная обработка апдейтов с сохранением порядка для каждого пользователя.
+
+Application с этим обработчиком (ApplicationBuilder.concurrent_updates) обрабатывает апдейты разных
+пользователей одновременно — не больше max_concurrent_updates сразу, — а апдейты одного пользователя строго
+по очереди, в порядке поступления: диалоги ConversationHandler (сбор данных, обновление даты цикла) видят
+сообщения в том же порядке, что и при последовательной обработке.
+"""
+import logging
+from collections import deque
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+
+def ordering_key(update: object):
+    """Ключ очереди апдейта: id пользователя (или чата); None — порядок не важен."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_user is not None:
+        return update.effective_user.id
+    if update.effective_chat is not None:
+        return update.effective_chat.id
+    return None
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Апдейты с одним ключом (ordering_key) выполняются по одному, в порядке поступления.
+
+    Если у пользователя уже обрабатывается апдейт, новый ставится в его очередь и выполняется следом в той же
+    задаче: ожидающие апдейты не занимают мест в лимите, поэтому серия нажатий одного пользователя
+    не задерживает остальных. Application вызывает process_update в порядке поступления апдейтов,
+    а семафор лимита пропускает ожидающих по очереди, так что порядок в очереди совпадает с порядком апдейтов.
+    """
+
+    __slots__ = ("_queues",)
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._queues = {}  # ключ -> deque ожидающих корутин (есть, пока у пользователя идёт обработка)
+
+    @property
+    def active_keys(self) -> int:
+        """Пользователей, у которых сейчас обрабатываются апдейты."""
+        return len(self._queues)
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        key = ordering_key(update)
+        if key is None:
+            await coroutine
+            return
+        pending = self._queues.get(key)
+        if pending is not None:
+            pending.append(coroutine)
+            return
+        pending = self._queues[key] = deque()
+        try:
+            while coroutine is not None:
+                try:
+                    await coroutine
+                except Exception as e:
+                    # Следующие апдейты пользователя всё равно обрабатываются
+                    logger.error(f"Ошибка обработки апдейта пользователя {key}: {e}")
+                coroutine = pending.popleft() if pending else None
+        finally:
+            del self._queues[key]
+            # При отмене (остановка приложения) невыполненные апдейты отбрасываются
+            for skipped in pending:
+                skipped.close()
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass